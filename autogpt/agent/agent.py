@@ -1,14 +1,20 @@
 from datetime import datetime
+from typing import Any, Callable, Optional
 
 from colorama import Fore, Style
 from autogpt.agent_manager import AgentManager
-from autogpt.api_utils import upload_log
 
 from autogpt.app import execute_command, get_command
 from autogpt.config import Config
 from autogpt.json_utils.json_fix_llm import fix_json_using_multiple_techniques
+from autogpt.json_utils.stream_parser import CommandStreamParser
 from autogpt.json_utils.utilities import LLM_DEFAULT_RESPONSE_FORMAT, validate_json
-from autogpt.llm import chat_with_ai, create_chat_completion, create_chat_message
+from autogpt.llm import (
+    ApiManager,
+    chat_with_ai,
+    create_chat_completion,
+    create_chat_message,
+)
 from autogpt.llm.token_counter import count_string_tokens
 from autogpt.log_cycle.log_cycle import (
     FULL_MESSAGE_HISTORY_FILE_NAME,
@@ -17,7 +23,9 @@ from autogpt.log_cycle.log_cycle import (
     LogCycleHandler,
 )
 from autogpt.logs import logger, print_assistant_thoughts
+from autogpt.metrics import COMMAND_SECONDS, STEP_STAGE_SECONDS
 from autogpt.prompts.generator import PromptGenerator
+from autogpt.speculation import get_speculative_commands
 from autogpt.speech import say_text
 from autogpt.spinner import Spinner
 from autogpt.utils import clean_input
@@ -77,6 +85,10 @@ class Agent:
         summary_memory = (
             "I was created."  # Initial memory necessary to avoid hallucination
         ),
+        on_event: Optional[Callable[[str, Any], None]] = None,
+        system_prompt_tokens: Optional[int] = None,
+        summary_cursor: int = 0,
+        history_offset: int = 0,
     ):
         self.cfg = cfg
         self.ai_name = ai_name
@@ -84,12 +96,14 @@ class Agent:
         self.ai_goals = ai_goals
         self.memory = memory
         self.summary_memory = summary_memory
-        self.last_memory_index = 0
+        self.summary_cursor = summary_cursor
+        self.history_offset = history_offset
         self.full_message_history = full_message_history
         self.next_action_count = next_action_count
         self.command_registry = command_registry
         self.config = config
         self.system_prompt = system_prompt
+        self.system_prompt_tokens = system_prompt_tokens
         self.triggering_prompt = triggering_prompt
         self.created_at = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.cycle_count = 0
@@ -100,6 +114,54 @@ class Agent:
         self.assistant_reply = assistant_reply
         self.agent_manager = AgentManager(cfg, agents)
         self.prompt_generator = prompt_generator
+        self.on_event = on_event
+        self.step_log = ""
+        # tokens of the agent's chat completions, for callers enforcing a cap
+        self.prompt_tokens_used = 0
+        self.completion_tokens_used = 0
+        # tokens, cost and budget of the whole session, saved with it
+        self.usage = ApiManager().usage(agent_id)
+
+    def emit(self, event: str, data: Any) -> None:
+        """Forward a step event to the listener registered by the caller, if any."""
+        if self.on_event is not None:
+            self.on_event(event, data)
+
+    @property
+    def on_token(self) -> Optional[Callable[[str], None]]:
+        """Token callback for a streamed completion, or None when nobody listens.
+        Each callback reads its reply for the command, calling on_command early.
+        """
+        if self.on_event is None and not self.cfg.speculative_execution:
+            return None
+        parser = CommandStreamParser(self.on_command)
+
+        def on_token(token: str) -> None:
+            parser.feed(token)
+            self.emit("token", token)
+
+        return on_token
+
+    def on_command(self, command_name: str, arguments: dict) -> None:
+        """Called with the command of a streamed reply as soon as it is complete,
+        to announce it and start it ahead of time if it is idempotent."""
+        self.emit("command", {"command": command_name, "arguments": arguments})
+        if (
+            self.cfg.speculative_execution
+            and command_name in self.cfg.speculative_commands
+        ):
+            get_speculative_commands().start(
+                self.agent_id,
+                command_name,
+                arguments,
+                execute_command,
+                command_registry=self.command_registry,
+                command_name=command_name,
+                prompt=self.prompt_generator,
+                agent_manager=self.agent_manager,
+                arguments=arguments,
+                cfg=self.cfg,
+            )
 
     def start_interaction_loop(self):
         # Interaction Loop
@@ -388,14 +450,32 @@ class Agent:
                     command_name, arguments = plugin.pre_command(
                         command_name, arguments
                     )
-                command_result = execute_command(
-                    command_registry=self.command_registry,
-                    command_name=command_name,
-                    prompt=self.prompt_generator,
-                    agent_manager=self.agent_manager,
-                    arguments=arguments,
-                    cfg=self.cfg,
-                )
+                speculated = None
+                if (
+                    self.cfg.speculative_execution
+                    and command_name in self.cfg.speculative_commands
+                ):
+                    # started while the reply that chose it was streamed
+                    speculated = get_speculative_commands().take(
+                        self.agent_id, command_name, arguments
+                    )
+                with COMMAND_SECONDS.time(command=command_name):
+                    if speculated is not None:
+                        try:
+                            command_result = speculated.result()
+                        except Exception as e:
+                            # run the command again, which reports its own errors
+                            logger.warn(f"Speculative {command_name} failed: {e}")
+                            speculated = None
+                    if speculated is None:
+                        command_result = execute_command(
+                            command_registry=self.command_registry,
+                            command_name=command_name,
+                            prompt=self.prompt_generator,
+                            agent_manager=self.agent_manager,
+                            arguments=arguments,
+                            cfg=self.cfg,
+                        )
                 result = f"Command {command_name} returned: " f"{command_result}"
 
                 if self.next_action_count > 0:
@@ -422,6 +502,8 @@ class Agent:
                     "SYSTEM: ", Fore.YELLOW, "Unable to execute command"
                 )
 
+            self.emit("result", result)
+
         self.assistant_reply = chat_with_ai(
             self,
             self.system_prompt,
@@ -432,9 +514,10 @@ class Agent:
             self.cfg,
         )
 
-        self.assistant_reply_json = fix_json_using_multiple_techniques(
-            self.assistant_reply, self.cfg
-        )
+        with STEP_STAGE_SECONDS.time(stage="json_repair"):
+            self.assistant_reply_json = fix_json_using_multiple_techniques(
+                self.assistant_reply, self.cfg
+            )
 
         thoughts = {}
 
@@ -453,14 +536,22 @@ class Agent:
             except Exception as e:
                 godmode_log += "Error: \n" + str(e)
 
-        # upload log
+        self.emit(
+            "thoughts",
+            {
+                "command": self.command_name,
+                "arguments": self.arguments,
+                "thoughts": thoughts,
+                "assistant_reply": self.assistant_reply,
+            },
+        )
+
+        # keep the log of this step for the caller to upload
         ai_info = f"You are {self.ai_name}, {self.ai_role}\nGOALS:\n\n"
         for i, goal in enumerate(self.ai_goals):
             ai_info += f"{i+1}. {goal}\n"
 
-        upload_log(
-            ai_info + "\n\n" + memory_to_add + "\n\n" + godmode_log, self.agent_id
-        )
+        self.step_log = ai_info + "\n\n" + memory_to_add + "\n\n" + godmode_log
 
         return (
             self.command_name,
@@ -1,19 +1,24 @@
 import datetime
+import hashlib
 from functools import wraps
 import json
 import logging
+import queue
+import threading
 import time
 import traceback
+from typing import Any, Callable, Optional
 from uuid import uuid4
-from autogpt.commands.command import CommandRegistry
 from autogpt.config.ai_config import AIConfig
 import autogpt.llm.chat as chat
 from autogpt.config import Config
 import os
 from openai.error import OpenAIError
-import firebase_admin
-from firebase_admin import auth as firebase_auth
 from autogpt.llm import create_chat_completion
+from autogpt.api_auth import VerifiedTokenCache
+from autogpt import metrics
+from autogpt.cache import LRUCache
+from autogpt.clients import logging_client
 from autogpt.api_log import (
     CRITICAL,
     ERROR,
@@ -23,6 +28,7 @@ from autogpt.api_log import (
 from autogpt.api_utils import (
     generate_task_name,
     get_file_urls,
+    upload_log,
 )
 import logging
 from autogpt.agent.agent import Agent
@@ -31,39 +37,99 @@ from autogpt.config import Config
 from autogpt.logs import logger
 from autogpt.memory import get_memory
 from autogpt.memory.pinecone import PineconeMemory
-from google.cloud import datastore, firestore, logging
 
-from autogpt.prompts.prompt import build_default_prompt_generator, construct_main_ai_config
+from autogpt.job_queue import TERMINAL_EVENTS, JobWorkerPool, get_job_queue
+from autogpt.llm.modelsinfo import COSTS
+from autogpt.step_finalizer import (
+    LOG_UPLOAD_DEADLINE,
+    SESSION_SAVE_DEADLINE,
+    TASK_NAMING_DEADLINE,
+    SideEffect,
+    StepFinalizer,
+)
+from autogpt.storage import (
+    BLOB_AGENT_PROPERTIES,
+    Session,
+    SessionConflict,
+    SessionStore,
+    decode_blob,
+)
+from autogpt.prompts.prompt_cache import get_command_registry, get_system_prompt
 
-fireclient = firestore.Client()
-client = datastore.Client()
-logging_client = logging.Client()
 
 global_config = Config()
 
+session_store = SessionStore(global_config)
+# pages of /api/sessions, keyed by user id, then by (limit, cursor)
+session_list_cache = LRUCache(
+    global_config.session_list_cache_size, global_config.session_list_cache_ttl
+)
+step_finalizer = StepFinalizer(global_config.step_finalizer_workers)
+
 START = "###start###"
 
-command_registry = CommandRegistry()
-
-command_categories = [
-    # "autogpt.commands.analyze_code",
-    # "autogpt.commands.audio_text",
-    # "autogpt.commands.execute_code",
-    # "autogpt.commands.file_operations",
-    "autogpt.commands.firestore_operations",
-    # "autogpt.commands.git_operations",
-    "autogpt.commands.google_search",
-    # "autogpt.commands.image_gen",
-    # "autogpt.commands.improve_code",
-    # "autogpt.commands.twitter",
-    # "autogpt.commands.web_selenium",
-    # "autogpt.commands.write_tests",
-    "autogpt.app",
-    "autogpt.commands.task_statuses",
-]
+# the body of the 409 returned when a session was saved concurrently
+SESSION_CONFLICT = {
+    "error": "Conflict",
+    "message": "The session was saved by another step since it was loaded."
+    " Load it again and retry.",
+}
 
 
-def new_interact(
+class HistoryOutOfSync(Exception):
+    """The client sent new messages from a history version the session isn't at.
+
+    Its delta was either already added, if the request was replayed, or was
+    built on a history missing messages added since, so the client gets back
+    what it misses and resends its messages from the session's history version.
+    """
+
+    def __init__(self, session: Session, history_version: int):
+        super().__init__(
+            f"History version {history_version} of agent {session.agent_id}"
+            f" is not {session.history_version}"
+        )
+        history_cursor, message_history_delta = session.history_since(history_version)
+        self.body = {
+            "error": "Conflict",
+            "message": "The history has changed since the version the new"
+            " messages were sent from. Add the delta and resend them.",
+            "history_version": session.history_version,
+            "history_cursor": history_cursor,
+            "message_history_delta": message_history_delta,
+        }
+
+
+def step_response(
+    command_name,
+    arguments,
+    thoughts,
+    message_history,
+    assistant_reply,
+    result,
+    task,
+    session_version=None,
+) -> dict:
+    """Build the body returned to the client for a finished step"""
+    return {
+        "command": command_name,
+        "arguments": arguments,
+        "thoughts": thoughts,
+        "message_history": message_history,
+        "assistant_reply": assistant_reply,
+        "result": result,
+        "task": task,
+        "session_version": session_version,
+    }
+
+
+TRIGGERING_PROMPT = (
+    "Determine which next command to use, and respond using the"
+    " format specified above:"
+)
+
+
+def start_session(
     cfg: Config,
     ai_config: AIConfig,
     memory: PineconeMemory,
@@ -72,70 +138,70 @@ def new_interact(
     assistant_reply: str,
     agent_id: str,
     full_message_history=[],
-):
-    key = client.key("Agent", agent_id)
-
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    session_version: Optional[int] = None,
+    history_version: Optional[int] = None,
+    new_messages: Optional[list] = None,
+) -> tuple[Session, Agent]:
+    """Load the session of an agent and build the Agent to run its next step"""
     logger.set_level("INFO")
-    # print(prompt)
-    # Initialize variables
-    next_action_count = 0
-    # Make a constant:
-    triggering_prompt = (
-        "Determine which next command to use, and respond using the"
-        " format specified above:"
-    )
-    # Initialize memory and make sure it is empty.
-    # this is particularly important for indexing and referencing pinecone memory
 
-    # limit to 100 entries
-    full_message_history = full_message_history[-100:]
-    for command_category in command_categories:
-        command_registry.import_commands(command_category)
-
-    ai_config.command_registry = command_registry
-
-    prompt_generator = build_default_prompt_generator()
-    system_prompt = ai_config.construct_full_prompt(prompt_generator)
+    command_registry = get_command_registry()
+    system_prompt, prompt_generator, system_prompt_tokens = get_system_prompt(
+        ai_config, cfg.fast_llm_model
+    )
 
-    agent = fireclient.collection("Agent").document(agent_id).get()
-    try:
-        summary = agent.get("summary") or None
-    except Exception as e:
-        summary = None
+    session = session_store.load(agent_id, version=session_version)
+    if history_version is None:
+        # the client sent its whole history
+        session.full_message_history = full_message_history
+    elif history_version != session.history_version:
+        raise HistoryOutOfSync(session, history_version)
+    else:
+        session.full_message_history.extend(new_messages or [])
 
-    # get agent.agents
-    agents = {}
-    try:
-        a = agent.get("agents") or {}
-        if type(a) == str:
-            agents = json.loads(a)
-        else:
-            agents = a
-    except Exception as e:
-        print("AGENT ERROR:", e)
-        pass
+    # limit to 100 entries
+    session.trim_history(100)
 
     agent = Agent(
         ai_name=ai_config.ai_name,
         ai_role=ai_config.ai_role,
         ai_goals=ai_config.ai_goals,
         agent_id=agent_id,
-        full_message_history=full_message_history,
+        full_message_history=session.full_message_history,
         command_name=command_name,
         arguments=arguments,
         assistant_reply=assistant_reply,
-        agents=agents,
-        triggering_prompt=triggering_prompt,
+        agents=session.agents,
+        triggering_prompt=TRIGGERING_PROMPT,
         system_prompt=system_prompt,
+        system_prompt_tokens=system_prompt_tokens,
         memory=memory,
-        next_action_count=next_action_count,
+        next_action_count=0,
         cfg=cfg,
         command_registry=command_registry,
         config=ai_config,
         prompt_generator=prompt_generator,
-        summary_memory=summary,
+        summary_memory=session.summary,
+        summary_cursor=session.summary_cursor,
+        history_offset=session.history_offset,
+        on_event=on_event,
     )
+    # another worker may have served the session since this one did
+    agent.usage.merge(session.usage)
+    agent.usage.budget = ai_config.api_budget
+    return session, agent
+
 
+def run_step(
+    cfg: Config, session: Session, agent: Agent, command_name: str, arguments: str
+) -> tuple[dict, list[SideEffect]]:
+    """Run one step of an agent and record it in its session, without saving it
+
+    Returns:
+        tuple: The response for the step, without the session fields, and the
+            side effects of the step that are still running.
+    """
     (
         command_name,
         arguments,
@@ -148,65 +214,32 @@ def new_interact(
         arguments=arguments,
     )
 
-    # generate simplified task name
-    task_name = generate_task_name(cfg, command_name, arguments)
-
-    try:
-        entity = datastore.Entity(
-            key=key,
-            exclude_from_indexes=(
-                "full_message_history",
-                "agents",
-                "assistant_reply",
-                "thoughts",
-                "arguments",
-                "command_name",
-                "tasks",
-                "ai_role",
-                "ai_goals",
-            ),
-        )
-
-        prev = client.get(key) or {}
-        tasks = prev.get("tasks", [])
-        # update the result for the last task, if it exists
-        if len(tasks) > 0:
-            lastTask: datastore.Entity = tasks[-1]
-            lastTask.update({"result": result})
+    # generate simplified task name, while the log of the step is uploaded
+    task_naming = step_finalizer.submit(
+        "task_naming",
+        TASK_NAMING_DEADLINE,
+        generate_task_name,
+        cfg,
+        command_name,
+        arguments,
+    )
+    log_upload = step_finalizer.submit(
+        "log_upload", LOG_UPLOAD_DEADLINE, upload_log, agent.step_log, agent.agent_id
+    )
 
-        task = datastore.Entity(exclude_from_indexes=("result", "arguments"))
-        task.update(
-            {
-                "command_name": command_name,
-                "arguments": json.dumps(arguments),
-                "result": None,
-                "task_name": task_name,
-                "relevant_goal": thoughts.get("relevant_goal", None),
-            }
-        )
-        tasks.append(task)
+    task_name = task_naming.wait().value
+    agent.emit("task", task_name)
 
-        entity.update(
-            {
-                "ai_name": agent.ai_name,
-                "ai_role": agent.ai_role,
-                "ai_goals": agent.ai_goals,
-                "agent_id": agent.agent_id,
-                "full_message_history": json.dumps(agent.full_message_history),
-                "command_name": agent.command_name,
-                "arguments": json.dumps(agent.arguments),
-                "assistant_reply": json.dumps(agent.assistant_reply),
-                "thoughts": json.dumps(thoughts),
-                "agents": json.dumps(agent.agent_manager.agents),
-                "tasks": tasks,
-            }
-        )
-        client.put(entity)
-    except Exception as e:
-        print_log("Datastore error", severity=WARNING, errorMsg=e, key=str(key))
-        raise e
+    session_store.record_step(
+        session,
+        result=result,
+        command_name=command_name,
+        arguments=arguments,
+        task_name=task_name,
+        relevant_goal=thoughts.get("relevant_goal", None),
+    )
 
-    return (
+    response = step_response(
         command_name,
         arguments,
         thoughts,
@@ -215,11 +248,231 @@ def new_interact(
         result,
         task_name,
     )
+    return response, [task_naming, log_upload]
+
+
+def save_session(
+    session: Session,
+    agent: Agent,
+    thoughts: dict,
+    side_effects: list[SideEffect],
+    user_id: Optional[str] = None,
+) -> Optional[int]:
+    """Save a session while waiting for the side effects of the steps before it
+
+    Returns:
+        int: The new version of the session, or None if the save is still
+            running past its deadline. It may yet go through, so it isn't
+            reported as failed, and the next step loads the session afresh.
+    """
+    session_save = step_finalizer.submit(
+        "session_save",
+        SESSION_SAVE_DEADLINE,
+        session_store.save,
+        session,
+        agent,
+        thoughts,
+        user_id=user_id,
+    )
+    results = step_finalizer.wait_all(
+        side_effects + [session_save], agent_id=agent.agent_id
+    )
+    if user_id is not None:
+        forget_session_list(user_id)
+    if results["session_save"].pending:
+        return None
+    if not results["session_save"].ok:
+        error = results["session_save"].error or TimeoutError(
+            "Saving the session timed out"
+        )
+        print_log(
+            "Datastore error", severity=WARNING, errorMsg=error, agent_id=agent.agent_id
+        )
+        raise error
+    return results["session_save"].value
+
+
+def add_session_fields(
+    response: dict,
+    session: Session,
+    session_version: int,
+    history_version: Optional[int] = None,
+) -> dict:
+    """Add the session version and history of a saved session to a response"""
+    response["session_version"] = session_version
+    response["history_version"] = session.history_version
+    if history_version is not None:
+        # only send back what the client does not have yet
+        del response["message_history"]
+        (
+            response["history_cursor"],
+            response["message_history_delta"],
+        ) = session.history_since(history_version)
+    return response
+
+
+def new_interact(
+    cfg: Config,
+    ai_config: AIConfig,
+    memory: PineconeMemory,
+    command_name: str,
+    arguments: str,
+    assistant_reply: str,
+    agent_id: str,
+    full_message_history=[],
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    user_id: Optional[str] = None,
+    session_version: Optional[int] = None,
+    history_version: Optional[int] = None,
+    new_messages: Optional[list] = None,
+):
+    session, agent = start_session(
+        cfg,
+        ai_config,
+        memory,
+        command_name,
+        arguments,
+        assistant_reply,
+        agent_id,
+        full_message_history=full_message_history,
+        on_event=on_event,
+        session_version=session_version,
+        history_version=history_version,
+        new_messages=new_messages,
+    )
+    response, side_effects = run_step(cfg, session, agent, command_name, arguments)
+    session_version = save_session(
+        session, agent, response["thoughts"], side_effects, user_id=user_id
+    )
+    return add_session_fields(response, session, session_version, history_version)
+
+
+def step_cost(agent: Agent, model: str) -> float:
+    """The estimated cost in dollars of the chat completions of an agent"""
+    costs = COSTS.get(model, COSTS["gpt-3.5-turbo"])
+    return (
+        agent.prompt_tokens_used * costs["prompt"]
+        + agent.completion_tokens_used * costs["completion"]
+    ) / 1000
+
+
+def continuous_interact(
+    cfg: Config,
+    ai_config: AIConfig,
+    memory: PineconeMemory,
+    command_name: str,
+    arguments: str,
+    assistant_reply: str,
+    agent_id: str,
+    full_message_history=[],
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    user_id: Optional[str] = None,
+    session_version: Optional[int] = None,
+    history_version: Optional[int] = None,
+    new_messages: Optional[list] = None,
+    max_steps: int = 1,
+    time_limit: float = 60.0,
+    max_tokens: Optional[int] = None,
+    max_cost: Optional[float] = None,
+    checkpoint_interval: int = 0,
+):
+    """Run up to max_steps steps of an agent in a row, as the CLI's continuous
+    mode does, loading its session once and saving it once at the end.
+
+    Args:
+        max_steps (int): The most steps to run.
+        time_limit (float): Seconds after which no new step is started. A step
+            is only started if it is expected to finish within the limit.
+        max_tokens (int, optional): Stop once the chat completions of the run
+            have used this many tokens.
+        max_cost (float, optional): Stop once the chat completions of the run
+            have cost this many dollars.
+        checkpoint_interval (int): Also save the session every this many steps,
+            so a run cut short loses less. 0 only saves at the end.
+
+    Returns:
+        dict: The response of the last step, as new_interact returns it, with
+            `steps` holding the response of every step, without their message
+            history, and `stop_reason` telling why the run stopped.
+    """
+    deadline = time.monotonic() + time_limit
+    session, agent = start_session(
+        cfg,
+        ai_config,
+        memory,
+        command_name,
+        arguments,
+        assistant_reply,
+        agent_id,
+        full_message_history=full_message_history,
+        on_event=on_event,
+        session_version=session_version,
+        history_version=history_version,
+        new_messages=new_messages,
+    )
+
+    steps: list[dict] = []
+    side_effects: list[SideEffect] = []
+    slowest_step = 0.0
+    stop_reason = "max_steps"
+    while len(steps) < max_steps:
+        step_start = time.monotonic()
+        response, step_side_effects = run_step(
+            cfg, session, agent, command_name, arguments
+        )
+        side_effects += step_side_effects
+        slowest_step = max(slowest_step, time.monotonic() - step_start)
+        command_name, arguments = response["command"], response["arguments"]
+
+        step = {k: v for k, v in response.items() if k != "message_history"}
+        steps.append(step)
+        agent.emit("step", step)
+
+        if checkpoint_interval and len(steps) % checkpoint_interval == 0:
+            session_version = save_session(
+                session, agent, response["thoughts"], side_effects, user_id=user_id
+            )
+            side_effects = []
+            agent.emit("checkpoint", {"session_version": session_version})
+
+        if command_name == "task_complete":
+            stop_reason = "task_complete"
+        elif command_name is None or command_name.lower().startswith("error"):
+            stop_reason = "invalid_command"
+        elif max_tokens is not None and (
+            agent.prompt_tokens_used + agent.completion_tokens_used >= max_tokens
+        ):
+            stop_reason = "max_tokens"
+        elif max_cost is not None and step_cost(agent, cfg.fast_llm_model) >= max_cost:
+            stop_reason = "max_cost"
+        elif time.monotonic() + slowest_step > deadline:
+            stop_reason = "time_limit"
+        else:
+            continue
+        break
+
+    if side_effects:
+        # not saved by a checkpoint after the last step
+        session_version = save_session(
+            session, agent, response["thoughts"], side_effects, user_id=user_id
+        )
+    response = add_session_fields(response, session, session_version, history_version)
+    response["steps"] = steps
+    response["stop_reason"] = stop_reason
+    response["tokens_used"] = agent.prompt_tokens_used + agent.completion_tokens_used
+    return response
 
 
 # make an api using flask
 
-from flask import Flask, jsonify, request
+from flask import (
+    Flask,
+    Response,
+    copy_current_request_context,
+    g,
+    jsonify,
+    request,
+)
 
 
 class LogRequestDurationMiddleware:
@@ -260,13 +513,34 @@ else:
 app.wsgi_app = LogRequestDurationMiddleware(app.wsgi_app)
 
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
 @app.after_request
 def after_request(response):
+    if response.status_code == 429:
+        metrics.RATE_LIMIT_HITS.inc(source="api")
+    if "request_start" in g:
+        # observed once the body is sent, which matters for streamed responses
+        start = g.request_start
+        labels = dict(
+            method=request.method,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            status=response.status_code,
+        )
+        response.call_on_close(
+            lambda: metrics.REQUEST_SECONDS.observe(
+                time.perf_counter() - start, **labels
+            )
+        )
+
     ip = get_remote_address()
     openai_key = "None"
     try:
-        if request.json is not None:
-            openai_key = request.json["openai_key"]
+        if "request_data" in g and g.request_data.get("openai_key"):
+            openai_key = g.request_data["openai_key"]
             openai_key = openai_key[:5] + "..." + openai_key[-5:]
     except Exception as e:
         pass
@@ -295,9 +569,23 @@ def health():
     return "OK"
 
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Metrics of every worker, in the Prometheus text format"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE_LATEST)
+
+
+def get_request_data() -> dict:
+    """The JSON body of the current request, parsed once for the rate limits,
+    the auth and the endpoint"""
+    if "request_data" not in g:
+        g.request_data = request.get_json(silent=True) or {}
+    return g.request_data
+
+
 def make_rate_limit(rate: str):
     def get_rate_limit():
-        request_data = request.get_json()
+        request_data = get_request_data()
         if (
             request_data.get("openai_key", None) is not None
             and len(request_data.get("openai_key", "")) > 0
@@ -309,31 +597,42 @@ def make_rate_limit(rate: str):
     return get_rate_limit
 
 
-firebase_admin.initialize_app()
+token_cache = VerifiedTokenCache(global_config.auth_token_cache_size)
+
+
+def verify_id_token():
+    """Verify the Firebase ID token of the current request, if it has one
+
+    Returns:
+        tuple: The decoded token, or None without one, and the 401 response
+            to return instead if the token doesn't verify.
+    """
+    id_token = request.headers.get("Authorization")
+    if id_token is None:
+        return None, None
+    try:
+        # Remove 'Bearer ' from the token if it's present
+        if id_token.startswith("Bearer "):
+            id_token = id_token[7:]
+        with metrics.STEP_STAGE_SECONDS.time(stage="auth"):
+            return token_cache.verify(id_token), None
+    except ValueError as e:
+        return None, (jsonify({"error": "Unauthorized", "message": str(e)}), 401)
+    except Exception as e:
+        print_log("User failed auth", severity=WARNING, errorMsg=e)
+        return None, (jsonify({"error": "Unauthorized", "message": str(e)}), 401)
 
 
 def verify_firebase_token(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        user = None
-
-        id_token = request.headers.get("Authorization")
-        if id_token is not None:
-            try:
-                # Remove 'Bearer ' from the token if it's present
-                if id_token.startswith("Bearer "):
-                    id_token = id_token[7:]
-                decoded_token = firebase_auth.verify_id_token(id_token)
-                user = decoded_token
-            except ValueError as e:
-                return jsonify({"error": "Unauthorized", "message": str(e)}), 401
-            except Exception as e:
-                print_log("User failed auth", severity=WARNING, errorMsg=e)
-                return jsonify({"error": "Unauthorized", "message": str(e)}), 401
+        user, unauthorized = verify_id_token()
+        if unauthorized is not None:
+            return unauthorized
 
         openai_key = None
         try:
-            request_data = request.get_json()
+            request_data = get_request_data()
             if (
                 request_data.get("openai_key", None) is not None
                 and len(request_data.get("openai_key", "")) > 0
@@ -365,7 +664,7 @@ def verify_firebase_token(f):
 @limiter.limit(make_rate_limit("100 per day;60 per hour;15 per minute"))
 @verify_firebase_token
 def subgoals():
-    request_data = request.get_json()
+    request_data = get_request_data()
 
     goal = request_data["goal"]
     cfg = Config()
@@ -390,6 +689,7 @@ def subgoals():
             temperature=0.2,
             max_tokens=150,
             cfg=cfg,
+            cache=True,
         )
     except Exception as e:
         if isinstance(e, OpenAIError):
@@ -405,111 +705,425 @@ def subgoals():
     )
 
 
+def prepare_step(request_data: dict, user: dict | None = None) -> dict:
+    """Build the arguments for new_interact from the body of an /api request
+
+    Args:
+        request_data (dict): The parsed body of an /api request
+        user (dict, optional): The decoded Firebase token of the caller
+
+    Returns:
+        dict: The keyword arguments to pass to new_interact
+    """
+    command_name = request_data["command"]
+    arguments = request_data["arguments"]
+    assistant_reply = request_data.get("assistant_reply", "")
+
+    ai_name = request_data["ai_name"]
+    ai_description = request_data["ai_description"]
+    ai_goals = request_data["ai_goals"]
+    message_history = request_data.get("message_history", [])
+
+    try:
+        rga = request_data.get("rga", None)
+        logger = logging_client().logger('rga-logger') 
+        extra_info = {"has_rga": rga}
+        logger.log_struct(info=extra_info, severity='INFO')
+    except Exception as e:
+        print_log("RGA logging failed", severity=WARNING, errorMsg=e)
+
+    agent_id = request_data["agent_id"]
+
+    openai_key = request_data.get("openai_key", None)
+    gpt_model = "gpt-3.5-turbo"
+    if len(openai_key or "") > 0:
+        gpt_model = request_data.get("gpt_model", "gpt-3.5-turbo")
+    else:
+        gpt_model = "gpt-3.5-turbo"
+
+    cfg = Config()
+    cfg.openai_api_key = openai_key
+    cfg.fast_llm_model = gpt_model
+    cfg.smart_llm_model = gpt_model
+    cfg.agent_id = agent_id
+
+    memory: PineconeMemory = get_memory(cfg)  # type: ignore
+
+    ai_config = AIConfig(
+        ai_name=ai_name,
+        ai_role=ai_description,
+        ai_goals=ai_goals,
+        api_budget=float(request_data.get("api_budget") or 0.0),
+    )
+
+    return dict(
+        cfg=cfg,
+        ai_config=ai_config,
+        memory=memory,
+        command_name=command_name,
+        arguments=arguments,
+        assistant_reply=assistant_reply,
+        agent_id=agent_id,
+        full_message_history=message_history,
+        user_id=user.get("user_id") if user is not None else None,
+        session_version=request_data.get("session_version", None),
+        history_version=request_data.get("history_version", None),
+        new_messages=request_data.get("new_messages", None),
+    )
+
+
+def format_sse(event: str, data, event_id: Optional[int] = None) -> str:
+    """Format a single Server-Sent Event"""
+    sse = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    if event_id is not None:
+        sse = f"id: {event_id}\n{sse}"
+    return sse
+
+
 @app.route("/api", methods=["POST"])  # type: ignore
 @limiter.limit(make_rate_limit("500 per day;200 per hour;8 per minute"))
 @verify_firebase_token
 def godmode_main():
     try:
-        request_data = request.get_json()
+        request_data = get_request_data()
 
-        command_name = request_data["command"]
-        arguments = request_data["arguments"]
-        assistant_reply = request_data.get("assistant_reply", "")
+        response = new_interact(
+            **prepare_step(request_data, getattr(request, "user", None))
+        )
+    except Exception as e:
+        if isinstance(e, OpenAIError):
+            print_log("OpenAI error", severity=WARNING, errorMsg=e)
+            # print trace
+            traceback.print_exc()
+            return e.error, 503
 
-        ai_name = request_data["ai_name"]
-        ai_description = request_data["ai_description"]
-        ai_goals = request_data["ai_goals"]
-        message_history = request_data.get("message_history", [])
+        print_log("/api error", severity=ERROR, errorMsg=e)
+        raise e
 
+    return json.dumps(response)
+
+
+def step_error_event(e: Exception, route: str, **fields) -> dict:
+    """The data of the `error` event of a step that raised e. Errors other than
+    conflicts and OpenAI's are logged and only shown to clients by their ID."""
+    if isinstance(e, SessionConflict):
+        return {"status": 409, **SESSION_CONFLICT}
+    if isinstance(e, HistoryOutOfSync):
+        return {"status": 409, **e.body}
+    if isinstance(e, OpenAIError):
+        print_log("OpenAI error", severity=WARNING, errorMsg=e, **fields)
+        return {"status": 503, "error": e.error}
+    err_uuid = str(uuid4())
+    print_log(f"{route} error", severity=ERROR, errorMsg=e, error_id=err_uuid, **fields)
+    return {"status": 500, "error": f"There was an error. Error ID: {err_uuid}"}
+
+
+def stream_events(
+    run: Callable[..., dict], step_kwargs: dict, route: str
+) -> Response:
+    """Call run with step_kwargs on a thread, streaming the events it emits
+    as Server-Sent Events, then `done` with what it returns or `error`."""
+    events = queue.Queue()
+
+    @copy_current_request_context
+    def run_in_thread():
         try:
-            rga = request_data.get("rga", None)
-            logger = logging_client.logger('rga-logger') 
-            extra_info = {"has_rga": rga}
-            logger.log_struct(info=extra_info, severity='INFO')
+            response = run(
+                **step_kwargs, on_event=lambda event, data: events.put((event, data))
+            )
+            events.put(("done", response))
         except Exception as e:
-            print_log("RGA logging failed", severity=WARNING, errorMsg=e)
+            events.put(("error", step_error_event(e, route)))
+        finally:
+            events.put(None)
 
-        agent_id = request_data["agent_id"]
+    threading.Thread(target=run_in_thread, daemon=True).start()
 
-        if hasattr(request, "user"):
-            try:
-                shortened_desc = ai_description[:1200]
-                users_agent = datastore.Entity(
-                    key=client.key(
-                        "User", request.user.get("user_id"), "Agents", agent_id
-                    ),
-                )
-                users_agent.update(
-                    {
-                        "created": datetime.datetime.now(),
-                        "agent_id": agent_id,
-                        "ai_name": ai_name,
-                        "ai_role": shortened_desc,
-                    }
-                )
-                client.put(users_agent)
-            except Exception as e:
-                print_log("User entity failed", severity=WARNING, errorMsg=e)
+    def generate():
+        while (item := events.get()) is not None:
+            yield format_sse(*item)
 
-        openai_key = request_data.get("openai_key", None)
-        gpt_model = "gpt-3.5-turbo"
-        if len(openai_key or "") > 0:
-            gpt_model = request_data.get("gpt_model", "gpt-3.5-turbo")
-        else:
-            gpt_model = "gpt-3.5-turbo"
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        cfg = Config()
-        cfg.openai_api_key = openai_key
-        cfg.fast_llm_model = gpt_model
-        cfg.smart_llm_model = gpt_model
-        cfg.agent_id = agent_id
 
-        memory: PineconeMemory = get_memory(cfg)  # type: ignore
+@app.route("/api/stream", methods=["POST"])  # type: ignore
+@limiter.limit(make_rate_limit("500 per day;200 per hour;8 per minute"))
+@verify_firebase_token
+def godmode_stream():
+    """Run a step like /api, streaming its stages as Server-Sent Events.
+
+    Events are emitted in order: `result` (the executed command's result),
+    `token` (assistant reply deltas), `command` (the reply's command, as soon
+    as it is complete), `thoughts`, `task` and finally `done` with the same
+    body /api returns, or `error` if the step failed.
+    """
+    try:
+        step_kwargs = prepare_step(get_request_data(), getattr(request, "user", None))
+    except Exception as e:
+        print_log("/api/stream error", severity=ERROR, errorMsg=e)
+        raise e
+
+    return stream_events(new_interact, step_kwargs, "/api/stream")
+
+
+def prepare_run(request_data: dict, user: dict | None = None) -> dict:
+    """Build the arguments for continuous_interact from the body of an /api/run
+    request, which is the body of an /api request plus the limits of the run.
+    The limits are capped by the server's CONTINUOUS_* settings."""
+    step_kwargs = prepare_step(request_data, user)
+    step_kwargs.update(
+        max_steps=max(
+            1,
+            min(
+                int(request_data.get("max_steps", global_config.continuous_max_steps)),
+                global_config.continuous_max_steps,
+            ),
+        ),
+        time_limit=min(
+            float(
+                request_data.get("time_limit", global_config.continuous_time_limit)
+            ),
+            global_config.continuous_time_limit,
+        ),
+        max_tokens=request_data.get("max_tokens", None),
+        max_cost=request_data.get("max_cost", None),
+        checkpoint_interval=int(request_data.get("checkpoint_interval", 0)),
+    )
+    return step_kwargs
+
 
-        ai_config = AIConfig(
-            ai_name=ai_name,
-            ai_role=ai_description,
-            ai_goals=ai_goals,
+def run_rate_limit_cost() -> int:
+    """Count a run against the rate limit as the number of steps it may take"""
+    try:
+        return max(
+            1,
+            min(
+                int(get_request_data().get("max_steps", 1)),
+                global_config.continuous_max_steps,
+            ),
         )
+    except (TypeError, ValueError):
+        return 1
 
-        (
-            command_name,
-            arguments,
-            thoughts,
-            message_history,
-            assistant_reply,
-            result,
-            task,
-        ) = new_interact(
-            cfg=cfg,
-            ai_config=ai_config,
-            memory=memory,
-            command_name=command_name,
-            arguments=arguments,
-            assistant_reply=assistant_reply,
-            agent_id=agent_id,
-            full_message_history=message_history,
+
+@app.route("/api/run", methods=["POST"])  # type: ignore
+@limiter.limit(
+    make_rate_limit("500 per day;200 per hour;8 per minute"), cost=run_rate_limit_cost
+)
+@verify_firebase_token
+def godmode_run():
+    """Run several steps in a row, see continuous_interact.
+
+    Takes the body of /api plus `max_steps`, `time_limit`, `max_tokens`,
+    `max_cost` and `checkpoint_interval`, and returns the body /api returns for
+    the last step, plus `steps`, `stop_reason` and `tokens_used`.
+    """
+    try:
+        response = continuous_interact(
+            **prepare_run(get_request_data(), getattr(request, "user", None))
         )
     except Exception as e:
         if isinstance(e, OpenAIError):
             print_log("OpenAI error", severity=WARNING, errorMsg=e)
-            # print trace
-            traceback.print_exc()
             return e.error, 503
 
-        print_log("/api error", severity=ERROR, errorMsg=e)
+        print_log("/api/run error", severity=ERROR, errorMsg=e)
         raise e
 
-    return json.dumps(
-        {
-            "command": command_name,
-            "arguments": arguments,
-            "thoughts": thoughts,
-            "message_history": message_history,
-            "assistant_reply": assistant_reply,
-            "result": result,
-            "task": task,
-        }
+    return json.dumps(response)
+
+
+@app.route("/api/run/stream", methods=["POST"])  # type: ignore
+@limiter.limit(
+    make_rate_limit("500 per day;200 per hour;8 per minute"), cost=run_rate_limit_cost
+)
+@verify_firebase_token
+def godmode_run_stream():
+    """Run several steps in a row like /api/run, streaming them as Server-Sent
+    Events: the events of /api/stream for every step, then `step` with the
+    step's response, `checkpoint` whenever the session is saved midway, and
+    finally `done` with the body /api/run returns, or `error`."""
+    try:
+        step_kwargs = prepare_run(get_request_data(), getattr(request, "user", None))
+    except Exception as e:
+        print_log("/api/run/stream error", severity=ERROR, errorMsg=e)
+        raise e
+
+    return stream_events(continuous_interact, step_kwargs, "/api/run/stream")
+
+
+def run_step_job(payload: dict, on_event: Callable[[str, Any], None]) -> dict:
+    """Run a step queued by /api/steps"""
+    return new_interact(
+        **prepare_step(payload["request"], payload["user"]), on_event=on_event
+    )
+
+
+def step_job_error_event(e: Exception, job_id: str) -> dict:
+    """The data of the `error` event of a step job that raised e"""
+    return step_error_event(e, "/api/steps", job_id=job_id)
+
+
+job_queue = get_job_queue(global_config)
+job_workers = JobWorkerPool(
+    job_queue, run_step_job, global_config.job_workers, step_job_error_event
+)
+
+
+def job_owner(user: Optional[dict], openai_key: Optional[str]) -> str:
+    """Who a step job belongs to: the logged in user, or else whoever has the
+    OpenAI key it was enqueued with"""
+    if user:
+        return f"user:{user.get('user_id')}"
+    key_hash = hashlib.sha256((openai_key or "").encode()).hexdigest()
+    return f"key:{key_hash}"
+
+
+def forget_session_list(user_id: str) -> None:
+    """Drop the cached pages of the sessions of the user"""
+    session_list_cache.delete_where(lambda key: key[0] == user_id)
+
+
+def bad_limit():
+    return (
+        jsonify({"error": "Bad Request", "message": "limit must be at least 1"}),
+        400,
+    )
+
+
+def job_not_found():
+    return jsonify({"error": "Not Found", "message": "No such job"}), 404
+
+
+def verify_job_owner(f):
+    """Like verify_firebase_token, for the read-only routes of a step job.
+    As they have no body, a caller who isn't logged in sends the OpenAI key
+    the job was enqueued with in the X-OpenAI-Key header. The key is only
+    compared with the job's, and anyone but the job's owner gets a 404."""
+
+    @wraps(f)
+    def wrapper(job_id, *args, **kwargs):
+        user, unauthorized = verify_id_token()
+        if unauthorized is not None:
+            return unauthorized
+        openai_key = request.headers.get("X-OpenAI-Key", None)
+        if not user and not openai_key:
+            return (
+                jsonify(
+                    {
+                        "error": "Unauthorized",
+                        "message": "Please login or set an API key to continue",
+                    }
+                ),
+                401,
+            )
+        if user:
+            request.user = user
+
+        info = job_queue.job_info(job_id)
+        if info is None or info["owner"] != job_owner(user, openai_key):
+            return job_not_found()
+        return f(job_id, *args, **kwargs)
+
+    return wrapper
+
+
+@app.route("/api/steps", methods=["POST"])  # type: ignore
+@limiter.limit(make_rate_limit("500 per day;200 per hour;8 per minute"))
+@verify_firebase_token
+def enqueue_step():
+    """Queue a step with the same body as /api and return the id of its job.
+
+    The result can be long-polled from /api/steps/<job_id>, or streamed with
+    the same events as /api/stream from /api/steps/<job_id>/events, by the same
+    user or with the same OpenAI key (in the X-OpenAI-Key header).
+    """
+    try:
+        if global_config.job_queue == "local":
+            if global_config.web_workers > 1:
+                # the job could only be polled from this worker
+                return (
+                    jsonify(
+                        {
+                            "error": "Not Implemented",
+                            "message": "Step jobs need JOB_QUEUE=redis with"
+                            " more than one web worker",
+                        }
+                    ),
+                    501,
+                )
+            job_workers.start()
+        job_id = job_queue.enqueue(
+            {"request": get_request_data(), "user": getattr(request, "user", None)},
+            owner=job_owner(
+                getattr(request, "user", None), get_request_data().get("openai_key")
+            ),
+        )
+        return json.dumps({"job_id": job_id}), 202
+    except Exception as e:
+        print_log("/api/steps error", severity=ERROR, errorMsg=e)
+        raise e
+
+
+@app.route("/api/steps/<job_id>", methods=["GET"])  # type: ignore
+@limiter.limit("120 per minute")
+@verify_job_owner
+def step_status(job_id):
+    """Return the status of a step job, waiting up to ?wait= seconds for it"""
+    try:
+        wait = min(float(request.args.get("wait", 0)), 30)
+    except ValueError:
+        wait = None
+    if wait is None or not wait >= 0:
+        return (
+            jsonify({"error": "Bad Request", "message": "wait must be seconds"}),
+            400,
+        )
+    status = job_queue.status(job_id, timeout=wait)
+    if status is None:
+        return job_not_found()
+    return json.dumps(status, default=str)
+
+
+@app.route("/api/steps/<job_id>/events", methods=["GET"])  # type: ignore
+@limiter.limit("120 per minute")
+@verify_job_owner
+def step_events(job_id):
+    """Stream the events of a step job, resuming after Last-Event-ID if given"""
+    try:
+        cursor = int(request.headers.get("Last-Event-ID", -1)) + 1
+    except ValueError:
+        cursor = -1
+    if cursor < 0:
+        return (
+            jsonify(
+                {"error": "Bad Request", "message": "Last-Event-ID must be an event id"}
+            ),
+            400,
+        )
+    deadline = time.monotonic() + 600
+
+    def generate():
+        nonlocal cursor
+        while time.monotonic() < deadline:
+            events = job_queue.events(job_id, cursor, timeout=15)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event, data in events:
+                yield format_sse(event, data, event_id=cursor)
+                cursor += 1
+                if event in TERMINAL_EVENTS:
+                    return
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -518,7 +1132,7 @@ def godmode_main():
 # @verify_firebase_token
 def api_files():
     try:
-        request_data = request.get_json()
+        request_data = get_request_data()
         agent_id = request_data["agent_id"]
 
         files = get_file_urls(agent_id)
@@ -538,33 +1152,52 @@ def convert_none_or_date_to_isoformat(obj):
 @limiter.limit("16 per minute")
 @verify_firebase_token
 def sessions():
+    """List the sessions of the user, most recently active first.
+
+    With `limit` (in the body or the query string) only that many sessions are
+    read, and the returned `cursor` can be passed as `cursor` for the next
+    page. It is None on the last page. Without a limit every session is
+    returned. Pages are cached per user until the user's sessions change.
+    """
     try:
-        ref = (
-            fireclient.collection("User")
-            .document(request.user.get("user_id"))
-            .collection("Agents")
-            .where("ai_name", "!=", "deleted")
+        user_id = request.user.get("user_id")
+        request_data = get_request_data()
+        limit = request_data.get("limit", request.args.get("limit", None))
+        limit = int(limit) if limit is not None else None
+        if limit is not None and limit < 1:
+            return bad_limit()
+        cursor = request_data.get("cursor", request.args.get("cursor", None))
+
+        page = session_list_cache.get((user_id, limit, cursor))
+        if page is not None:
+            return page
+
+        agents, next_cursor = session_store.backend.list_user_agents(
+            user_id, limit=limit, cursor=cursor
         )
-        docs = ref.stream()
-        results = []
-        for doc in docs:
-            agent = doc.to_dict()
-            agent["agent_id"] = doc.id
-            results.append(agent)
 
-        return json.dumps(
+        page = json.dumps(
             {
                 "sessions": [
                     {
-                        "agent_id": r.get("agent_id", ""),
-                        "ai_name": r.get("ai_name", ""),
-                        "ai_role": r.get("ai_role", ""),
-                        "created": convert_none_or_date_to_isoformat(r.get("created", None)),
+                        "agent_id": agent_id,
+                        "ai_name": agent.get("ai_name", ""),
+                        "ai_role": agent.get("ai_role", ""),
+                        "created": convert_none_or_date_to_isoformat(
+                            agent.get("created", None)
+                        ),
                     }
-                    for r in results
+                    for agent_id, agent in agents
+                    # deleted sessions are filtered here, as an inequality
+                    # filter would have to be the first sort order
+                    if agent.get("ai_name") != "deleted"
                 ],
-            }, default=str
+                "cursor": next_cursor,
+            },
+            default=str,
         )
+        session_list_cache.set((user_id, limit, cursor), page)
+        return page
 
     except Exception as e:
         print_log("Sessions error", severity=ERROR, errorMsg=e)
@@ -575,9 +1208,13 @@ def sessions():
 @limiter.limit("16 per minute")
 @verify_firebase_token
 def session(agent_id):
+    """Return the session of an agent with its tasks, oldest first.
+
+    With ?limit=N only the N most recent tasks are returned, and `tasks_cursor`
+    can be passed as ?cursor= to get the N tasks before them.
+    """
     try:
-        ancestor_key = client.key("Agent", agent_id)
-        entity = client.get(key=ancestor_key)
+        entity = session_store.backend.get_agent(agent_id)
         if entity is None:
             return json.dumps(
                 {
@@ -585,15 +1222,27 @@ def session(agent_id):
                 }
             )
 
-        entity["arguments"] = (
-            json.loads(entity["arguments"])
-            if type(entity["arguments"]) == str
-            else entity["arguments"]
+        limit = request.args.get("limit", None, type=int)
+        if limit is not None and limit < 1:
+            return bad_limit()
+        cursor = request.args.get("cursor", None, type=int)
+        entity["tasks"], tasks_cursor = session_store.load_tasks(
+            agent_id, entity, limit=limit, cursor=cursor
         )
+        entity.pop("last_task", None)
+
+        # clients get the blobs as JSON strings, except for the arguments
+        for name in BLOB_AGENT_PROPERTIES:
+            value = entity.get(name)
+            if name == "arguments":
+                entity[name] = decode_blob(value, value)
+            elif isinstance(value, bytes):
+                entity[name] = json.dumps(decode_blob(value))
 
         return json.dumps(
             {
                 "session": entity,
+                "tasks_cursor": tasks_cursor,
             }
         )
 
@@ -607,20 +1256,18 @@ def session(agent_id):
 @verify_firebase_token
 def delete_session(agent_id):
     try:
-        useragent_key = client.key(
-            "User", request.user.get("user_id"), "Agents", agent_id
-        )
-
-        current_agent = client.get(key=useragent_key) or {}
-        users_agent = datastore.Entity(key=useragent_key)
-        users_agent.update(
+        user_id = request.user.get("user_id")
+        current_agent = session_store.backend.get_user_agent(user_id, agent_id) or {}
+        session_store.backend.put_user_agent(
+            user_id,
+            agent_id,
             {
                 **current_agent,
                 "deleted": datetime.datetime.now(),
                 "ai_name": "deleted",  # workaround since datastore can't query for lack of a property https://stackoverflow.com/a/44187921/6912118
-            }
+            },
         )
-        client.put(users_agent)
+        forget_session_list(user_id)
 
         return json.dumps({})
 
@@ -629,6 +1276,16 @@ def delete_session(agent_id):
         raise e
 
 
+@app.errorhandler(SessionConflict)
+def session_conflict(error):
+    return json.dumps(SESSION_CONFLICT), 409
+
+
+@app.errorhandler(HistoryOutOfSync)
+def history_out_of_sync(error):
+    return json.dumps(error.body), 409
+
+
 # register a 500 error handler
 @app.errorhandler(500)
 def internal_error(error):
@@ -0,0 +1,39 @@
+"""Verification of Firebase ID tokens, remembering the ones already verified."""
+import hashlib
+import time
+
+from firebase_admin import auth as firebase_auth
+
+from autogpt.cache import LRUCache
+from autogpt.clients import firebase_app
+
+
+class VerifiedTokenCache:
+    """
+    Verifies Firebase ID tokens, keeping verified tokens in an LRU cache until
+    they expire, so a client sending the same token with every request only has
+    it verified once.
+
+    Tokens are cached by their SHA-256 hash, and only once verified.
+    """
+
+    def __init__(self, max_size: int):
+        self.cache = LRUCache(max_size=max_size)
+
+    def verify(self, id_token: str) -> dict:
+        """
+        Returns the claims of a valid ID token.
+
+        Raises:
+            ValueError: The token is malformed.
+            firebase_auth.InvalidIdTokenError: The token is not valid, for
+                example because it expired.
+        """
+        key = hashlib.sha256(id_token.encode()).hexdigest()
+        claims = self.cache.get(key)
+        if claims is None:
+            claims = firebase_auth.verify_id_token(id_token, app=firebase_app())
+            ttl = claims.get("exp", 0) - time.time()
+            if ttl > 0:
+                self.cache.set(key, claims, ttl=ttl)
+        return dict(claims)
@@ -1,58 +1,61 @@
-from google.cloud import storage
+from autogpt.config import Config
 from autogpt.llm import chat
 import time
 
 from autogpt.llm import create_chat_completion
+from autogpt.metrics import STEP_STAGE_SECONDS
+from autogpt.storage import get_blob_store
 
 private_bucket_name = "godmode-ai"
 public_bucket_name = "godmode-public"
 
-client = storage.Client()
-private_bucket = client.bucket(private_bucket_name)
+global_config = Config()
 
 
+@STEP_STAGE_SECONDS.time(stage="gcs_upload")
 def upload_log(text: str, session_id: str):
     timestamp = time.time()
-    blob = private_bucket.blob(f"godmode-logs/{session_id}/{int(timestamp * 1000)}.txt")
-    blob.upload_from_string(
+    get_blob_store(global_config).write(
+        private_bucket_name,
+        f"godmode-logs/{session_id}/{int(timestamp * 1000)}.txt",
         text,
         content_type="text/plain",
     )
 
 
-bucket = client.bucket(public_bucket_name)
-
-
 def write_file(text: str, filename: str, agent_id: str):
-    blob = bucket.blob(f"godmode-files/{agent_id}/{filename}")
-    blob.upload_from_string(
+    get_blob_store(global_config).write(
+        public_bucket_name,
+        f"godmode-files/{agent_id}/{filename}",
         text,
         content_type="text/plain",
     )
 
 
 def get_file(filename: str, agent_id: str):
-    blob = bucket.blob(f"godmode-files/{agent_id}/{filename}")
     try:
-        text = blob.download_as_text()
-        return text
+        return get_blob_store(global_config).read_text(
+            public_bucket_name, f"godmode-files/{agent_id}/{filename}"
+        )
     except Exception as e:
         return ""
 
 
 def list_files(agent_id: str):
     prefix = f"godmode-files/{agent_id}/"
-    blobs = bucket.list_blobs(prefix=prefix)
-    return [file.name.replace(prefix, "") for file in blobs]
+    names = get_blob_store(global_config).list_names(public_bucket_name, prefix)
+    return [name.replace(prefix, "") for name in names]
 
 
 def get_file_urls(agent_id: str):
     if len(agent_id) < 5:
         return []
-    blobs = client.list_blobs(public_bucket_name, prefix=f"godmode-files/{agent_id}/")
-    return [file.public_url for file in blobs]
+    return get_blob_store(global_config).list_urls(
+        public_bucket_name, f"godmode-files/{agent_id}/"
+    )
 
 
+@STEP_STAGE_SECONDS.time(stage="task_naming")
 def generate_task_name(cfg, command_name: str, arguments: str):
     try:
         task_name = create_chat_completion(
@@ -76,6 +79,7 @@ def generate_task_name(cfg, command_name: str, arguments: str):
             model="gpt-3.5-turbo",
             temperature=0.2,
             cfg=cfg,
+            cache=True,
         )
         return task_name
     except Exception as e:
@@ -0,0 +1,81 @@
+"""A small thread-safe LRU cache with optional per-entry expiry."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe least-recently-used cache.
+
+    Attributes:
+        max_size (int): The maximum number of entries kept.
+        ttl (float): The default number of seconds an entry stays valid, or None
+            for entries that never expire.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[Any, Optional[float]]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the value stored for key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores value for key, evicting the least recently used entry if full.
+
+        Args:
+            key (Hashable): The key to store the value under.
+            value (Any): The value to store.
+            ttl (float, optional): Seconds until the entry expires. Defaults to
+                the ttl of the cache.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Removes key from the cache if it is present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Removes every entry whose key predicate returns True for."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,132 @@
+"""Lazily created, per-process clients of the cloud services used by the api.
+
+Clients hold gRPC channels, HTTP sessions and background threads, none of which
+survive a fork. Each client is created on first use by the process using it,
+so gunicorn can import the app once in its master (preload_app) and fork the
+workers from it without them sharing any connection.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+_clients: dict[tuple[int, str], Any] = {}
+_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    # the parent may have held the lock while forking
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client(name: str, factory: Callable[[], T]) -> T:
+    """
+    Returns the client registered under a name for the current process,
+    creating it with factory on first use.
+
+    Args:
+        name (str): The name of the client.
+        factory (Callable): Creates the client.
+
+    Returns:
+        The client.
+    """
+    key = (os.getpid(), name)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def datastore_client():
+    """The Datastore client of the process"""
+    from google.cloud import datastore
+
+    return get_client("datastore", datastore.Client)
+
+
+def firestore_client():
+    """The Firestore client of the process"""
+    from google.cloud import firestore
+
+    return get_client("firestore", firestore.Client)
+
+
+def logging_client():
+    """The Cloud Logging client of the process"""
+    from google.cloud import logging
+
+    return get_client("logging", logging.Client)
+
+
+def storage_client():
+    """The Cloud Storage client of the process"""
+    from google.cloud import storage
+
+    return get_client("storage", storage.Client)
+
+
+def _initialize_firebase_app():
+    import firebase_admin
+
+    try:
+        # an app initialized before a fork belongs to the parent
+        firebase_admin.delete_app(firebase_admin.get_app())
+    except ValueError:
+        pass
+    return firebase_admin.initialize_app()
+
+
+def firebase_app():
+    """The default Firebase app of the process"""
+    return get_client("firebase", _initialize_firebase_app)
+
+
+def _create_pinecone():
+    from pinecone import Pinecone
+
+    from autogpt.config import Config
+
+    cfg = Config()
+    if not cfg.pinecone_api_key:
+        print(
+            "Pinecone API key and region not set. "
+            "Please set them in the config file."
+        )
+        return None
+    if cfg.pinecone_region:
+        return Pinecone(api_key=cfg.pinecone_api_key, region=cfg.pinecone_region)
+    return Pinecone(api_key=cfg.pinecone_api_key)
+
+
+def pinecone_client():
+    """The Pinecone client of the process, or None without an API key"""
+    return get_client("pinecone", _create_pinecone)
+
+
+def _create_openai_transport():
+    from autogpt.config import Config
+    from autogpt.llm.transport import OpenAITransport
+
+    cfg = Config()
+    return OpenAITransport(
+        max_connections=cfg.openai_max_connections,
+        max_concurrency=cfg.openai_max_concurrency,
+    )
+
+
+def openai_transport():
+    """The asyncio transport of the OpenAI API of the process"""
+    return get_client("openai_transport", _create_openai_transport)
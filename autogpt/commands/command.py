@@ -1,6 +1,7 @@
 import functools
 import importlib
 import inspect
+from types import MappingProxyType
 from typing import Any, Callable, Optional
 
 # Unique identifier for auto-gpt commands
@@ -51,6 +52,8 @@ class CommandRegistry:
 
     def __init__(self):
         self.commands = {}
+        self.version = 0
+        self.frozen = False
 
     def _import_module(self, module_name: str) -> Any:
         return importlib.import_module(module_name)
@@ -58,15 +61,34 @@ class CommandRegistry:
     def _reload_module(self, module: Any) -> Any:
         return importlib.reload(module)
 
+    def _check_mutable(self) -> None:
+        if self.frozen:
+            raise RuntimeError("Cannot modify a frozen command registry.")
+
     def register(self, cmd: Command) -> None:
+        self._check_mutable()
         self.commands[cmd.name] = cmd
+        self.version += 1
 
     def unregister(self, command_name: str):
+        self._check_mutable()
         if command_name in self.commands:
             del self.commands[command_name]
+            self.version += 1
         else:
             raise KeyError(f"Command '{command_name}' not found in registry.")
 
+    def freeze(self) -> "CommandRegistry":
+        """
+        Returns an immutable snapshot of the registry that can be shared between
+        threads. The snapshot keeps the version of the registry it was taken from.
+        """
+        snapshot = CommandRegistry()
+        snapshot.commands = MappingProxyType(dict(self.commands))
+        snapshot.version = self.version
+        snapshot.frozen = True
+        return snapshot
+
     def reload_commands(self) -> None:
         """Reloads all loaded command plugins."""
         for cmd_name in self.commands:
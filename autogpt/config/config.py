@@ -163,6 +163,49 @@ class Config():
 
         self.memory_backend = os.getenv("MEMORY_BACKEND", "local")
 
+        # API server settings
+        self.storage_backend = os.getenv("STORAGE_BACKEND", "google")
+        self.local_storage_path = os.getenv("LOCAL_STORAGE_PATH", "local_storage")
+        self.auth_token_cache_size = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000))
+        self.session_cache_size = int(os.getenv("SESSION_CACHE_SIZE", 1024))
+        self.session_cache_ttl = float(os.getenv("SESSION_CACHE_TTL", 600))
+        self.session_blob_format = os.getenv("SESSION_BLOB_FORMAT", "compressed")
+        self.session_blob_compression = int(os.getenv("SESSION_BLOB_COMPRESSION", 6))
+        self.session_list_cache_size = int(os.getenv("SESSION_LIST_CACHE_SIZE", 1024))
+        self.session_list_cache_ttl = float(os.getenv("SESSION_LIST_CACHE_TTL", 15))
+        self.step_finalizer_workers = int(os.getenv("STEP_FINALIZER_WORKERS", 32))
+        self.web_workers = int(os.getenv("WEB_CONCURRENCY", 1))
+        self.job_queue = os.getenv("JOB_QUEUE", "local")
+        self.job_workers = int(os.getenv("JOB_WORKERS", 8))
+        self.job_result_ttl = float(os.getenv("JOB_RESULT_TTL", 3600))
+        self.continuous_max_steps = int(os.getenv("CONTINUOUS_MAX_STEPS", 10))
+        self.continuous_time_limit = float(os.getenv("CONTINUOUS_TIME_LIMIT", 240))
+        self.openai_async_transport = (
+            os.getenv("OPENAI_ASYNC_TRANSPORT", "False") == "True"
+        )
+        self.openai_max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+        self.openai_max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", 64))
+        self.openai_rpm_limit = int(os.getenv("OPENAI_RPM_LIMIT", 3500))
+        self.openai_tpm_limit = int(os.getenv("OPENAI_TPM_LIMIT", 90000))
+        self.openai_max_retries = int(os.getenv("OPENAI_MAX_RETRIES", 5))
+        self.llm_cache_size = int(os.getenv("LLM_CACHE_SIZE", 4096))
+        self.llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL", 86400))
+        self.llm_cache_redis = os.getenv("LLM_CACHE_REDIS", "False") == "True"
+        self.llm_hedging = os.getenv("LLM_HEDGING", "False") == "True"
+        self.llm_hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+        self.llm_hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", 2))
+        self.llm_hedge_model = os.getenv("LLM_HEDGE_MODEL")
+        self.speculative_execution = (
+            os.getenv("SPECULATIVE_EXECUTION", "False") == "True"
+        )
+        self.speculative_commands = os.getenv(
+            "SPECULATIVE_COMMANDS", "google,get_text_summary,get_hyperlinks"
+        ).split(",")
+        self.speculative_workers = int(os.getenv("SPECULATIVE_WORKERS", 8))
+        self.speculative_result_ttl = float(os.getenv("SPECULATIVE_RESULT_TTL", 300))
+        self.summary_batch_size = int(os.getenv("SUMMARY_BATCH_SIZE", 4))
+        self.summary_workers = int(os.getenv("SUMMARY_WORKERS", 4))
+
         self.plugins_dir = os.getenv("PLUGINS_DIR", "plugins")
         self.plugins: List[AutoGPTPluginTemplate] = []
         self.plugins_openai = []
@@ -0,0 +1,254 @@
+"""Job queues that decouple running agent steps from the HTTP request threads."""
+from __future__ import annotations
+
+import abc
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+from uuid import uuid4
+
+from autogpt.api_log import ERROR, print_log
+from autogpt.cache import LRUCache
+from autogpt.config import Config
+
+# Events that end a job
+TERMINAL_EVENTS = ("done", "error")
+
+
+class JobQueue(abc.ABC):
+    """
+    A queue of jobs, each with an ordered list of the events it has published.
+    A job is finished once it has published one of the TERMINAL_EVENTS.
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, payload: dict, owner: Optional[str] = None) -> str:
+        """Adds a job of owner to the queue and returns its id"""
+        pass
+
+    @abc.abstractmethod
+    def job_info(self, job_id: str) -> Optional[dict]:
+        """
+        Returns what was recorded of a job when it was enqueued, such as its
+        owner, or None if the job is unknown or has expired
+        """
+        pass
+
+    @abc.abstractmethod
+    def dequeue(self, timeout: float) -> Optional[tuple[str, dict]]:
+        """Takes the next job off the queue, waiting up to timeout seconds for one"""
+        pass
+
+    @abc.abstractmethod
+    def publish(self, job_id: str, event: str, data: Any) -> None:
+        """Appends an event to a job"""
+        pass
+
+    @abc.abstractmethod
+    def events(self, job_id: str, cursor: int, timeout: float) -> list[tuple[str, Any]]:
+        """
+        Returns the events of a job from index cursor onwards, waiting up to
+        timeout seconds if there are none yet
+        """
+        pass
+
+    def status(self, job_id: str, timeout: float = 0) -> Optional[dict]:
+        """
+        Returns the status of a job, waiting up to timeout seconds for it to
+        finish.
+
+        Returns:
+            dict: The status ("queued", "running", "done" or "error") and, for
+                finished jobs, the data of their terminal event. None if the
+                job is unknown or has expired.
+        """
+        if self.job_info(job_id) is None:
+            return None
+        deadline = time.monotonic() + timeout
+        cursor = 0
+        status = {"job_id": job_id, "status": "queued"}
+        while True:
+            events = self.events(job_id, cursor, max(0.0, deadline - time.monotonic()))
+            cursor += len(events)
+            for event, data in events:
+                if event == "started":
+                    status["status"] = "running"
+                elif event in TERMINAL_EVENTS:
+                    return {"job_id": job_id, "status": event, "result": data}
+            if time.monotonic() >= deadline:
+                return status
+
+
+class LocalJobQueue(JobQueue):
+    """
+    A job queue that only lives in the memory of the current process, so its
+    jobs can only be polled from the process they were enqueued in. It is for
+    servers with a single worker process.
+    """
+
+    def __init__(self, cfg: Config):
+        self.jobs: queue.Queue[tuple[str, dict]] = queue.Queue()
+        self.job_infos = LRUCache(max_size=10000, ttl=cfg.job_result_ttl)
+        self.job_events = LRUCache(max_size=10000, ttl=cfg.job_result_ttl)
+        self.condition = threading.Condition()
+
+    def enqueue(self, payload: dict, owner: Optional[str] = None) -> str:
+        job_id = str(uuid4())
+        self.job_infos.set(job_id, {"owner": owner})
+        self.job_events.set(job_id, [])
+        self.jobs.put((job_id, payload))
+        return job_id
+
+    def job_info(self, job_id: str) -> Optional[dict]:
+        return self.job_infos.get(job_id)
+
+    def dequeue(self, timeout: float) -> Optional[tuple[str, dict]]:
+        try:
+            return self.jobs.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def publish(self, job_id: str, event: str, data: Any) -> None:
+        with self.condition:
+            events = self.job_events.get(job_id)
+            if events is None:
+                events = []
+                self.job_events.set(job_id, events)
+            events.append((event, data))
+            self.condition.notify_all()
+
+    def events(self, job_id: str, cursor: int, timeout: float) -> list[tuple[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                events = self.job_events.get(job_id) or []
+                remaining = deadline - time.monotonic()
+                if len(events) > cursor or remaining <= 0:
+                    return events[cursor:]
+                self.condition.wait(remaining)
+
+
+class RedisJobQueue(JobQueue):
+    """A job queue in Redis, shared by every process connected to it."""
+
+    poll_interval = 0.25
+
+    def __init__(self, cfg: Config, name: str = "godmode"):
+        import redis
+
+        self.redis = redis.Redis(
+            host=cfg.redis_host,
+            port=cfg.redis_port,
+            password=cfg.redis_password,
+        )
+        self.queue_key = f"{name}:jobs"
+        self.events_prefix = f"{name}:job-events:"
+        self.info_prefix = f"{name}:job-info:"
+        self.ttl = int(cfg.job_result_ttl)
+
+    def enqueue(self, payload: dict, owner: Optional[str] = None) -> str:
+        job_id = str(uuid4())
+        pipeline = self.redis.pipeline()
+        pipeline.set(
+            self.info_prefix + job_id, json.dumps({"owner": owner}), ex=self.ttl
+        )
+        pipeline.rpush(self.queue_key, json.dumps({"id": job_id, "payload": payload}))
+        pipeline.execute()
+        return job_id
+
+    def job_info(self, job_id: str) -> Optional[dict]:
+        info = self.redis.get(self.info_prefix + job_id)
+        return json.loads(info) if info is not None else None
+
+    def dequeue(self, timeout: float) -> Optional[tuple[str, dict]]:
+        item = self.redis.blpop([self.queue_key], timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        job = json.loads(item[1])
+        return job["id"], job["payload"]
+
+    def publish(self, job_id: str, event: str, data: Any) -> None:
+        key = self.events_prefix + job_id
+        pipeline = self.redis.pipeline()
+        pipeline.rpush(key, json.dumps([event, data], default=str))
+        pipeline.expire(key, self.ttl)
+        pipeline.expire(self.info_prefix + job_id, self.ttl)
+        pipeline.execute()
+
+    def events(self, job_id: str, cursor: int, timeout: float) -> list[tuple[str, Any]]:
+        key = self.events_prefix + job_id
+        deadline = time.monotonic() + timeout
+        while True:
+            events = [tuple(json.loads(e)) for e in self.redis.lrange(key, cursor, -1)]
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(self.poll_interval)
+
+
+def job_error_event(error: Exception, job_id: str) -> dict:
+    """The data of the `error` event of a job that raised error, which only
+    gives clients an ID to look the error up by in the logs."""
+    err_uuid = str(uuid4())
+    print_log(
+        "Job failed", severity=ERROR, errorMsg=error, job_id=job_id, error_id=err_uuid
+    )
+    return {"status": 500, "error": f"There was an error. Error ID: {err_uuid}"}
+
+
+class JobWorkerPool:
+    """
+    A pool of threads taking jobs off a queue and running them with handler,
+    which is given the job's payload and a callback to publish events with.
+    Jobs that raise end with an `error` event whose data error_event gives.
+    """
+
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        handler: Callable[[dict, Callable[[str, Any], None]], Any],
+        num_workers: int,
+        error_event: Optional[Callable[[Exception, str], dict]] = None,
+    ):
+        self.job_queue = job_queue
+        self.handler = handler
+        self.error_event = error_event or job_error_event
+        self.num_workers = num_workers
+        self.threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the worker threads, unless they are already running."""
+        with self._lock:
+            if self.threads:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"job-worker-{i}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job = self.job_queue.dequeue(timeout=5)
+            if job is None:
+                continue
+            job_id, payload = job
+            self.job_queue.publish(job_id, "started", {})
+            try:
+                result = self.handler(
+                    payload,
+                    lambda event, data: self.job_queue.publish(job_id, event, data),
+                )
+                self.job_queue.publish(job_id, "done", result)
+            except Exception as e:
+                self.job_queue.publish(job_id, "error", self.error_event(e, job_id))
+
+
+def get_job_queue(cfg: Config) -> JobQueue:
+    """Returns the job queue selected by the JOB_QUEUE setting."""
+    if cfg.job_queue == "redis":
+        return RedisJobQueue(cfg)
+    return LocalJobQueue(cfg)
@@ -0,0 +1,33 @@
+"""Runs the step jobs queued in Redis by POST /api/steps.
+
+Start any number of these next to the web tier, with JOB_QUEUE=redis:
+
+    python -m autogpt.job_worker
+"""
+import time
+
+from autogpt.api import (
+    global_config,
+    job_queue,
+    run_step_job,
+    step_job_error_event,
+)
+from autogpt.job_queue import JobWorkerPool
+
+
+def main() -> None:
+    if global_config.job_queue != "redis":
+        print("Set JOB_QUEUE=redis to run step jobs outside of the web workers")
+        return
+
+    pool = JobWorkerPool(
+        job_queue, run_step_job, global_config.job_workers, step_job_error_event
+    )
+    pool.start()
+    print(f"Running step jobs on {pool.num_workers} threads")
+    while True:
+        time.sleep(60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Incremental reader of the assistant's JSON reply while it is streamed."""
+from __future__ import annotations
+
+import json
+from typing import Callable, Optional
+
+
+class CommandStreamParser:
+    """
+    Scans a streamed assistant reply for the `command` object of its JSON and
+    calls on_command with the name and arguments of the command as soon as the
+    object closes, which is often well before the `thoughts` are finished.
+
+    Only the keys of the outermost object are looked at, and any text before it
+    is skipped. A command object that isn't valid JSON is ignored, leaving the
+    reply to be repaired and parsed once it is complete.
+
+    Attributes:
+        command (tuple): The name and arguments of the command, once found.
+    """
+
+    def __init__(self, on_command: Optional[Callable[[str, dict], None]] = None):
+        self.on_command = on_command
+        self.command: Optional[tuple[str, dict]] = None
+        self._text = ""
+        self._position = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = ""
+        self._key: Optional[str] = None
+        self._command_start: Optional[int] = None
+        self._done = False
+
+    def feed(self, chunk: str) -> None:
+        """Reads the next chunk of the reply"""
+        if self._done:
+            return
+        self._text += chunk
+        text = self._text
+        for i in range(self._position, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start : i + 1]
+            elif not self._stack:
+                # skip anything before the reply's object
+                if char == "{":
+                    self._stack.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif len(self._stack) == 1 and char == ":":
+                self._key = self._decode(self._last_string)
+            elif len(self._stack) == 1 and char == ",":
+                self._key = None
+            elif char in "{[":
+                if len(self._stack) == 1 and char == "{" and self._key == "command":
+                    self._command_start = i
+                self._stack.append(char)
+            elif char in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                    return
+                if len(self._stack) == 1 and self._command_start is not None:
+                    self._done = True
+                    self._parse_command(text[self._command_start : i + 1])
+                    return
+        self._position = len(text)
+
+    @staticmethod
+    def _decode(string: str) -> Optional[str]:
+        try:
+            return json.loads(string)
+        except json.JSONDecodeError:
+            return None
+
+    def _parse_command(self, command_json: str) -> None:
+        try:
+            command = json.loads(command_json)
+        except json.JSONDecodeError:
+            return
+        if "name" not in command:
+            return
+        arguments = command.get("args", {})
+        if not isinstance(arguments, dict):
+            return
+        self.command = (str(command["name"]), arguments)
+        if self.on_command is not None:
+            self.on_command(*self.command)
@@ -1,10 +1,22 @@
 from __future__ import annotations
 
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, Optional
+
 import openai
 
+from autogpt.clients import openai_transport
 from autogpt.config import Config
+from autogpt.llm.hedging import LatencyTracker, hedge, hedge_executor
 from autogpt.llm.modelsinfo import COSTS
+from autogpt.llm.rate_limiter import RequestScheduler
+from autogpt.llm.token_counter import count_message_tokens, count_string_tokens
+from autogpt.llm.usage import UsageLedger, UsageLedgers
 from autogpt.logs import logger
+from autogpt.metrics import LLM_HEDGE_COST, LLM_HEDGES, STEP_STAGE_SECONDS, TOKENS
 from autogpt.singleton import Singleton
 
 
@@ -14,6 +26,12 @@ class ApiManager(metaclass=Singleton):
         self.total_completion_tokens = 0
         self.total_cost = 0
         self.total_budget = 0
+        cfg = Config()
+        self.scheduler = RequestScheduler(cfg.openai_rpm_limit, cfg.openai_tpm_limit)
+        self.latency = LatencyTracker()
+        self.total_hedge_cost = 0.0
+        self.ledgers = UsageLedgers()
+        self._lock = threading.Lock()
 
     def reset(self):
         self.total_prompt_tokens = 0
@@ -21,6 +39,38 @@ class ApiManager(metaclass=Singleton):
         self.total_cost = 0
         self.total_budget = 0.0
 
+    def usage(self, agent_id: str) -> UsageLedger:
+        """
+        Get the usage ledger of an agent session.
+
+        Returns:
+        UsageLedger: The tokens, cost and budget of the session.
+        """
+        return self.ledgers.get(agent_id)
+
+    def schedule(
+        self,
+        cfg: Config,
+        messages: list,
+        model: str | None,
+        max_tokens: int | None,
+    ) -> int:
+        """
+        Wait until a chat completion fits in the rate limits of the API key.
+
+        Returns:
+        int: The tokens the completion is estimated to use.
+        """
+        try:
+            estimated = count_message_tokens(messages, model)
+        except (KeyError, NotImplementedError):
+            # roughly 4 characters a token
+            estimated = sum(len(message["content"]) for message in messages) // 4
+        estimated += max_tokens or 0
+        waited = self.scheduler.acquire(cfg.openai_api_key, model, estimated)
+        STEP_STAGE_SECONDS.observe(waited, stage="openai_queue")
+        return estimated
+
     def create_chat_completion(
         self,
         messages: list,  # type: ignore
@@ -42,45 +92,228 @@ class ApiManager(metaclass=Singleton):
         """
         if temperature is None:
             temperature = cfg.temperature
+        request = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "api_key": cfg.openai_api_key,
+        }
         if deployment_id is not None:
-            response = openai.ChatCompletion.create(
-                deployment_id=deployment_id,
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                api_key=cfg.openai_api_key,
+            request["deployment_id"] = deployment_id
+        estimated = self.schedule(cfg, messages, model, max_tokens)
+        if cfg.llm_hedging:
+            response, model = self.create_hedged_chat_completion(
+                cfg, request, estimated
+            )
+        else:
+            if cfg.openai_async_transport:
+                create = openai_transport().create_chat_completion
+            else:
+                create = openai.ChatCompletion.create
+            start = time.monotonic()
+            try:
+                response = create(**request)
+            except Exception:
+                # a failed call uses no tokens, give back what it reserved
+                self.scheduler.settle(cfg.openai_api_key, model, estimated, 0)
+                raise
+            self.latency.observe(model, time.monotonic() - start)
+        logger.debug(f"Response: {response}")
+        prompt_tokens = response.usage.prompt_tokens
+        completion_tokens = response.usage.completion_tokens
+        self.scheduler.settle(
+            cfg.openai_api_key, model, estimated, prompt_tokens + completion_tokens
+        )
+        self.update_cost(prompt_tokens, completion_tokens, model, cfg.agent_id)
+        return response
+
+    def create_hedged_chat_completion(
+        self, cfg: Config, request: dict, estimated: int
+    ) -> tuple[Any, str]:
+        """
+        Request a chat completion, and request it again from cfg.llm_hedge_model
+        if it is slower than cfg.llm_hedge_percentile of the recent completions
+        of its model. The first response wins, and the cost of the other call is
+        accounted as hedging cost.
+        Args:
+        request (dict): The arguments of ChatCompletion.create.
+        estimated (int): The tokens reserved for the request on the scheduler.
+        Returns:
+        tuple: The winning response and the model that created it.
+        """
+        model = request["model"]
+        backup_model = cfg.llm_hedge_model or model
+        backup_request = dict(request, model=backup_model)
+        if cfg.use_azure:
+            backup_request["deployment_id"] = cfg.get_azure_deployment_id_for_model(
+                backup_model
+            )
+        delay = self.latency.percentile(model, cfg.llm_hedge_percentile)
+        if delay is not None:
+            delay = max(delay, cfg.llm_hedge_min_delay)
+        calls = {}
+
+        def send(request: dict, estimated: int) -> Future:
+            if cfg.openai_async_transport:
+                transport = openai_transport()
+                future = transport.submit(transport.acreate_chat_completion(**request))
+            else:
+                future = hedge_executor().submit(
+                    openai.ChatCompletion.create, **request
+                )
+            calls[future] = (request["model"], estimated, time.monotonic())
+            return future
+
+        def send_backup() -> Future:
+            backup_estimated = self.schedule(
+                cfg, request["messages"], backup_model, request["max_tokens"]
             )
+            return send(backup_request, backup_estimated)
+
+        try:
+            winner, loser = hedge(partial(send, request, estimated), send_backup, delay)
+            response = winner.result()
+        except Exception:
+            # give back what the calls reserved as they fail, and bill a call
+            # still running if it succeeds after all
+            for future, (call_model, call_estimated, _) in calls.items():
+                future.add_done_callback(
+                    partial(self._account_hedge, cfg, call_model, call_estimated)
+                )
+            raise
+        winner_model, _, start = calls[winner]
+        self.latency.observe(winner_model, time.monotonic() - start)
+        if loser is not None:
+            primary = next(iter(calls))
+            LLM_HEDGES.inc(
+                model=model, winner="primary" if winner is primary else "backup"
+            )
+            loser_model, loser_estimated, loser_start = calls[loser]
+            # the loser took at least this long
+            self.latency.observe(loser_model, time.monotonic() - loser_start)
+            loser.add_done_callback(
+                partial(self._account_hedge, cfg, loser_model, loser_estimated)
+            )
+        return response, winner_model
+
+    def _account_hedge(
+        self, cfg: Config, model: str, estimated: int, future: Future
+    ) -> None:
+        """Account the cost of the call that lost a hedge, once it is done"""
+        if future.cancelled() or future.exception() is not None:
+            self.scheduler.settle(cfg.openai_api_key, model, estimated, 0)
+            return
+        usage = future.result().usage
+        self.scheduler.settle(
+            cfg.openai_api_key,
+            model,
+            estimated,
+            usage.prompt_tokens + usage.completion_tokens,
+        )
+        cost = self.update_cost(
+            usage.prompt_tokens, usage.completion_tokens, model, cfg.agent_id
+        )
+        with self._lock:
+            self.total_hedge_cost += cost
+        LLM_HEDGE_COST.inc(cost, model=model)
+
+    def create_chat_completion_stream(
+        self,
+        messages: list,  # type: ignore
+        cfg: Config,
+        on_token: Callable[[str], None],
+        model: str | None = None,
+        temperature: float = None,
+        max_tokens: int | None = None,
+        deployment_id=None,
+    ) -> str:
+        """
+        Create a streamed chat completion, passing every content delta to on_token
+        as it arrives, and update the cost.
+        Args:
+        messages (list): The list of messages to send to the API.
+        on_token (Callable): Called with each chunk of content as it is received.
+        model (str): The model to use for the API call.
+        temperature (float): The temperature to use for the API call.
+        max_tokens (int): The maximum number of tokens for the API call.
+        Returns:
+        str: The AI's full response.
+        """
+        if temperature is None:
+            temperature = cfg.temperature
+        kwargs = {}
+        if deployment_id is not None:
+            kwargs["deployment_id"] = deployment_id
+        if cfg.openai_async_transport:
+            stream = openai_transport().stream_chat_completion
         else:
-            response = openai.ChatCompletion.create(
+            stream = partial(openai.ChatCompletion.create, stream=True)
+        estimated = self.schedule(cfg, messages, model, max_tokens)
+        content = []
+        try:
+            chunks = stream(
                 model=model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 api_key=cfg.openai_api_key,
+                **kwargs,
             )
-        logger.debug(f"Response: {response}")
-        prompt_tokens = response.usage.prompt_tokens
-        completion_tokens = response.usage.completion_tokens
-        self.update_cost(prompt_tokens, completion_tokens, model)
+            for chunk in chunks:
+                delta = chunk.choices[0].delta.get("content")
+                if delta:
+                    content.append(delta)
+                    on_token(delta)
+        except Exception:
+            self.scheduler.settle(cfg.openai_api_key, model, estimated, 0)
+            raise
+        response = "".join(content)
+        logger.debug(f"Streamed response: {response}")
+
+        # Streamed responses carry no usage block, so count the tokens ourselves
+        try:
+            prompt_tokens = count_message_tokens(messages, model)
+            completion_tokens = count_string_tokens(response, model)
+        except (KeyError, NotImplementedError):
+            logger.debug(f"Unable to count tokens for model {model}")
+        else:
+            self.scheduler.settle(
+                cfg.openai_api_key, model, estimated, prompt_tokens + completion_tokens
+            )
+            self.update_cost(prompt_tokens, completion_tokens, model, cfg.agent_id)
         return response
 
-    def update_cost(self, prompt_tokens, completion_tokens, model):
+    def update_cost(
+        self, prompt_tokens, completion_tokens, model, agent_id: Optional[str] = None
+    ):
         """
-        Update the total cost, prompt tokens, and completion tokens.
+        Update the total cost, prompt tokens, and completion tokens, and those of
+        the session of the agent the API call was made for.
 
         Args:
         prompt_tokens (int): The number of tokens used in the prompt.
         completion_tokens (int): The number of tokens used in the completion.
         model (str): The model used for the API call.
+        agent_id (str, optional): The agent the API call was made for.
+
+        Returns:
+        float: The cost of the API call.
         """
-        self.total_prompt_tokens += prompt_tokens
-        self.total_completion_tokens += completion_tokens
-        self.total_cost += (
+        TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+        TOKENS.inc(completion_tokens, model=model, kind="completion")
+        cost = (
             prompt_tokens * COSTS[model]["prompt"]
             + completion_tokens * COSTS[model]["completion"]
         ) / 1000
+        with self._lock:
+            self.total_prompt_tokens += prompt_tokens
+            self.total_completion_tokens += completion_tokens
+            self.total_cost += cost
+        if agent_id is not None:
+            self.usage(agent_id).add(prompt_tokens, completion_tokens, cost)
         logger.debug(f"Total running cost: ${self.total_cost:.3f}")
+        return cost
 
     def set_total_budget(self, total_budget):
         """
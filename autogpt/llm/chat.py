@@ -5,11 +5,12 @@ from openai.error import RateLimitError
 from autogpt.api_log import print_log
 
 from autogpt.config import Config
-from autogpt.llm.api_manager import ApiManager
 from autogpt.llm.base import Message
+from autogpt.llm.context_window import ContextWindow
 from autogpt.llm.llm_utils import create_chat_completion
-from autogpt.llm.token_counter import count_message_tokens
+from autogpt.llm.token_counter import count_message_tokens, count_string_tokens
 from autogpt.log_cycle.log_cycle import CURRENT_CONTEXT_FILE_NAME
+from autogpt.metrics import STEP_STAGE_SECONDS
 from autogpt.logs import logger
 
 
@@ -27,7 +28,9 @@ def create_chat_message(role, content) -> Message:
     return {"role": role, "content": content}
 
 
-def generate_context(prompt, relevant_memory, full_message_history, model):
+def generate_context(
+    prompt, relevant_memory, full_message_history, model, prompt_tokens=None
+):
     current_context = [
         create_chat_message("system", prompt),
         create_chat_message(
@@ -43,7 +46,13 @@ def generate_context(prompt, relevant_memory, full_message_history, model):
     next_message_to_add_index = len(full_message_history) - 1
     insertion_index = len(current_context)
     # Count the currently used tokens
-    current_tokens_used = count_message_tokens(current_context, model)
+    if prompt_tokens is None:
+        current_tokens_used = count_message_tokens(current_context, model)
+    else:
+        # Both counts include the 3 tokens priming the reply, so drop one of them
+        current_tokens_used = (
+            prompt_tokens + count_message_tokens(current_context[1:], model) - 3
+        )
     return (
         next_message_to_add_index,
         current_tokens_used,
@@ -105,7 +114,13 @@ def chat_with_ai(
                 current_tokens_used,
                 insertion_index,
                 current_context,
-            ) = generate_context(prompt, relevant_memory, full_message_history, model)
+            ) = generate_context(
+                prompt,
+                relevant_memory,
+                full_message_history,
+                model,
+                prompt_tokens=agent.system_prompt_tokens,
+            )
 
             # while current_tokens_used > 2500:
             #     # remove memories until we are under 2500 tokens
@@ -125,65 +140,38 @@ def chat_with_ai(
 
             current_tokens_used += 500  # Account for memory (appended later) TODO: The final memory may be less than 500 tokens
 
-            # Add Messages until the token limit is reached or there are no more messages to add.
-            while next_message_to_add_index >= 0:
-                # print (f"CURRENT TOKENS USED: {current_tokens_used}")
-                message_to_add = full_message_history[next_message_to_add_index]
-
-                tokens_to_add = count_message_tokens([message_to_add], model)
-                if current_tokens_used + tokens_to_add > send_token_limit:
-                    # save_memory_trimmed_from_context_window(
-                    #     full_message_history,
-                    #     next_message_to_add_index,
-                    #     permanent_memory,
-                    # )
-                    break
-
-                # Add the most recent message to the start of the current context,
-                #  after the two system prompts.
-                current_context.insert(
-                    insertion_index, full_message_history[next_message_to_add_index]
-                )
-
-                # Count the currently used tokens
-                current_tokens_used += tokens_to_add
-
-                # Move to the next most recent message in the full message history
-                next_message_to_add_index -= 1
-            from autogpt.memory_management.summary_memory import (
-                get_newly_trimmed_messages,
-                update_running_summary,
+            # Add the most recent messages that fit in the token limit to the
+            #  current context, after the two system prompts.
+            context_window = ContextWindow(full_message_history, model)
+            context_start = context_window.fit(send_token_limit - current_tokens_used)
+            current_context[insertion_index:insertion_index] = full_message_history[
+                context_start:
+            ]
+            current_tokens_used += context_window.tokens(context_start)
+            from autogpt.memory_management.running_summary import (
+                get_running_summaries,
             )
+            from autogpt.memory_management.summary_memory import summary_message
 
             # Insert Memories
             if len(full_message_history) > 0:
-                (
-                    newly_trimmed_messages,
-                    agent.last_memory_index,
-                ) = get_newly_trimmed_messages(
-                    full_message_history=full_message_history,
-                    current_context=current_context,
-                    last_memory_index=agent.last_memory_index,
-                )
                 try:
-                    agent.summary_memory = update_running_summary(
-                        agent,
-                        current_memory=agent.summary_memory,
-                        new_events=newly_trimmed_messages,
-                        cfg=cfg,
+                    with STEP_STAGE_SECONDS.time(stage="summary_update"):
+                        (
+                            agent.summary_memory,
+                            agent.summary_cursor,
+                        ) = get_running_summaries().update(
+                            agent, full_message_history, context_start, cfg
+                        )
+                    current_context.insert(
+                        insertion_index, summary_message(agent.summary_memory)
                     )
-                    current_context.insert(insertion_index, agent.summary_memory)
                 except Exception as e:
                     print_log("Error updating summary memory:", severity="warning", errorMsg=str(e))
 
-            api_manager = ApiManager()
-            # inform the AI about its remaining budget (if it has one)
-            if api_manager.get_total_budget() > 0.0:
-                remaining_budget = (
-                    api_manager.get_total_budget() - api_manager.get_total_cost()
-                )
-                if remaining_budget < 0:
-                    remaining_budget = 0
+            # inform the AI about the remaining budget of its session (if it has one)
+            remaining_budget = agent.usage.remaining_budget()
+            if remaining_budget is not None:
                 system_message = (
                     f"Your remaining API budget is ${remaining_budget:.3f}"
                     + (
@@ -241,12 +229,16 @@ def chat_with_ai(
 
             # TODO: use a model defined elsewhere, so that model can contain
             # temperature and other settings we care about
-            assistant_reply = create_chat_completion(
-                model=model,
-                messages=current_context,
-                max_tokens=tokens_remaining,
-                cfg=cfg,
-            )
+            with STEP_STAGE_SECONDS.time(stage="chat_completion"):
+                assistant_reply = create_chat_completion(
+                    model=model,
+                    messages=current_context,
+                    max_tokens=tokens_remaining,
+                    cfg=cfg,
+                    on_token=agent.on_token,
+                )
+            agent.prompt_tokens_used += current_tokens_used
+            agent.completion_tokens_used += count_string_tokens(assistant_reply, model)
 
             # Update full message history
             full_message_history.append(create_chat_message("user", user_input))
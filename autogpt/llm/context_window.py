@@ -0,0 +1,54 @@
+"""Fitting the most recent messages of a history in the context window."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from itertools import accumulate
+from typing import List, Optional
+
+from autogpt.llm.base import Message
+from autogpt.llm.token_counter import REPLY_PRIMING_TOKENS, count_each_message_tokens
+
+
+class ContextWindow:
+    """
+    The token counts of the messages of a history as prefix sums, so the most
+    recent messages that fit in a number of tokens are found by binary search
+    rather than by adding them one at a time.
+
+    Every message is counted as count_message_tokens([message]) counts it,
+    with the tokens priming the reply, as the messages used to be added one at
+    a time. It overestimates the prompt by a few tokens per message, which the
+    token budget of the context has always left room for.
+
+    Attributes:
+        messages (list): The messages of the history, oldest first.
+        prefix_tokens (list): The number of tokens of the first i messages, for
+            every i from 0 to len(messages).
+    """
+
+    def __init__(self, messages: List[Message], model: str):
+        self.messages = messages
+        self.prefix_tokens = list(
+            accumulate(
+                (
+                    tokens + REPLY_PRIMING_TOKENS
+                    for tokens in count_each_message_tokens(messages, model)
+                ),
+                initial=0,
+            )
+        )
+
+    def tokens(self, start: int, end: Optional[int] = None) -> int:
+        """Returns the number of tokens of messages[start:end]"""
+        if end is None:
+            end = len(self.messages)
+        return self.prefix_tokens[end] - self.prefix_tokens[start]
+
+    def fit(self, token_limit: int) -> int:
+        """
+        Returns the index of the oldest of the most recent messages that use at
+        most token_limit tokens together, which is len(messages) if not even
+        the last message fits.
+        """
+        start = bisect_left(self.prefix_tokens, self.prefix_tokens[-1] - token_limit)
+        return min(start, len(self.messages))
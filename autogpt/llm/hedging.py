@@ -0,0 +1,98 @@
+"""Hedged chat completions, against the tail latency of the OpenAI API.
+
+A completion that hasn't returned within a percentile of the recent latency of
+its model is requested a second time, optionally from a fallback model or Azure
+deployment, and the first response wins. The other call is cancelled when it
+goes through the async transport, or else left to finish in the background.
+Either way, what it cost is accounted as the cost of hedging.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from autogpt.clients import get_client
+from autogpt.config import Config
+
+
+class LatencyTracker:
+    """
+    The latencies of the recent completions of every model.
+
+    Attributes:
+        window (int): The number of latencies kept per model.
+        min_samples (int): The number of latencies needed for a percentile.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(model)
+            if latencies is None:
+                latencies = self._latencies[model] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """
+        Returns the latency that percentile percent of the recent completions of
+        model took at most, or None until there are min_samples of them.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        index = int(len(latencies) * percentile / 100)
+        return latencies[min(index, len(latencies) - 1)]
+
+
+def hedge(
+    send: Callable[[], Future],
+    send_backup: Callable[[], Future],
+    delay: Optional[float],
+) -> tuple[Future, Optional[Future]]:
+    """
+    Sends a call, and a backup call if the first hasn't completed within delay.
+
+    Args:
+        send (Callable): Starts the call, returning its future.
+        send_backup (Callable): Starts the backup call, returning its future.
+        delay (float): Seconds to wait before sending the backup, or None to
+            never send it.
+
+    Returns:
+        tuple: The future of the call that succeeded first, or of the first
+            call if both failed, and the future of the other call, which is
+            cancelled, or None if the backup wasn't sent.
+    """
+    future = send()
+    if delay is None or wait([future], timeout=delay).done:
+        return future, None
+
+    backup = send_backup()
+    pending = {future, backup}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for winner in done:
+            if not winner.cancelled() and winner.exception() is None:
+                loser = backup if winner is future else future
+                loser.cancel()
+                return winner, loser
+    return future, backup
+
+
+def _create_hedge_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=Config().openai_max_concurrency, thread_name_prefix="openai-hedge"
+    )
+
+
+def hedge_executor() -> ThreadPoolExecutor:
+    """The threads of the process sending hedged calls without the async transport"""
+    return get_client("openai_hedge_executor", _create_hedge_executor)
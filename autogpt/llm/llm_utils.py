@@ -3,7 +3,7 @@ from __future__ import annotations
 import functools
 import time
 from itertools import islice
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 import numpy as np
 import openai
@@ -11,10 +11,19 @@ import tiktoken
 from colorama import Fore, Style
 from openai.error import APIError, RateLimitError, Timeout
 
+from autogpt.clients import openai_transport
 from autogpt.config import Config
 from autogpt.llm.api_manager import ApiManager
 from autogpt.llm.base import Message
+from autogpt.llm.rate_limiter import backoff, jitter, retry_after
+from autogpt.llm.response_cache import cache_key, get_response_cache
+from autogpt.llm.single_flight import SingleFlight
 from autogpt.logs import logger
+from autogpt.metrics import RATE_LIMIT_HITS, RETRIES, STEP_STAGE_SECONDS
+
+# identical calls in flight on several threads share a single upstream call
+completion_flights = SingleFlight("chat_completion")
+embedding_flights = SingleFlight("embedding")
 
 
 def retry_openai_api(
@@ -26,7 +35,8 @@ def retry_openai_api(
 
     Args:
         num_retries int: Number of retries. Defaults to 10.
-        backoff_base float: Base for exponential backoff. Defaults to 2.
+        backoff_base float: Base for exponential backoff, jittered by up to half
+            of each delay. Defaults to 2.
         warn_user bool: Whether to warn the user. Defaults to True.
     """
     retry_limit_msg = f"{Fore.RED}Error: " f"Reached rate limit, passing...{Fore.RESET}"
@@ -49,9 +59,11 @@ def retry_openai_api(
                     return func(*args, **kwargs)
 
                 except RateLimitError:
+                    RATE_LIMIT_HITS.inc(source="openai")
                     if attempt == num_attempts:
                         raise
 
+                    RETRIES.inc(error="rate_limit")
                     logger.debug(retry_limit_msg)
                     if not user_warned:
                         logger.double_check(api_key_error_msg)
@@ -60,10 +72,11 @@ def retry_openai_api(
                 except APIError as e:
                     if (e.http_status != 502) or (attempt == num_attempts):
                         raise
+                    RETRIES.inc(error="bad_gateway")
 
-                backoff = backoff_base ** (attempt + 2)
-                logger.debug(backoff_msg.format(backoff=backoff))
-                time.sleep(backoff)
+                delay = jitter(backoff_base ** (attempt + 2))
+                logger.debug(backoff_msg.format(backoff=delay))
+                time.sleep(delay)
 
         return _wrapped
 
@@ -102,7 +115,9 @@ def call_ai_function(
         {"role": "user", "content": args},
     ]
 
-    return create_chat_completion(cfg=cfg,model=model, messages=messages, temperature=0)
+    return create_chat_completion(
+        cfg=cfg, model=model, messages=messages, temperature=0, cache=True
+    )
 
 
 # Overly simple abstraction until we create something better
@@ -113,14 +128,24 @@ def create_chat_completion(
     model: Optional[str] = None,
     temperature: float = None,
     max_tokens: Optional[int] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    cache: bool = False,
 ) -> str:
     """Create a chat completion using the OpenAI API
 
+    A completion that isn't streamed is shared with the threads making the same
+    call at the same time, with the same API key.
+
     Args:
         messages (List[Message]): The messages to send to the chat completion
         model (str, optional): The model to use. Defaults to None.
         temperature (float, optional): The temperature to use. Defaults to 0.9.
         max_tokens (int, optional): The max tokens to use. Defaults to None.
+        on_token (Callable, optional): If set, the completion is streamed and
+            every content delta is passed to it as it arrives. Defaults to None.
+        cache (bool, optional): Whether the completion may be answered from, and
+            is stored in, the response cache. Only for deterministic calls.
+            Defaults to False.
 
     Returns:
         str: The response from the chat completion
@@ -128,8 +153,6 @@ def create_chat_completion(
     if temperature is None:
         temperature = cfg.temperature
 
-    num_retries = 10
-    warned_user = False
     logger.debug(
         f"{Fore.GREEN}Creating chat completion with model {model}, temperature {temperature}, max_tokens {max_tokens}{Fore.RESET}"
     )
@@ -148,36 +171,30 @@ def create_chat_completion(
             )
             if message is not None:
                 return message
-    api_manager = ApiManager()
-    response = None
-    try:
-        response = api_manager.create_chat_completion(
-            cfg=cfg,
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-    except RateLimitError:
-        logger.debug(
-            f"{Fore.RED}Error: ", f"Reached rate limit, passing...{Fore.RESET}"
-        )
-        if not warned_user:
-            logger.double_check(
-                f"Please double check that you have setup a {Fore.CYAN + Style.BRIGHT}PAID{Style.RESET_ALL} OpenAI API Account. "
-                + f"You can read more here: {Fore.CYAN}https://docs.agpt.co/setup/#getting-an-api-key{Fore.RESET}"
+    key = cache_key(model, messages, temperature, max_tokens)
+    resp = get_response_cache().get(key) if cache else None
+    if resp is not None:
+        if on_token is not None:
+            on_token(resp)
+    else:
+        if on_token is None:
+            resp = completion_flights.do(
+                (cfg.openai_api_key, key),
+                _request_chat_completion,
+                messages,
+                cfg,
+                model,
+                temperature,
+                max_tokens,
+                None,
+            )
+        else:
+            resp = _request_chat_completion(
+                messages, cfg, model, temperature, max_tokens, on_token
             )
-            warned_user = True
-    except (APIError, Timeout) as e:
-        if e.http_status != 502:
-            raise
-        if attempt == num_retries - 1:
-            raise
-        
-    if response is None:
-        return "OpenAI API error"
-
-    resp = response.choices[0].message["content"]
+        if cache:
+            get_response_cache().set(key, resp)
+
     for plugin in cfg.plugins:
         if not plugin.can_handle_on_response():
             continue
@@ -185,6 +202,65 @@ def create_chat_completion(
     return resp
 
 
+def _request_chat_completion(
+    messages: List[Message],  # type: ignore
+    cfg: Config,
+    model: Optional[str],
+    temperature: float,
+    max_tokens: Optional[int],
+    on_token: Optional[Callable[[str], None]],
+) -> str:
+    """Request a chat completion from the OpenAI API, streamed if on_token is set
+
+    Rate limited calls and bad gateways are retried up to cfg.openai_max_retries
+    times with jittered backoff, then the error is raised.
+    """
+    api_manager = ApiManager()
+    warned_user = False
+    for attempt in range(1, cfg.openai_max_retries + 2):
+        try:
+            if on_token is None:
+                response = api_manager.create_chat_completion(
+                    cfg=cfg,
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                )
+                return response.choices[0].message["content"]
+            return api_manager.create_chat_completion_stream(
+                cfg=cfg,
+                on_token=on_token,
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        except RateLimitError as e:
+            RATE_LIMIT_HITS.inc(source="openai")
+            if attempt > cfg.openai_max_retries:
+                raise
+            RETRIES.inc(error="rate_limit")
+            logger.debug(
+                f"{Fore.RED}Error: ", f"Reached rate limit, passing...{Fore.RESET}"
+            )
+            if not warned_user:
+                logger.double_check(
+                    f"Please double check that you have setup a {Fore.CYAN + Style.BRIGHT}PAID{Style.RESET_ALL} OpenAI API Account. "
+                    + f"You can read more here: {Fore.CYAN}https://docs.agpt.co/setup/#getting-an-api-key{Fore.RESET}"
+                )
+                warned_user = True
+            # hold back every call on this key, the next attempt included
+            api_manager.scheduler.pause(
+                cfg.openai_api_key, model, retry_after(e) or backoff(attempt)
+            )
+        except (APIError, Timeout) as e:
+            if e.http_status != 502 or attempt > cfg.openai_max_retries:
+                raise
+            RETRIES.inc(error="bad_gateway")
+            time.sleep(backoff(attempt))
+
+
 def batched(iterable, n):
     """Batch data into tuples of length n. The last batch may be shorter."""
     # batched('ABCDEFG', 3) --> ABC DEF G
@@ -219,7 +295,10 @@ def get_ada_embedding(text: str, cfg: Config) -> List[float]:
     else:
         kwargs = {"model": model}
 
-    embedding = create_embedding(text, cfg, **kwargs)
+    with STEP_STAGE_SECONDS.time(stage="embedding"):
+        embedding = embedding_flights.do(
+            (cfg.openai_api_key, model, text), create_embedding, text, cfg, **kwargs
+        )
     return embedding
 
 
@@ -238,23 +317,41 @@ def create_embedding(
     Returns:
         openai.Embedding: The embedding object.
     """
+    chunks = list(
+        chunked_tokens(
+            text,
+            tokenizer_name=cfg.embedding_tokenizer,
+            chunk_length=cfg.embedding_token_limit,
+        )
+    )
+    api_manager = ApiManager()
+    for chunk in chunks:
+        api_manager.scheduler.acquire(
+            cfg.openai_api_key, cfg.embedding_model, len(chunk)
+        )
+    if cfg.openai_async_transport:
+        # every chunk is embedded concurrently
+        embeddings = openai_transport().create_embeddings(
+            chunks, api_key=cfg.openai_api_key, **kwargs
+        )
+    else:
+        embeddings = (
+            openai.Embedding.create(
+                input=[chunk],
+                api_key=cfg.openai_api_key,
+                **kwargs,
+            )
+            for chunk in chunks
+        )
+
     chunk_embeddings = []
     chunk_lengths = []
-    for chunk in chunked_tokens(
-        text,
-        tokenizer_name=cfg.embedding_tokenizer,
-        chunk_length=cfg.embedding_token_limit,
-    ):
-        embedding = openai.Embedding.create(
-            input=[chunk],
-            api_key=cfg.openai_api_key,
-            **kwargs,
-        )
-        api_manager = ApiManager()
+    for chunk, embedding in zip(chunks, embeddings):
         api_manager.update_cost(
             prompt_tokens=embedding.usage.prompt_tokens,
             completion_tokens=0,
             model=cfg.embedding_model,
+            agent_id=cfg.agent_id,
         )
         chunk_embeddings.append(embedding["data"][0]["embedding"])
         chunk_lengths.append(len(chunk))
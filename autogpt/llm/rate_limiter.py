@@ -0,0 +1,155 @@
+"""Requests-per-minute and tokens-per-minute budgets of OpenAI API keys.
+
+Every (API key, model) pair has a token bucket of requests and one of tokens,
+refilled continuously up to a minute's worth. A call reserves one request and
+its estimated tokens before it is sent. Buckets may go into debt, and the debt
+is how long the call waits, so calls on a saturated key queue up in the order
+they arrived instead of being fired into 429s. A 429 still pauses the key and
+model for a while, holding back every call reserved after it.
+"""
+from __future__ import annotations
+
+import hashlib
+import random
+import threading
+import time
+from typing import Optional
+
+from autogpt.cache import LRUCache
+
+
+def jitter(delay: float) -> float:
+    """Returns a random delay between half of delay and delay"""
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def backoff(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Returns the jittered exponential backoff before retry number attempt"""
+    return jitter(min(cap, base * 2**attempt))
+
+
+class TokenBucket:
+    """A bucket refilled at a constant rate, which can go into debt."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Takes amount from the bucket, returning the seconds until it is there"""
+        self.refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def give_back(self, amount: float, now: float) -> None:
+        """Returns amount to the bucket, or takes more from it if negative"""
+        self.refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class KeyBudget:
+    """The budgets of one API key and model."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+
+
+class RequestScheduler:
+    """
+    Delays OpenAI API calls to stay within the rate limits of their key.
+
+    Attributes:
+        requests_per_minute (int): The requests budget of every key and model,
+            0 for no limit.
+        tokens_per_minute (int): The tokens budget of every key and model, 0
+            for no limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 3500,
+        tokens_per_minute: int = 90000,
+        max_keys: int = 10000,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._budgets = LRUCache(max_keys)
+        self._lock = threading.Lock()
+
+    def _budget(self, api_key: Optional[str], model: Optional[str]) -> KeyBudget:
+        # don't keep the keys of users around
+        key = (hashlib.sha256((api_key or "").encode()).hexdigest(), model)
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = KeyBudget(self.requests_per_minute, self.tokens_per_minute)
+            self._budgets.set(key, budget)
+        return budget
+
+    def reserve(
+        self, api_key: Optional[str], model: Optional[str], tokens: int
+    ) -> float:
+        """
+        Reserves a request of tokens on the budget of a key and model.
+
+        Returns:
+            float: The seconds to wait before sending the request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budget(api_key, model)
+            wait = max(0.0, budget.paused_until - now)
+            if budget.requests is not None:
+                wait = max(wait, budget.requests.reserve(1, now))
+            if budget.tokens is not None:
+                wait = max(wait, budget.tokens.reserve(tokens, now))
+            return wait
+
+    def acquire(
+        self, api_key: Optional[str], model: Optional[str], tokens: int
+    ) -> float:
+        """
+        Reserves a request like reserve, then waits until it may be sent.
+
+        Returns:
+            float: The seconds waited.
+        """
+        wait = self.reserve(api_key, model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def settle(
+        self, api_key: Optional[str], model: Optional[str], estimated: int, used: int
+    ) -> None:
+        """Corrects the tokens reserved for a request by the tokens it used"""
+        with self._lock:
+            budget = self._budget(api_key, model)
+            if budget.tokens is not None:
+                budget.tokens.give_back(estimated - used, time.monotonic())
+
+    def pause(
+        self, api_key: Optional[str], model: Optional[str], seconds: float
+    ) -> None:
+        """Holds back the requests of a key and model for seconds"""
+        with self._lock:
+            budget = self._budget(api_key, model)
+            budget.paused_until = max(budget.paused_until, time.monotonic() + seconds)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Returns the seconds the Retry-After header of an API error asks for"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,108 @@
+"""Cache of chat completions, addressed by the content of their request.
+
+Call sites whose completions are deterministic, or close enough, opt in with
+create_chat_completion(..., cache=True). Completions are kept in an LRU cache
+of the process and, with LLM_CACHE_REDIS, in Redis, where every worker shares
+them.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+import orjson
+
+from autogpt.cache import LRUCache
+from autogpt.clients import get_client
+from autogpt.config import Config
+from autogpt.logs import logger
+from autogpt.metrics import LLM_CACHE_LOOKUPS
+
+
+def cache_key(
+    model: Optional[str],
+    messages: list,
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+) -> str:
+    """Returns the hash of everything that decides a chat completion"""
+    request = orjson.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(request).hexdigest()
+
+
+class ResponseCache:
+    """Completions in an LRU cache of the process, then optionally in Redis."""
+
+    def __init__(
+        self,
+        max_size: int = 4096,
+        ttl: Optional[float] = 86400,
+        redis=None,
+        prefix: str = "godmode:llm-cache:",
+    ):
+        self.local = LRUCache(max_size, ttl)
+        self.ttl = ttl
+        self.redis = redis
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the completion cached under key, or None"""
+        value = self.local.get(key)
+        if value is not None:
+            LLM_CACHE_LOOKUPS.inc(result="local")
+            return value
+
+        if self.redis is not None:
+            try:
+                value = self.redis.get(self.prefix + key)
+            except Exception as e:
+                logger.debug(f"LLM cache read failed: {e}")
+            if value is not None:
+                value = value.decode()
+                self.local.set(key, value)
+                LLM_CACHE_LOOKUPS.inc(result="redis")
+                return value
+
+        LLM_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """Caches a completion under key, in every tier"""
+        self.local.set(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.set(
+                    self.prefix + key,
+                    value,
+                    ex=int(self.ttl) if self.ttl is not None else None,
+                )
+            except Exception as e:
+                logger.debug(f"LLM cache write failed: {e}")
+
+
+def _create_response_cache() -> ResponseCache:
+    cfg = Config()
+    redis = None
+    if cfg.llm_cache_redis and cfg.redis_host is not None:
+        import redis as redis_client
+
+        redis = redis_client.Redis(
+            host=cfg.redis_host,
+            port=cfg.redis_port,
+            password=cfg.redis_password,
+            socket_timeout=1,
+        )
+    return ResponseCache(cfg.llm_cache_size, cfg.llm_cache_ttl, redis)
+
+
+def get_response_cache() -> ResponseCache:
+    """The response cache of the process"""
+    return get_client("llm_response_cache", _create_response_cache)
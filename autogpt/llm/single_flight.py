@@ -0,0 +1,57 @@
+"""Coalescing of identical OpenAI API calls in flight at the same time.
+
+Threads of a worker often make the very same call at once, like two agents
+summarizing the same page. The first of them makes the call, and the others
+wait for it and share its result, or its error, instead of paying for their
+own call.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable, TypeVar
+
+from autogpt.metrics import LLM_DEDUPLICATED
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+
+    Attributes:
+        name (str): The name the deduplicated calls are counted under.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Calls fn with args and kwargs, unless a call with the same key is in
+        flight, in which case that call's result is returned, or its error
+        raised, once it is done.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            LLM_DEDUPLICATED.inc(call=self.name)
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -1,19 +1,101 @@
-"""Functions for counting the number of tokens in a message or string."""
+"""Functions for counting the number of tokens in a message or string.
+
+Token counts are cached by encoding and a hash of the text, so the messages of
+a history that grows by a few messages per step are only tokenized once, and
+the texts that still need tokenizing are encoded together with encode_batch.
+"""
 from __future__ import annotations
 
+import functools
+import hashlib
 from typing import List
 
 import tiktoken
 
+from autogpt.cache import LRUCache
+from autogpt.clients import get_client
 from autogpt.llm.base import Message
-from autogpt.logs import logger
 
+# models whose tokens are counted like those of a snapshot of theirs
+MODEL_ALIASES = {
+    # !Note: gpt-3.5-turbo may change over time.
+    # Returning num tokens assuming gpt-3.5-turbo-0301.
+    "gpt-3.5-turbo": "gpt-3.5-turbo-0301",
+    # !Note: gpt-4 may change over time. Returning num tokens assuming gpt-4-0314.
+    "gpt-4": "gpt-4-0314",
+}
 
-def count_message_tokens(
+# the tokens every message adds, and those a name adds, per model
+MESSAGE_FORMATS = {
+    # every message follows <|start|>{role/name}\n{content}<|end|>\n,
+    # and if there's a name, the role is omitted
+    "gpt-3.5-turbo-0301": (4, -1),
+    "gpt-4-0314": (3, 1),
+}
+
+# every reply is primed with <|start|>assistant<|message|>
+REPLY_PRIMING_TOKENS = 3
+
+TOKEN_COUNT_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """
+    Returns the encoding of a model, looked up once per model.
+
+    Raises:
+        KeyError: If tiktoken doesn't know the model.
+    """
+    return tiktoken.encoding_for_model(model)
+
+
+def _create_token_counts() -> LRUCache:
+    return LRUCache(TOKEN_COUNT_CACHE_SIZE)
+
+
+def _token_counts() -> LRUCache:
+    """The token counts of the process, by encoding and hash of the text"""
+    return get_client("token_counts", _create_token_counts)
+
+
+def count_tokens(texts: List[str], model: str) -> List[int]:
+    """
+    Returns the number of tokens of each text, tokenizing the texts that aren't
+    in the cache together.
+
+    Args:
+        texts (list): The texts to count the tokens of.
+        model (str): The name of the model to use for tokenization.
+
+    Returns:
+        list: The number of tokens of each text.
+    """
+    encoding = get_encoding(model)
+    cache = _token_counts()
+    keys = [
+        (encoding.name, hashlib.blake2b(text.encode(), digest_size=16).digest())
+        for text in texts
+    ]
+    counts = [cache.get(key) for key in keys]
+    missing = [i for i, count in enumerate(counts) if count is None]
+    if missing:
+        if len(missing) == 1:
+            # encode_batch starts a thread pool, which isn't worth it for one text
+            tokens = [encoding.encode(texts[missing[0]])]
+        else:
+            tokens = encoding.encode_batch([texts[i] for i in missing])
+        for i, text_tokens in zip(missing, tokens):
+            counts[i] = len(text_tokens)
+            cache.set(keys[i], counts[i])
+    return counts
+
+
+def count_each_message_tokens(
     messages: List[Message], model: str = "gpt-3.5-turbo-0301"
-) -> int:
+) -> List[int]:
     """
-    Returns the number of tokens used by a list of messages.
+    Returns the number of tokens each message of a list adds to a prompt.
 
     Args:
         messages (list): A list of messages, each of which is a dictionary
@@ -22,43 +104,49 @@ def count_message_tokens(
             Defaults to "gpt-3.5-turbo-0301".
 
     Returns:
-        int: The number of tokens used by the list of messages.
+        list: The number of tokens of each message, without the 3 tokens that
+            prime the reply.
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.warn("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
-        # !Note: gpt-3.5-turbo may change over time.
-        # Returning num tokens assuming gpt-3.5-turbo-0301.")
-        return count_message_tokens(messages, model="gpt-3.5-turbo-0301")
-    elif model == "gpt-4":
-        # !Note: gpt-4 may change over time. Returning num tokens assuming gpt-4-0314.")
-        return count_message_tokens(messages, model="gpt-4-0314")
-    elif model == "gpt-3.5-turbo-0301":
-        tokens_per_message = (
-            4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        )
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4-0314":
-        tokens_per_message = 3
-        tokens_per_name = 1
-    else:
+    model = MODEL_ALIASES.get(model, model)
+    if model not in MESSAGE_FORMATS:
         raise NotImplementedError(
             f"num_tokens_from_messages() is not implemented for model {model}.\n"
             " See https://github.com/openai/openai-python/blob/main/chatml.md for"
             " information on how messages are converted to tokens."
         )
-    num_tokens = 0
+    tokens_per_message, tokens_per_name = MESSAGE_FORMATS[model]
+    value_tokens = iter(
+        count_tokens(
+            [value for message in messages for value in message.values()], model
+        )
+    )
+    counts = []
     for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+        num_tokens = tokens_per_message
+        for key in message:
+            num_tokens += next(value_tokens)
             if key == "name":
                 num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+        counts.append(num_tokens)
+    return counts
+
+
+def count_message_tokens(
+    messages: List[Message], model: str = "gpt-3.5-turbo-0301"
+) -> int:
+    """
+    Returns the number of tokens used by a list of messages.
+
+    Args:
+        messages (list): A list of messages, each of which is a dictionary
+            containing the role and content of the message.
+        model (str): The name of the model to use for tokenization.
+            Defaults to "gpt-3.5-turbo-0301".
+
+    Returns:
+        int: The number of tokens used by the list of messages.
+    """
+    return sum(count_each_message_tokens(messages, model)) + REPLY_PRIMING_TOKENS
 
 
 def count_string_tokens(string: str, model_name: str) -> int:
@@ -72,5 +160,4 @@ def count_string_tokens(string: str, model_name: str) -> int:
     Returns:
         int: The number of tokens in the text string.
     """
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(string))
+    return len(get_encoding(model_name).encode(string))
@@ -0,0 +1,138 @@
+"""Asyncio transport of the OpenAI API, with pooled keep-alive connections.
+
+The transport runs an event loop on a daemon thread of the process. Its
+coroutines share one aiohttp session, and with it one pool of keep-alive
+connections, per API base URL. The API key still goes in the headers of every
+request, so callers with different keys reuse the same TLS connections. A
+semaphore bounds the calls in flight, so the process can overlap many
+completions without a thread per call.
+
+The sync wrappers run the coroutines on the loop of the transport and block
+the calling thread until they finish. They must not be called from the loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Coroutine, Iterator, TypeVar
+
+import aiohttp
+import openai
+
+T = TypeVar("T")
+
+
+class OpenAITransport:
+    """Calls the OpenAI API from a shared event loop and connection pools."""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_concurrency: int = 64,
+        keepalive_timeout: float = 60.0,
+    ):
+        """
+        Args:
+            max_connections (int): Most open connections per API base URL.
+            max_concurrency (int): Most calls in flight, streams included.
+            keepalive_timeout (float): Seconds an idle connection is kept open.
+        """
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.sessions: dict[str, aiohttp.ClientSession] = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="openai-transport", daemon=True
+        )
+        self.thread.start()
+
+    def session(self, api_base: str) -> aiohttp.ClientSession:
+        """Returns the session of an API base URL, only from the loop"""
+        session = self.sessions.get(api_base)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+            )
+            self.sessions[api_base] = session
+        return session
+
+    @contextmanager
+    def using_session(self, kwargs: dict) -> Iterator[None]:
+        # openai reads the session of a request from this context variable
+        token = openai.aiosession.set(
+            self.session(kwargs.get("api_base") or openai.api_base)
+        )
+        try:
+            yield
+        finally:
+            openai.aiosession.reset(token)
+
+    async def acreate_chat_completion(self, **kwargs) -> Any:
+        """Creates a chat completion, with the arguments of ChatCompletion.create"""
+        async with self.semaphore:
+            with self.using_session(kwargs):
+                return await openai.ChatCompletion.acreate(**kwargs)
+
+    async def astream_chat_completion(self, **kwargs) -> AsyncIterator[Any]:
+        """Yields the chunks of a streamed chat completion"""
+        async with self.semaphore:
+            with self.using_session(kwargs):
+                chunks = await openai.ChatCompletion.acreate(stream=True, **kwargs)
+            async for chunk in chunks:
+                yield chunk
+
+    async def acreate_embeddings(self, inputs: list[str], **kwargs) -> list[Any]:
+        """Creates the embedding of every input, with one request per input
+        and all of them in flight at once"""
+
+        async def create(text: str):
+            async with self.semaphore:
+                with self.using_session(kwargs):
+                    return await openai.Embedding.acreate(input=[text], **kwargs)
+
+        return list(await asyncio.gather(*(create(text) for text in inputs)))
+
+    def submit(self, coroutine: Coroutine[Any, Any, T]) -> Future[T]:
+        """Starts a coroutine on the loop. Cancelling the future cancels it."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """Runs a coroutine on the loop, blocking until it returns"""
+        return self.submit(coroutine).result()
+
+    def iterate(self, generator: AsyncIterator[T]) -> Iterator[T]:
+        """Iterates an async generator on the loop, one item at a time"""
+        try:
+            while True:
+                try:
+                    yield self.run(generator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(generator.aclose())
+
+    def create_chat_completion(self, **kwargs) -> Any:
+        return self.run(self.acreate_chat_completion(**kwargs))
+
+    def stream_chat_completion(self, **kwargs) -> Iterator[Any]:
+        return self.iterate(self.astream_chat_completion(**kwargs))
+
+    def create_embeddings(self, inputs: list[str], **kwargs) -> list[Any]:
+        return self.run(self.acreate_embeddings(inputs, **kwargs))
+
+    async def aclose(self) -> None:
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+    def close(self) -> None:
+        """Closes every session and stops the loop"""
+        self.run(self.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,85 @@
+"""Token usage and cost of each agent session.
+
+Every session has its own ledger, which the OpenAI calls made for the agent add
+to, so an agent's budget is only ever compared with what that agent spent.
+Ledgers are kept per worker and saved with the session. A session loaded by
+another worker merges what was saved into that worker's ledger.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Optional
+
+from autogpt.cache import LRUCache
+
+
+class UsageLedger:
+    """
+    The usage of one session. Each ledger has its own lock, so the requests of
+    different sessions never wait for each other.
+
+    Attributes:
+        prompt_tokens (int): The prompt tokens used by the session.
+        completion_tokens (int): The completion tokens used by the session.
+        cost (float): The cost of the session in dollars.
+        budget (float): The dollars the session may spend, 0.0 for no limit.
+    """
+
+    def __init__(self, budget: float = 0.0):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.budget = budget
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+
+    def merge(self, usage: Optional[dict]) -> None:
+        """Merges a saved snapshot of the ledger. Usage only ever grows, so the
+        larger of each count is the most recent one."""
+        if not usage:
+            return
+        with self._lock:
+            self.prompt_tokens = max(self.prompt_tokens, usage.get("prompt_tokens", 0))
+            self.completion_tokens = max(
+                self.completion_tokens, usage.get("completion_tokens", 0)
+            )
+            self.cost = max(self.cost, usage.get("cost", 0.0))
+
+    def snapshot(self) -> dict:
+        """The usage to save with the session"""
+        with self._lock:
+            return {
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost": self.cost,
+            }
+
+    def remaining_budget(self) -> Optional[float]:
+        """The dollars left to spend, or None without a budget"""
+        if self.budget <= 0.0:
+            return None
+        return max(0.0, self.budget - self.cost)
+
+
+class UsageLedgers:
+    """The ledgers of the sessions a worker served recently."""
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 3600):
+        self._ledgers = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+
+    def get(self, agent_id: str) -> UsageLedger:
+        """Returns the ledger of a session, creating it if needed"""
+        ledger = self._ledgers.get(agent_id)
+        if ledger is None:
+            with self._lock:
+                ledger = self._ledgers.get(agent_id)
+                if ledger is None:
+                    ledger = UsageLedger()
+                    self._ledgers.set(agent_id, ledger)
+        return ledger
@@ -1,23 +1,14 @@
-from pinecone import Pinecone
+import pinecone  # noqa: F401 - fails the import without the pinecone package
 from autogpt.api_log import CRITICAL, ERROR, print_log
 
+from autogpt.clients import pinecone_client
 from autogpt.llm import get_ada_embedding
 from autogpt.memory.base import MemoryProvider
+from autogpt.metrics import STEP_STAGE_SECONDS
 from autogpt.config import Config
 
 global_config = Config()
 
-pinecone_api_key = global_config.pinecone_api_key
-pinecone_region = global_config.pinecone_region
-
-if pinecone_api_key:
-    if pinecone_region:
-        pinecone = Pinecone(api_key=pinecone_api_key, region=pinecone_region)
-    else:
-        pinecone = Pinecone(api_key=pinecone_api_key)
-else:
-    print("Pinecone API key and region not set. " "Please set them in the config file.")
-
 
 class PineconeMemory(MemoryProvider):
     cfg: Config
@@ -38,7 +29,7 @@ class PineconeMemory(MemoryProvider):
         #     pinecone.create_index(
         #         table_name, dimension=dimension, metric=metric, pod_type=pod_type
         #     )
-        self.index = pinecone.Index(table_name)
+        self.index = pinecone_client().Index(table_name)
 
     def add(self, data):
         vector = get_ada_embedding(data, self.cfg)
@@ -46,10 +37,11 @@ class PineconeMemory(MemoryProvider):
         data = [(str(self.vec_num), vector, {"raw_text": data})]
         namespace = self.cfg.agent_id
         try:
-            self.index.upsert(
-                data,
-                namespace=namespace,
-            )
+            with STEP_STAGE_SECONDS.time(stage="vector_upsert"):
+                self.index.upsert(
+                    data,
+                    namespace=namespace,
+                )
         except Exception as e:
             print_log("Pinecone upsert error", severity=CRITICAL, errorMsg=e, pine_data=data, pine_namespace=namespace)
             raise e
@@ -74,12 +66,13 @@ class PineconeMemory(MemoryProvider):
 
         namespace = self.cfg.agent_id
         try:
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=num_relevant,
-                include_metadata=True,
-                namespace=namespace,
-            )
+            with STEP_STAGE_SECONDS.time(stage="vector_query"):
+                results = self.index.query(
+                    vector=query_embedding,
+                    top_k=num_relevant,
+                    include_metadata=True,
+                    namespace=namespace,
+                )
         except Exception as e:
             print_log("Pinecone query error", severity=CRITICAL, errorMsg=e, pine_query=query_embedding, pine_namespace=namespace)
             raise e
@@ -0,0 +1,185 @@
+"""Running summaries of the agents, updated in the background.
+
+Summarizing the messages trimmed from the context takes a chat completion, which
+was made before every step's own completion, even when nothing had been trimmed.
+Instead, a step now starts an update of its agent's summary once at least
+SUMMARY_BATCH_SIZE events were trimmed since the summary, on a thread pool of
+the worker, and puts the last summary completed in its context.
+
+A summary is saved with the session together with its cursor: the number of
+messages of the history it covers, counted from the very first message. The
+history trimmed from the session doesn't move the cursor, so a step served by
+another worker continues from the saved summary.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from autogpt.api_log import print_log
+from autogpt.cache import LRUCache
+from autogpt.clients import get_client
+from autogpt.config import Config
+from autogpt.llm.base import Message
+from autogpt.metrics import SUMMARY_UPDATES
+
+# Initial memory necessary to avoid hallucination
+INITIAL_SUMMARY = "I was created."
+# The prefix of the summary in the context, which sessions from before the
+# cursor saved with the summary
+SUMMARY_PREFIX = "This reminds you of these events from your past: \n"
+
+
+class RunningSummary:
+    """
+    The running summary of one agent.
+
+    Attributes:
+        text (str): The last summary completed.
+        cursor (int): The number of messages of the history the summary covers.
+        update (Future): The last update of the summary started, if any.
+    """
+
+    def __init__(self):
+        self.text = INITIAL_SUMMARY
+        self.cursor = 0
+        self.update: Optional[Future] = None
+        self._lock = threading.Lock()
+
+    def merge(self, text: Optional[str], cursor: int) -> None:
+        """Takes the summary saved with the session, unless this one covers more"""
+        if not text:
+            return
+        with self._lock:
+            if cursor >= self.cursor:
+                self.text = text.removeprefix(SUMMARY_PREFIX)
+                self.cursor = cursor
+
+    def snapshot(self) -> Tuple[str, int]:
+        """The summary and cursor to save with the session"""
+        with self._lock:
+            return self.text, self.cursor
+
+    def start(
+        self,
+        executor: Executor,
+        since: int,
+        cursor: int,
+        summarize: Callable[[str], str],
+    ) -> Optional[Future]:
+        """
+        Starts updating the summary with the messages from since to cursor,
+        unless an update is running or the summary no longer ends at since.
+
+        Args:
+            executor (Executor): The executor to run the update on.
+            since (int): The cursor the new events start at.
+            cursor (int): The cursor of the updated summary.
+            summarize (Callable): Returns the updated summary, given the current one.
+
+        Returns:
+            Future: The update, or None if it wasn't started.
+        """
+        with self._lock:
+            if self.cursor != since or (
+                self.update is not None and not self.update.done()
+            ):
+                return None
+            self.update = executor.submit(self._update, self.text, cursor, summarize)
+            return self.update
+
+    def _update(self, text: str, cursor: int, summarize: Callable[[str], str]):
+        try:
+            text = summarize(text)
+        except Exception as e:
+            print_log(
+                "Error updating summary memory:", severity="warning", errorMsg=str(e)
+            )
+            return
+        with self._lock:
+            if cursor > self.cursor:
+                self.text = text
+                self.cursor = cursor
+
+
+class RunningSummaries:
+    """The running summaries of the agents a worker served recently."""
+
+    def __init__(self, max_workers: int = 4, max_size: int = 10000, ttl: float = 3600):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="running-summary"
+        )
+        self._summaries = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+
+    def get(self, agent_id: str) -> RunningSummary:
+        """Returns the running summary of an agent, creating it if needed"""
+        summary = self._summaries.get(agent_id)
+        if summary is None:
+            with self._lock:
+                summary = self._summaries.get(agent_id)
+                if summary is None:
+                    summary = RunningSummary()
+                    self._summaries.set(agent_id, summary)
+        return summary
+
+    def update(
+        self,
+        agent,
+        full_message_history: List[Message],
+        context_start: int,
+        cfg: Config,
+    ) -> Tuple[str, int]:
+        """
+        Starts updating the summary of an agent with the messages trimmed from
+        its context, if enough of them were trimmed since the summary.
+
+        Args:
+            agent (Agent): The agent, with the summary and cursor of its session.
+            full_message_history (list): The history of the agent, which starts
+                at the agent's history_offset.
+            context_start (int): The index of the oldest message in the context.
+            cfg (Config): The config of the step.
+
+        Returns:
+            tuple: The last summary completed and its cursor.
+        """
+        from autogpt.memory_management.summary_memory import (
+            get_newly_trimmed_messages,
+            summary_events,
+            update_running_summary,
+        )
+
+        summary = self.get(agent.agent_id)
+        summary.merge(agent.summary_memory, agent.summary_cursor)
+        text, cursor = summary.snapshot()
+        newly_trimmed_messages, last_memory_index = get_newly_trimmed_messages(
+            full_message_history=full_message_history,
+            context_start=context_start,
+            last_memory_index=max(cursor - agent.history_offset, 0) - 1,
+        )
+        new_events = summary_events(newly_trimmed_messages)
+        if len(new_events) < max(cfg.summary_batch_size, 1):
+            SUMMARY_UPDATES.inc(result="batching")
+        elif summary.start(
+            self.executor,
+            cursor,
+            agent.history_offset + last_memory_index + 1,
+            lambda current_memory: update_running_summary(
+                agent, current_memory=current_memory, new_events=new_events, cfg=cfg
+            ),
+        ):
+            SUMMARY_UPDATES.inc(result="started")
+        else:
+            SUMMARY_UPDATES.inc(result="busy")
+        return text, cursor
+
+
+def _create_running_summaries() -> RunningSummaries:
+    return RunningSummaries(max_workers=Config().summary_workers)
+
+
+def get_running_summaries() -> RunningSummaries:
+    """The running summaries of the process"""
+    return get_client("running_summaries", _create_running_summaries)
@@ -1,4 +1,3 @@
-import copy
 import json
 from typing import Dict, List, Tuple
 
@@ -6,44 +5,77 @@ from autogpt.agent import Agent
 from autogpt.config import Config
 from autogpt.llm.llm_utils import create_chat_completion
 from autogpt.log_cycle.log_cycle import PROMPT_SUMMARY_FILE_NAME, SUMMARY_FILE_NAME
+from autogpt.memory_management.running_summary import SUMMARY_PREFIX
 
 
 def get_newly_trimmed_messages(
     full_message_history: List[Dict[str, str]],
-    current_context: List[Dict[str, str]],
+    context_start: int,
     last_memory_index: int,
 ) -> Tuple[List[Dict[str, str]], int]:
     """
-    This function returns a list of dictionaries contained in full_message_history
-    with an index higher than prev_index that are absent from current_context.
+    This function returns the messages of full_message_history with an index higher
+    than last_memory_index that were trimmed from the current context, which holds
+    the messages from context_start on.
 
     Args:
         full_message_history (list): A list of dictionaries representing the full message history.
-        current_context (list): A list of dictionaries representing the current context.
+        context_start (int): The index of the oldest message in the current context.
         last_memory_index (int): An integer representing the previous index.
 
     Returns:
-        list: A list of dictionaries that are in full_message_history with an index higher than last_memory_index and absent from current_context.
+        list: A list of dictionaries that are in full_message_history with an index higher than last_memory_index and lower than context_start.
         int: The new index value for use in the next loop.
     """
-    # Select messages in full_message_history with an index higher than last_memory_index
+    # Messages too long to summarize are skipped
     new_messages = [
-        msg for i, msg in enumerate(full_message_history) if i > last_memory_index
+        msg
+        for msg in full_message_history[last_memory_index + 1 : context_start]
+        if len(msg["content"]) < 4000
     ]
 
-    # Remove messages that are already present in current_context
-    new_messages_not_in_context = [
-        msg for msg in new_messages if msg not in current_context and len(msg["content"]) < 4000
-    ]
+    # The index of the last message processed
+    new_index = max(last_memory_index, context_start - 1)
+
+    return new_messages, new_index
+
+
+def summary_events(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    This function turns trimmed messages into the events of the running summary: user
+    messages are dropped, "assistant" becomes "you" (which produces much better first
+    person past tense results) and the thoughts are removed from the assistant's replies.
+
+    Args:
+        messages (List[Dict]): The messages trimmed from the context.
 
+    Returns:
+        List[Dict]: The events to add to the summary, as new dictionaries.
+    """
+    events = []
+    for message in messages:
+        role = message["role"].lower()
+        if role == "user":
+            continue
+        content = message["content"]
+        if role == "assistant":
+            role = "you"
+            try:
+                content_dict = json.loads(content)
+                if isinstance(content_dict, dict) and "thoughts" in content_dict:
+                    del content_dict["thoughts"]
+                    content = json.dumps(content_dict)
+            except json.JSONDecodeError:
+                pass
+        elif role == "system":
+            role = "your computer"
+        events.append({"role": role, "content": content})
+    return events
 
-    # Find the index of the last message processed
-    new_index = last_memory_index
-    if new_messages_not_in_context:
-        last_message = new_messages_not_in_context[-1]
-        new_index = full_message_history.index(last_message)
 
-    return new_messages_not_in_context, new_index
+def summary_message(summary: str) -> Dict[str, str]:
+    """Returns the message that puts the running summary in the context"""
+    return {"role": "system", "content": f"{SUMMARY_PREFIX}{summary}"}
 
 
 def update_running_summary(
@@ -51,48 +83,21 @@ def update_running_summary(
 ) -> str:
     """
     This function takes a list of dictionaries representing new events and combines them with the current summary,
-    focusing on key and potentially important information to remember. The updated summary is returned in a message
-    formatted in the 1st person past tense.
+    focusing on key and potentially important information to remember. The updated summary is returned
+    in the 1st person past tense.
 
     Args:
-        new_events (List[Dict]): A list of dictionaries containing the latest events to be added to the summary.
+        current_memory (str): The summary so far.
+        new_events (List[Dict]): The latest events to be added to the summary, see summary_events.
 
     Returns:
-        str: A message containing the updated summary of actions, formatted in the 1st person past tense.
+        str: The updated summary of actions, formatted in the 1st person past tense.
 
     Example:
-        new_events = [{"event": "entered the kitchen."}, {"event": "found a scrawled note with the number 7"}]
-        update_running_summary(new_events)
-        # Returns: "This reminds you of these events from your past: \nI entered the kitchen and found a scrawled note saying 7."
+        new_events = [{"role": "you", "content": "entered the kitchen."}, {"role": "your computer", "content": "found a scrawled note with the number 7"}]
+        update_running_summary(agent, "I was created.", new_events, cfg)
+        # Returns: "I entered the kitchen and found a scrawled note saying 7."
     """
-    # Create a copy of the new_events list to prevent modifying the original list
-    new_events = copy.deepcopy(new_events)
-
-    # Replace "assistant" with "you". This produces much better first person past tense results.
-    for event in new_events:
-        try:
-            if event["role"].lower() == "assistant":
-                event["role"] = "you"
-
-                # Remove "thoughts" dictionary from "content"
-                content_dict = json.loads(event["content"])
-                if "thoughts" in content_dict:
-                    del content_dict["thoughts"]
-                event["content"] = json.dumps(content_dict)
-
-            elif event["role"].lower() == "system":
-                event["role"] = "your computer"
-
-            # Delete all user messages
-            elif event["role"] == "user":
-                new_events.remove(event)
-        except Exception:
-            pass
-
-    # This can happen at any point during execution, not just the beginning
-    if len(new_events) == 0:
-        new_events = "Nothing new happened."
-
     prompt = f'''Your task is to create a concise running summary of actions and information results in the provided text, focusing on key and potentially important information to remember.
 
 You will receive the current summary and the your latest actions. Combine them, adding relevant key information from the latest development in 1st person past tense and keeping the summary concise.
@@ -132,9 +137,4 @@ Latest Development:
         SUMMARY_FILE_NAME,
     )
 
-    message_to_return = {
-        "role": "system",
-        "content": f"This reminds you of these events from your past: \n{current_memory}",
-    }
-
-    return message_to_return
+    return current_memory
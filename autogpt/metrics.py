@@ -0,0 +1,192 @@
+"""Latency histograms and counters of the api, exported in the Prometheus text format.
+
+The metrics are prometheus_client metrics behind the api's own labelled calls.
+Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set before the app is imported (see
+gunicorn.conf.py), so every worker writes its samples there and /metrics adds
+up the samples of all of them, whichever worker serves it.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry
+from prometheus_client import Counter as PrometheusCounter
+from prometheus_client import Histogram as PrometheusHistogram
+from prometheus_client import generate_latest, multiprocess
+
+# Seconds, from fast cache hits up to slow chat completions
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    25.0,
+    60.0,
+)
+
+
+class Metric:
+    """A metric with a value for every combination of its labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labelvalues(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _sample(self, sample_name: str, labels: dict) -> float:
+        """The value of a sample of this process"""
+        value = REGISTRY.get_sample_value(
+            sample_name, dict(zip(self.labelnames, self._labelvalues(labels)))
+        )
+        return value or 0
+
+
+class Counter(Metric):
+    """A value that only goes up, like a number of tokens."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # prometheus_client adds the _total suffix to the samples itself
+        self._counter = PrometheusCounter(
+            name.removesuffix("_total"), documentation, self.labelnames
+        )
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Adds amount to the value for the given labels."""
+        if self.labelnames:
+            self._counter.labels(*self._labelvalues(labels)).inc(amount)
+        else:
+            self._counter.inc(amount)
+
+    def value(self, **labels) -> float:
+        return self._sample(f"{self.name.removesuffix('_total')}_total", labels)
+
+
+class Histogram(Metric):
+    """The distribution of a duration, counted in cumulative buckets."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._histogram = PrometheusHistogram(
+            name, documentation, self.labelnames, buckets=self.buckets
+        )
+
+    def observe(self, value: float, **labels) -> None:
+        """Records a value for the given labels."""
+        if self.labelnames:
+            self._histogram.labels(*self._labelvalues(labels)).observe(value)
+        else:
+            self._histogram.observe(value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Records how long the block takes, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return int(self._sample(f"{self.name}_count", labels))
+
+
+def render() -> bytes:
+    """
+    Returns every metric in the Prometheus text format, summed over the
+    workers in multiprocess mode, or of this process otherwise.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+STEP_STAGE_SECONDS = Histogram(
+    "godmode_step_stage_seconds",
+    "Time spent in each stage of an agent step.",
+    ["stage"],
+)
+COMMAND_SECONDS = Histogram(
+    "godmode_command_seconds",
+    "Time spent executing a command, by command name.",
+    ["command"],
+)
+REQUEST_SECONDS = Histogram(
+    "godmode_request_seconds",
+    "Time until the response body of a request is fully sent, by route.",
+    ["method", "route", "status"],
+)
+TOKENS = Counter(
+    "godmode_tokens_total",
+    "Tokens used by OpenAI API calls.",
+    ["model", "kind"],
+)
+RETRIES = Counter(
+    "godmode_openai_retries_total",
+    "OpenAI API calls retried, by error.",
+    ["error"],
+)
+RATE_LIMIT_HITS = Counter(
+    "godmode_rate_limit_hits_total",
+    "Requests rejected by a rate limit, ours (api) or OpenAI's (openai).",
+    ["source"],
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "godmode_llm_cache_lookups_total",
+    "Lookups of the chat completion cache, by the tier that answered them (local,"
+    " redis) or miss.",
+    ["result"],
+)
+SPECULATIVE_COMMANDS = Counter(
+    "godmode_speculative_commands_total",
+    "Commands started before the assistant's reply was complete (started), and"
+    " whether their result was there when the command was executed (hit, miss).",
+    ["result"],
+)
+LLM_HEDGES = Counter(
+    "godmode_llm_hedges_total",
+    "Chat completions requested a second time for being slow, by the call that"
+    " answered first (primary, backup).",
+    ["model", "winner"],
+)
+LLM_HEDGE_COST = Counter(
+    "godmode_llm_hedge_cost_dollars_total",
+    "Estimated dollars spent on the chat completions that lost a hedge.",
+    ["model"],
+)
+LLM_DEDUPLICATED = Counter(
+    "godmode_llm_deduplicated_total",
+    "OpenAI API calls not sent because an identical call was already in flight,"
+    " by call (chat_completion, embedding).",
+    ["call"],
+)
+SUMMARY_UPDATES = Counter(
+    "godmode_summary_updates_total",
+    "Steps that started an update of their agent's running summary (started), or"
+    " didn't because too few events were trimmed (batching) or one was running"
+    " (busy).",
+    ["result"],
+)
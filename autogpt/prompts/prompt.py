@@ -67,6 +67,14 @@ def build_default_prompt_generator() -> PromptGenerator:
         " the least number of steps."
     )
     prompt_generator.add_performance_evaluation("Write all code to a file.")
+
+    if global_config.speculative_execution:
+        # Ask for the command first, so that it can be started while the
+        # thoughts are still being generated
+        prompt_generator.response_format = {
+            "command": prompt_generator.response_format["command"],
+            "thoughts": prompt_generator.response_format["thoughts"],
+        }
     return prompt_generator
 
 
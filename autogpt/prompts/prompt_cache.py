@@ -0,0 +1,120 @@
+"""Process-wide command registry snapshot and memoized system prompts for the API."""
+from __future__ import annotations
+
+import functools
+import threading
+
+from autogpt.commands.command import CommandRegistry
+from autogpt.config.ai_config import AIConfig
+from autogpt.llm.chat import create_chat_message
+from autogpt.llm.token_counter import count_message_tokens
+from autogpt.prompts.generator import PromptGenerator
+from autogpt.prompts.prompt import build_default_prompt_generator
+
+API_COMMAND_CATEGORIES = [
+    # "autogpt.commands.analyze_code",
+    # "autogpt.commands.audio_text",
+    # "autogpt.commands.execute_code",
+    # "autogpt.commands.file_operations",
+    "autogpt.commands.firestore_operations",
+    # "autogpt.commands.git_operations",
+    "autogpt.commands.google_search",
+    # "autogpt.commands.image_gen",
+    # "autogpt.commands.improve_code",
+    # "autogpt.commands.twitter",
+    # "autogpt.commands.web_selenium",
+    # "autogpt.commands.write_tests",
+    "autogpt.app",
+    "autogpt.commands.task_statuses",
+]
+
+_registry: CommandRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_command_registry() -> CommandRegistry:
+    """
+    Returns the frozen command registry shared by every request of this process.
+    The command categories are imported only once, on first use.
+
+    Returns:
+        CommandRegistry: An immutable snapshot of the API command registry.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = CommandRegistry()
+                for command_category in API_COMMAND_CATEGORIES:
+                    registry.import_commands(command_category)
+                _registry = registry.freeze()
+    return _registry
+
+
+@functools.lru_cache(maxsize=1024)
+def _construct_system_prompt(
+    ai_name: str,
+    ai_role: str,
+    ai_goals: tuple[str, ...],
+    api_budget: float,
+    registry_version: int,
+) -> tuple[str, PromptGenerator]:
+    ai_config = AIConfig(
+        ai_name=ai_name,
+        ai_role=ai_role,
+        ai_goals=list(ai_goals),
+        api_budget=api_budget,
+    )
+    ai_config.command_registry = get_command_registry()
+    system_prompt = ai_config.construct_full_prompt(build_default_prompt_generator())
+    return system_prompt, ai_config.prompt_generator
+
+
+@functools.lru_cache(maxsize=1024)
+def _count_system_prompt_tokens(
+    ai_name: str,
+    ai_role: str,
+    ai_goals: tuple[str, ...],
+    api_budget: float,
+    registry_version: int,
+    model: str,
+) -> int:
+    system_prompt, _ = _construct_system_prompt(
+        ai_name, ai_role, ai_goals, api_budget, registry_version
+    )
+    return count_message_tokens([create_chat_message("system", system_prompt)], model)
+
+
+def get_system_prompt(
+    ai_config: AIConfig, model: str
+) -> tuple[str, PromptGenerator, int | None]:
+    """
+    Returns the system prompt for an agent, memoized by its name, role, goals,
+    budget and the version of the command registry.
+
+    The returned PromptGenerator is shared between requests and must not be
+    modified.
+
+    Args:
+        ai_config (AIConfig): The configuration of the agent.
+        model (str): The model the prompt tokens are counted for.
+
+    Returns:
+        tuple: The system prompt, its PromptGenerator and its token count, which
+            is None if the model has no known tokenizer.
+    """
+    key = (
+        ai_config.ai_name,
+        ai_config.ai_role,
+        tuple(ai_config.ai_goals),
+        ai_config.api_budget,
+        get_command_registry().version,
+    )
+    system_prompt, prompt_generator = _construct_system_prompt(*key)
+    try:
+        prompt_tokens = _count_system_prompt_tokens(*key, model)
+    except (KeyError, NotImplementedError):
+        prompt_tokens = None
+    ai_config.command_registry = get_command_registry()
+    ai_config.prompt_generator = prompt_generator
+    return system_prompt, prompt_generator, prompt_tokens
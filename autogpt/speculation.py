@@ -0,0 +1,99 @@
+"""Speculative execution of the idempotent commands the assistant chooses.
+
+With SPECULATIVE_EXECUTION, read-only commands such as google or
+get_text_summary are started as soon as the command object of a streamed reply
+closes, while the rest of the reply is still being generated. Their results are
+kept for a while under the agent, command and arguments, and the next step
+takes the result from there when it executes that very command, instead of
+running it again. A command whose arguments were changed in between runs as
+usual.
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+import orjson
+
+from autogpt.cache import LRUCache
+from autogpt.clients import get_client
+from autogpt.config import Config
+from autogpt.metrics import SPECULATIVE_COMMANDS
+
+
+class SpeculativeCommands:
+    """
+    A bounded thread pool running commands ahead of time, and their results.
+
+    Attributes:
+        results (LRUCache): The future of each command started, by agent,
+            command and arguments, until it is taken or expires.
+    """
+
+    def __init__(self, max_workers: int = 8, ttl: float = 300, max_size: int = 1024):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="speculative-command"
+        )
+        self.results = LRUCache(max_size, ttl)
+
+    @staticmethod
+    def key(agent_id: str, command_name: str, arguments: Any) -> Optional[Hashable]:
+        """The key of a command, or None if its arguments aren't JSON"""
+        try:
+            return (
+                agent_id,
+                command_name,
+                orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS),
+            )
+        except TypeError:
+            return None
+
+    def start(
+        self,
+        agent_id: str,
+        command_name: str,
+        arguments: Any,
+        fn: Callable[..., Any],
+        /,
+        *args,
+        **kwargs,
+    ) -> None:
+        """
+        Runs fn with args and kwargs, unless the command is already running.
+        The kwargs may repeat command_name and arguments for fn.
+        """
+        key = self.key(agent_id, command_name, arguments)
+        if key is None or self.results.get(key) is not None:
+            return
+        self.results.set(key, self.executor.submit(fn, *args, **kwargs))
+        SPECULATIVE_COMMANDS.inc(result="started")
+
+    def take(
+        self, agent_id: str, command_name: str, arguments: Any
+    ) -> Optional[Future]:
+        """
+        Removes a command started ahead of time from the results.
+
+        Returns:
+            Future: The future of the command, or None if it wasn't started.
+        """
+        key = self.key(agent_id, command_name, arguments)
+        future = self.results.get(key) if key is not None else None
+        if future is None:
+            SPECULATIVE_COMMANDS.inc(result="miss")
+            return None
+        self.results.delete(key)
+        SPECULATIVE_COMMANDS.inc(result="hit")
+        return future
+
+
+def _create_speculative_commands() -> SpeculativeCommands:
+    cfg = Config()
+    return SpeculativeCommands(
+        max_workers=cfg.speculative_workers, ttl=cfg.speculative_result_ttl
+    )
+
+
+def get_speculative_commands() -> SpeculativeCommands:
+    """The speculative commands of the process"""
+    return get_client("speculative_commands", _create_speculative_commands)
@@ -0,0 +1,154 @@
+"""Runs the side effects of a finished agent step concurrently, with deadlines."""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional
+
+from autogpt.api_log import WARNING, print_log
+
+# Seconds each side effect may run, counted from when it starts. One still
+# waiting for a thread that long after it was submitted is cancelled instead.
+TASK_NAMING_DEADLINE = 15.0
+LOG_UPLOAD_DEADLINE = 15.0
+SESSION_SAVE_DEADLINE = 30.0
+
+
+@dataclass
+class SideEffectResult:
+    """The outcome of a side effect.
+
+    Attributes:
+        name: The name of the side effect.
+        ok: Whether it finished without error before its deadline.
+        value: What it returned, if it finished.
+        error: The error it raised, if any.
+        timed_out: Whether its deadline passed before it finished.
+        pending: Whether it was still running at its deadline, in which case
+            it may still finish. A side effect that timed out without pending
+            never started.
+        duration: Seconds between submitting it and knowing its outcome.
+    """
+
+    name: str
+    ok: bool
+    value: Any = None
+    error: Optional[BaseException] = None
+    timed_out: bool = False
+    pending: bool = False
+    duration: float = 0.0
+
+
+class SideEffect:
+    """A side effect submitted to the StepFinalizer."""
+
+    def __init__(self, name: str, deadline: float):
+        self.name = name
+        self.deadline = deadline
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        self._started = threading.Event()
+        self._result: Optional[SideEffectResult] = None
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs fn on a thread of the executor, recording when it started"""
+        self.started_at = time.monotonic()
+        self._started.set()
+        return fn(*args, **kwargs)
+
+    def wait(self) -> SideEffectResult:
+        """
+        Waits for the side effect until its deadline, counted from when it
+        started. One that hasn't started within its deadline of being submitted
+        is cancelled. One that is still running at its deadline keeps running in
+        the background and is reported as pending.
+
+        Returns:
+            SideEffectResult: The outcome of the side effect.
+        """
+        if self._result is not None:
+            return self._result
+        queued = self.submitted_at + self.deadline - time.monotonic()
+        if not self._started.wait(max(0.0, queued)) and self.future.cancel():
+            result = SideEffectResult(self.name, ok=False, timed_out=True)
+        else:
+            # a thread took the side effect just before it could be cancelled
+            self._started.wait()
+            try:
+                value = self.future.result(
+                    timeout=max(0.0, self.started_at + self.deadline - time.monotonic())
+                )
+                result = SideEffectResult(self.name, ok=True, value=value)
+            except FutureTimeoutError:
+                result = SideEffectResult(
+                    self.name, ok=False, timed_out=True, pending=True
+                )
+            except Exception as e:
+                result = SideEffectResult(self.name, ok=False, error=e)
+        result.duration = time.monotonic() - self.submitted_at
+        self._result = result
+        return result
+
+
+class StepFinalizer:
+    """
+    A bounded thread pool for the work that follows a step, such as naming the
+    task, uploading the step log and persisting the session. Running them side
+    by side makes finishing a step take about as long as the slowest of them,
+    rather than their sum.
+    """
+
+    def __init__(self, max_workers: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="step-finalizer"
+        )
+
+    def submit(
+        self, name: str, deadline: float, fn: Callable[..., Any], *args, **kwargs
+    ) -> SideEffect:
+        """
+        Starts a side effect.
+
+        Args:
+            name (str): The name the side effect is reported under.
+            deadline (float): The number of seconds to wait for it to start,
+                and then for it to finish.
+            fn (Callable): The function to run, called with args and kwargs.
+
+        Returns:
+            SideEffect: A handle to wait for the side effect with.
+        """
+        side_effect = SideEffect(name, deadline)
+        side_effect.future = self.executor.submit(side_effect.run, fn, *args, **kwargs)
+        return side_effect
+
+    @staticmethod
+    def wait_all(
+        side_effects: Iterable[SideEffect], agent_id: Optional[str] = None
+    ) -> dict[str, SideEffectResult]:
+        """
+        Waits for every side effect and logs the ones that failed or timed out.
+
+        Returns:
+            dict: The outcome of each side effect, keyed by its name.
+        """
+        results = {}
+        for side_effect in side_effects:
+            result = side_effect.wait()
+            results[result.name] = result
+            if not result.ok:
+                print_log(
+                    "Step side effect failed",
+                    severity=WARNING,
+                    errorMsg=result.error or "timed out",
+                    side_effect=result.name,
+                    timed_out=result.timed_out,
+                    pending=result.pending,
+                    duration_ms=int(result.duration * 1000),
+                    agent_id=agent_id,
+                )
+        return results
@@ -0,0 +1,72 @@
+import os
+
+from autogpt.clients import get_client
+from autogpt.logs import logger
+from autogpt.storage.base import BlobStore, SessionBackend, SessionConflict
+from autogpt.storage.codec import decode_blob, encode_blob
+from autogpt.storage.local import LocalBlobStore, SQLiteSessionBackend
+from autogpt.storage.session_store import BLOB_AGENT_PROPERTIES, Session, SessionStore
+
+# List of supported storage backends
+# Add a backend to this list if the import attempt is successful
+supported_storage = ["local"]
+
+try:
+    from autogpt.storage.google_cloud import GCSBlobStore, GoogleSessionBackend
+
+    supported_storage.append("google")
+except ImportError:
+    GCSBlobStore = None
+    GoogleSessionBackend = None
+
+
+def _use_google(cfg) -> bool:
+    if cfg.storage_backend == "google":
+        if GoogleSessionBackend is None:
+            logger.warn(
+                "Error: google-cloud-datastore, google-cloud-firestore or"
+                " google-cloud-storage is not installed, using local storage."
+            )
+            return False
+        return True
+    return False
+
+
+def get_session_backend(cfg) -> SessionBackend:
+    """Returns the session backend of the process selected by STORAGE_BACKEND"""
+    if _use_google(cfg):
+        return get_client("google_sessions", GoogleSessionBackend)
+    return get_client(
+        "sqlite_sessions",
+        lambda: SQLiteSessionBackend(
+            os.path.join(cfg.local_storage_path, "sessions.sqlite3")
+        ),
+    )
+
+
+def get_blob_store(cfg) -> BlobStore:
+    """Returns the blob store of the process selected by STORAGE_BACKEND"""
+    if _use_google(cfg):
+        return get_client("gcs_blobs", GCSBlobStore)
+    return get_client(
+        "local_blobs",
+        lambda: LocalBlobStore(os.path.join(cfg.local_storage_path, "blobs")),
+    )
+
+
+__all__ = [
+    "BLOB_AGENT_PROPERTIES",
+    "BlobStore",
+    "GCSBlobStore",
+    "GoogleSessionBackend",
+    "LocalBlobStore",
+    "Session",
+    "SessionBackend",
+    "SessionConflict",
+    "SessionStore",
+    "SQLiteSessionBackend",
+    "decode_blob",
+    "encode_blob",
+    "get_blob_store",
+    "get_session_backend",
+]
@@ -0,0 +1,112 @@
+"""Interfaces of the places the api keeps sessions and files in."""
+from __future__ import annotations
+
+import abc
+from typing import Optional, Sequence
+
+
+class SessionConflict(Exception):
+    """The session was saved by another step since it was loaded."""
+
+
+class SessionBackend(abc.ABC):
+    """
+    Keeps the state of every agent, the tasks of each agent and each user's list
+    of agents.
+
+    Agents and tasks are plain dicts whose values are JSON types, bytes or
+    datetimes.
+    """
+
+    @abc.abstractmethod
+    def get_agent(self, agent_id: str) -> Optional[dict]:
+        """Returns the state of an agent, or None if it was never saved"""
+        pass
+
+    @abc.abstractmethod
+    def get_tasks(self, agent_id: str, task_ids: Sequence[int]) -> list[dict]:
+        """Returns the tasks of an agent with the given ids, ordered by id"""
+        pass
+
+    @abc.abstractmethod
+    def save_agent(
+        self,
+        agent_id: str,
+        agent: dict,
+        tasks: dict[int, dict],
+        user_id: Optional[str] = None,
+        user_agent: Optional[dict] = None,
+        expected_version: Optional[int] = None,
+    ) -> None:
+        """
+        Writes the state of an agent, along with new or changed tasks keyed by
+        their id and, if a user is given, the user's entry for the agent.
+
+        With expected_version, nothing is written unless the stored agent still
+        has that version, 0 for an agent that was never saved, and the check
+        and the write are atomic.
+
+        Raises:
+            SessionConflict: The stored agent has another version.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_user_agent(self, user_id: str, agent_id: str) -> Optional[dict]:
+        """Returns a user's entry for an agent"""
+        pass
+
+    @abc.abstractmethod
+    def put_user_agent(self, user_id: str, agent_id: str, user_agent: dict) -> None:
+        """Writes a user's entry for an agent"""
+        pass
+
+    @abc.abstractmethod
+    def list_user_agents(
+        self, user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> tuple[list[tuple[str, dict]], Optional[str]]:
+        """
+        Returns the entries of a user's agents, most recently created first.
+
+        Args:
+            user_id (str): The id of the user.
+            limit (int, optional): The most entries to return. All if None.
+            cursor (str, optional): Only return the entries after this one.
+
+        Returns:
+            tuple: The agent ids with their entries, which only hold ai_name,
+                ai_role and created, and the cursor of the next page, which is
+                None on the last page.
+        """
+        pass
+
+
+class BlobStore(abc.ABC):
+    """Keeps files in buckets, like agent workspaces and step logs."""
+
+    @abc.abstractmethod
+    def write(
+        self, bucket: str, name: str, data: str, content_type: str = "text/plain"
+    ) -> None:
+        """Writes a file, replacing it if it exists"""
+        pass
+
+    @abc.abstractmethod
+    def read_text(self, bucket: str, name: str) -> str:
+        """
+        Returns the content of a file.
+
+        Raises:
+            FileNotFoundError: There is no such file.
+        """
+        pass
+
+    @abc.abstractmethod
+    def list_names(self, bucket: str, prefix: str) -> list[str]:
+        """Returns the names of the files starting with prefix"""
+        pass
+
+    @abc.abstractmethod
+    def list_urls(self, bucket: str, prefix: str) -> list[str]:
+        """Returns URLs of the files starting with prefix"""
+        pass
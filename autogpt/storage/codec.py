@@ -0,0 +1,83 @@
+"""Versioned encoding of the JSON blobs stored in session entities.
+
+An encoded blob is bytes made of a 3 byte magic, a 1 byte format version and
+the payload:
+
+    version 1: orjson
+    version 2: zlib compressed orjson
+
+Anything that does not start with the magic is a legacy blob: a JSON string
+as the api used to write them, or a value Datastore decoded itself.
+"""
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any
+
+import orjson
+
+MAGIC = b"GMB"
+RAW = 1
+ZLIB = 2
+
+# Payloads shorter than this are stored uncompressed, as zlib would not help
+COMPRESSION_THRESHOLD = 256
+
+
+def _dumps(value: Any) -> bytes:
+    try:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # orjson is stricter than json, e.g. about integers beyond 64 bits
+        return json.dumps(value).encode()
+
+
+def encode_blob(value: Any, compression_level: int = 6) -> bytes:
+    """
+    Encodes a JSON serializable value as a blob.
+
+    Args:
+        value (Any): The value to encode.
+        compression_level (int): The zlib level to compress with, 0 to store
+            the payload uncompressed.
+
+    Returns:
+        bytes: The encoded blob.
+    """
+    payload = _dumps(value)
+    if compression_level > 0 and len(payload) >= COMPRESSION_THRESHOLD:
+        return MAGIC + bytes([ZLIB]) + zlib.compress(payload, compression_level)
+    return MAGIC + bytes([RAW]) + payload
+
+
+def decode_blob(blob: Any, default: Any = None) -> Any:
+    """
+    Decodes a blob written by encode_blob, or a legacy JSON string.
+
+    Args:
+        blob (Any): The stored value.
+        default (Any): What to return when there is no value or it can't be
+            decoded.
+
+    Returns:
+        Any: The decoded value.
+    """
+    if blob is None:
+        return default
+    if isinstance(blob, bytes) and blob.startswith(MAGIC):
+        version, payload = blob[len(MAGIC)], blob[len(MAGIC) + 1 :]
+        try:
+            if version == ZLIB:
+                payload = zlib.decompress(payload)
+            elif version != RAW:
+                return default
+            return orjson.loads(payload)
+        except (zlib.error, orjson.JSONDecodeError):
+            return default
+    if isinstance(blob, (str, bytes)):
+        try:
+            return json.loads(blob)
+        except ValueError:
+            return default
+    return blob
@@ -0,0 +1,183 @@
+"""Storage backends on Google Cloud: Datastore and Firestore for sessions, GCS for files."""
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+from google.api_core.exceptions import Aborted, Conflict, NotFound
+from google.cloud import datastore, firestore
+
+from autogpt.clients import datastore_client, firestore_client, storage_client
+from autogpt.storage.base import BlobStore, SessionBackend, SessionConflict
+
+AGENT_KIND = "Agent"
+# Tasks are children of their Agent entity, with ids counting up from 1
+TASK_KIND = "Task"
+TASK_UNINDEXED_PROPERTIES = ("result", "arguments")
+
+# Properties that are never queried on, and can grow past the index size limit
+UNINDEXED_AGENT_PROPERTIES = (
+    "full_message_history",
+    "agents",
+    "assistant_reply",
+    "thoughts",
+    "arguments",
+    "command_name",
+    "tasks",
+    "last_task",
+    "ai_role",
+    "ai_goals",
+    "summary",
+)
+
+# Datastore's limits on the number of entities per get and put
+MAX_GET_BATCH = 1000
+MAX_PUT_BATCH = 500
+
+
+class GoogleSessionBackend(SessionBackend):
+    """
+    Keeps agents as Agent entities in Datastore, with their tasks as child Task
+    entities. The users' entries for their agents are User/Agents entities,
+    listed through Firestore.
+    """
+
+    def __init__(self, client: Optional[datastore.Client] = None):
+        self._client = client
+
+    @property
+    def client(self) -> datastore.Client:
+        """The Datastore client given to the backend, or the one of the process"""
+        return self._client or datastore_client()
+
+    @staticmethod
+    def _task_entity(task: dict, key=None) -> datastore.Entity:
+        entity = datastore.Entity(
+            key=key, exclude_from_indexes=TASK_UNINDEXED_PROPERTIES
+        )
+        entity.update(task)
+        return entity
+
+    def get_agent(self, agent_id: str) -> Optional[dict]:
+        return self.client.get(self.client.key(AGENT_KIND, agent_id))
+
+    def get_tasks(self, agent_id: str, task_ids: Sequence[int]) -> list[dict]:
+        keys = [
+            self.client.key(AGENT_KIND, agent_id, TASK_KIND, task_id)
+            for task_id in task_ids
+        ]
+        tasks = []
+        for i in range(0, len(keys), MAX_GET_BATCH):
+            tasks += self.client.get_multi(keys[i : i + MAX_GET_BATCH])
+        tasks.sort(key=lambda task: task.key.id)
+        return tasks
+
+    def save_agent(
+        self,
+        agent_id: str,
+        agent: dict,
+        tasks: dict[int, dict],
+        user_id: Optional[str] = None,
+        user_agent: Optional[dict] = None,
+        expected_version: Optional[int] = None,
+    ) -> None:
+        """
+        Writes everything in a single transaction, which checks expected_version.
+        Only the migration of a long legacy task array takes more than one
+        commit, whose first ones only write tasks that were already stored in
+        the array.
+        """
+        entity = datastore.Entity(
+            key=self.client.key(AGENT_KIND, agent_id),
+            exclude_from_indexes=UNINDEXED_AGENT_PROPERTIES,
+        )
+        entity.update(agent)
+        if entity.get("last_task") is not None:
+            entity["last_task"] = self._task_entity(entity["last_task"])
+        entities = [entity]
+
+        if user_id is not None and user_agent is not None:
+            users_agent = datastore.Entity(
+                key=self.client.key("User", user_id, "Agents", agent_id),
+            )
+            users_agent.update(user_agent)
+            entities.append(users_agent)
+
+        for task_id, task in tasks.items():
+            entities.append(
+                self._task_entity(
+                    task, key=self.client.key(AGENT_KIND, agent_id, TASK_KIND, task_id)
+                )
+            )
+
+        # the Agent entity goes in the last batch, so it never counts tasks
+        # that were not written
+        first_batch = len(entities) % MAX_PUT_BATCH or MAX_PUT_BATCH
+        for start in range(first_batch, len(entities), MAX_PUT_BATCH):
+            self.client.put_multi(entities[start : start + MAX_PUT_BATCH])
+        try:
+            with self.client.transaction():
+                if expected_version is not None:
+                    stored = self.client.get(entity.key) or {}
+                    if stored.get("version", 0) != expected_version:
+                        raise SessionConflict(agent_id)
+                self.client.put_multi(entities[:first_batch])
+        except (Aborted, Conflict) as e:
+            # another transaction wrote the agent first
+            raise SessionConflict(agent_id) from e
+
+    def get_user_agent(self, user_id: str, agent_id: str) -> Optional[dict]:
+        return self.client.get(self.client.key("User", user_id, "Agents", agent_id))
+
+    def put_user_agent(self, user_id: str, agent_id: str, user_agent: dict) -> None:
+        entity = datastore.Entity(
+            key=self.client.key("User", user_id, "Agents", agent_id)
+        )
+        entity.update(user_agent)
+        self.client.put(entity)
+
+    def list_user_agents(
+        self, user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> tuple[list[tuple[str, dict]], Optional[str]]:
+        agents_ref = (
+            firestore_client().collection("User").document(user_id).collection("Agents")
+        )
+        query = (
+            agents_ref.select(["ai_name", "ai_role", "created"])
+            .order_by("created", direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+        )
+        if cursor is not None:
+            query = query.start_after(agents_ref.document(cursor).get())
+        if limit is not None:
+            query = query.limit(limit)
+
+        docs = list(query.stream())
+        next_cursor = docs[-1].id if limit is not None and len(docs) == limit else None
+        return [(doc.id, doc.to_dict()) for doc in docs], next_cursor
+
+
+class GCSBlobStore(BlobStore):
+    """Keeps files in Google Cloud Storage buckets."""
+
+    def write(
+        self, bucket: str, name: str, data: str, content_type: str = "text/plain"
+    ) -> None:
+        blob = storage_client().bucket(bucket).blob(name)
+        blob.upload_from_string(data, content_type=content_type)
+
+    def read_text(self, bucket: str, name: str) -> str:
+        try:
+            return storage_client().bucket(bucket).blob(name).download_as_text()
+        except NotFound as e:
+            raise FileNotFoundError(name) from e
+
+    def list_names(self, bucket: str, prefix: str) -> list[str]:
+        return [
+            blob.name for blob in storage_client().list_blobs(bucket, prefix=prefix)
+        ]
+
+    def list_urls(self, bucket: str, prefix: str) -> list[str]:
+        return [
+            blob.public_url
+            for blob in storage_client().list_blobs(bucket, prefix=prefix)
+        ]
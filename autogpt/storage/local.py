@@ -0,0 +1,208 @@
+"""Storage backends on the local disk: SQLite for sessions, a directory for files.
+
+They need no cloud account, which makes them suited to development, load tests
+and small self-hosted deployments. Every worker process opens its own SQLite
+connection, and SQLite's write-ahead log lets them share the database.
+"""
+from __future__ import annotations
+
+import datetime
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Sequence
+
+from autogpt.storage.base import BlobStore, SessionBackend, SessionConflict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agents (
+    agent_id TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    agent_id TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (agent_id, task_id)
+);
+CREATE TABLE IF NOT EXISTS user_agents (
+    user_id TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (user_id, agent_id)
+);
+CREATE INDEX IF NOT EXISTS user_agents_by_created
+    ON user_agents (user_id, created DESC, agent_id DESC);
+"""
+
+
+def _created(user_agent: dict) -> float:
+    created = user_agent.get("created")
+    if isinstance(created, datetime.datetime):
+        return created.timestamp()
+    return 0.0
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Keeps sessions in a SQLite database, with rows pickled as they are."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _fetch(self, query: str, *params) -> list[tuple]:
+        with self.lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def get_agent(self, agent_id: str) -> Optional[dict]:
+        rows = self._fetch("SELECT data FROM agents WHERE agent_id = ?", agent_id)
+        return pickle.loads(rows[0][0]) if rows else None
+
+    def get_tasks(self, agent_id: str, task_ids: Sequence[int]) -> list[dict]:
+        if not task_ids:
+            return []
+        rows = self._fetch(
+            "SELECT task_id, data FROM tasks"
+            " WHERE agent_id = ? AND task_id BETWEEN ? AND ? ORDER BY task_id",
+            agent_id,
+            min(task_ids),
+            max(task_ids),
+        )
+        wanted = set(task_ids)
+        return [pickle.loads(data) for task_id, data in rows if task_id in wanted]
+
+    def save_agent(
+        self,
+        agent_id: str,
+        agent: dict,
+        tasks: dict[int, dict],
+        user_id: Optional[str] = None,
+        user_agent: Optional[dict] = None,
+        expected_version: Optional[int] = None,
+    ) -> None:
+        with self.lock, self.connection:
+            # holds the write lock of the database until the commit, so no other
+            # process writes the agent between the check and the write
+            self.connection.execute("BEGIN IMMEDIATE")
+            if expected_version is not None:
+                rows = self.connection.execute(
+                    "SELECT data FROM agents WHERE agent_id = ?", (agent_id,)
+                ).fetchall()
+                stored = pickle.loads(rows[0][0]) if rows else {}
+                if stored.get("version", 0) != expected_version:
+                    raise SessionConflict(agent_id)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?)",
+                [
+                    (agent_id, task_id, pickle.dumps(task))
+                    for task_id, task in tasks.items()
+                ],
+            )
+            if user_id is not None and user_agent is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO user_agents VALUES (?, ?, ?, ?)",
+                    (user_id, agent_id, _created(user_agent), pickle.dumps(user_agent)),
+                )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO agents VALUES (?, ?)",
+                (agent_id, pickle.dumps(agent)),
+            )
+
+    def get_user_agent(self, user_id: str, agent_id: str) -> Optional[dict]:
+        rows = self._fetch(
+            "SELECT data FROM user_agents WHERE user_id = ? AND agent_id = ?",
+            user_id,
+            agent_id,
+        )
+        return pickle.loads(rows[0][0]) if rows else None
+
+    def put_user_agent(self, user_id: str, agent_id: str, user_agent: dict) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO user_agents VALUES (?, ?, ?, ?)",
+                (user_id, agent_id, _created(user_agent), pickle.dumps(user_agent)),
+            )
+
+    def list_user_agents(
+        self, user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> tuple[list[tuple[str, dict]], Optional[str]]:
+        query = "SELECT agent_id, data FROM user_agents WHERE user_id = ?"
+        params: list = [user_id]
+        if cursor is not None:
+            query += (
+                " AND (created, agent_id) < (SELECT created, agent_id"
+                " FROM user_agents WHERE user_id = ? AND agent_id = ?)"
+            )
+            params += [user_id, cursor]
+        query += " ORDER BY created DESC, agent_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._fetch(query, *params)
+        agents = []
+        for agent_id, data in rows:
+            user_agent = pickle.loads(data)
+            agents.append(
+                (
+                    agent_id,
+                    {
+                        name: user_agent.get(name)
+                        for name in ("ai_name", "ai_role", "created")
+                    },
+                )
+            )
+        next_cursor = rows[-1][0] if limit is not None and len(rows) == limit else None
+        return agents, next_cursor
+
+
+class LocalBlobStore(BlobStore):
+    """Keeps files under a directory, with a subdirectory per bucket."""
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def _path(self, bucket: str, name: str) -> Path:
+        bucket_root = (self.root / bucket).resolve()
+        path = (bucket_root / name).resolve()
+        if path != bucket_root and bucket_root not in path.parents:
+            raise ValueError(f"{name} is outside of bucket {bucket}")
+        return path
+
+    def write(
+        self, bucket: str, name: str, data: str, content_type: str = "text/plain"
+    ) -> None:
+        path = self._path(bucket, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(data, encoding="utf-8")
+
+    def read_text(self, bucket: str, name: str) -> str:
+        return self._path(bucket, name).read_text(encoding="utf-8")
+
+    def _list(self, bucket: str, prefix: str) -> list[Path]:
+        bucket_root = self.root / bucket
+        # only walk the directory the prefix points into
+        directory = self._path(bucket, prefix.rpartition("/")[0] or ".")
+        if not directory.is_dir():
+            return []
+        return sorted(
+            path
+            for path in directory.rglob("*")
+            if path.is_file()
+            and path.relative_to(bucket_root).as_posix().startswith(prefix)
+        )
+
+    def list_names(self, bucket: str, prefix: str) -> list[str]:
+        bucket_root = self.root / bucket
+        return [
+            path.relative_to(bucket_root).as_posix()
+            for path in self._list(bucket, prefix)
+        ]
+
+    def list_urls(self, bucket: str, prefix: str) -> list[str]:
+        return [path.resolve().as_uri() for path in self._list(bucket, prefix)]
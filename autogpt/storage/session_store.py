@@ -0,0 +1,326 @@
+"""Per-agent session state, loaded in one read and written in one batched write."""
+from __future__ import annotations
+
+import copy
+import dataclasses
+import datetime
+import json
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
+
+from autogpt.cache import LRUCache
+from autogpt.config import Config
+from autogpt.metrics import STEP_STAGE_SECONDS
+from autogpt.storage.base import SessionBackend, SessionConflict
+from autogpt.storage.codec import decode_blob, encode_blob
+
+if TYPE_CHECKING:
+    from autogpt.agent.agent import Agent
+
+# Properties holding JSON blobs, see autogpt.storage.codec
+BLOB_AGENT_PROPERTIES = (
+    "full_message_history",
+    "agents",
+    "assistant_reply",
+    "thoughts",
+    "arguments",
+)
+
+
+@dataclass
+class Session:
+    """The state of an agent that is carried from one step to the next.
+
+    Attributes:
+        agent_id: The id of the agent.
+        summary: The running summary of past events, if there is one.
+        summary_cursor: The number of messages of the history, counted from the
+            first one ever added, that the summary covers.
+        agents: The sub-agents created by the agent, keyed by their id.
+        task_count: The number of tasks the agent has performed, which is also
+            the id of its last task.
+        last_task: The last task of the agent, whose result is filled in by
+            the next step.
+        pending_tasks: The tasks to write with the next save, keyed by id.
+        full_message_history: The most recent messages of the agent.
+        history_offset: The number of messages trimmed from the start of the
+            history so far.
+        usage: The tokens and cost used by the agent, as saved by its
+            UsageLedger.
+        version: Incremented every time the session is saved.
+    """
+
+    agent_id: str
+    summary: Optional[str] = None
+    summary_cursor: int = 0
+    agents: dict = field(default_factory=dict)
+    task_count: int = 0
+    last_task: Optional[dict] = None
+    pending_tasks: dict = field(default_factory=dict)
+    full_message_history: list = field(default_factory=list)
+    history_offset: int = 0
+    usage: dict = field(default_factory=dict)
+    version: int = 0
+
+    @property
+    def history_version(self) -> int:
+        """The number of messages ever added to the history of the session."""
+        return self.history_offset + len(self.full_message_history)
+
+    def trim_history(self, max_messages: int) -> None:
+        """Drops the oldest messages so at most max_messages are kept."""
+        trimmed = len(self.full_message_history) - max_messages
+        if trimmed > 0:
+            self.full_message_history = self.full_message_history[trimmed:]
+            self.history_offset += trimmed
+
+    def history_since(self, cursor: int) -> tuple[int, list]:
+        """
+        Returns the messages added to the history since a client's cursor.
+
+        Args:
+            cursor (int): The history version the client has.
+
+        Returns:
+            tuple: The cursor the returned messages start at, and the messages.
+                If the client's cursor is unknown to the session, the whole
+                history is returned, starting at history_offset.
+        """
+        if not self.history_offset <= cursor <= self.history_version:
+            cursor = self.history_offset
+        return cursor, self.full_message_history[cursor - self.history_offset :]
+
+
+class SessionStore:
+    """
+    Loads and saves agent sessions in a SessionBackend, keeping recently saved
+    sessions in a per-worker LRU cache.
+
+    A cached session is only used when the caller presents the version it got
+    back from its last save, and a save only goes through if the stored session
+    still has the version it was loaded at, so a worker never serves a session
+    another worker has written to since.
+    """
+
+    def __init__(self, cfg: Config, backend: Optional[SessionBackend] = None):
+        self.cfg = cfg
+        self._backend = backend
+        self.cache = LRUCache(cfg.session_cache_size, cfg.session_cache_ttl)
+        self.blob_format = cfg.session_blob_format
+        self.compression_level = cfg.session_blob_compression
+
+    @property
+    def backend(self) -> SessionBackend:
+        """The backend given to the store, or the one STORAGE_BACKEND selects"""
+        if self._backend is None:
+            from autogpt.storage import get_session_backend
+
+            self._backend = get_session_backend(self.cfg)
+        return self._backend
+
+    def encode(self, value: Any) -> Any:
+        """Encodes a value for one of the BLOB_AGENT_PROPERTIES"""
+        if self.blob_format == "json":
+            return json.dumps(value)
+        return encode_blob(value, self.compression_level)
+
+    @staticmethod
+    def _copy(session: Session) -> Session:
+        return dataclasses.replace(
+            session,
+            agents=copy.deepcopy(session.agents),
+            pending_tasks=dict(session.pending_tasks),
+            full_message_history=list(session.full_message_history),
+        )
+
+    def load(self, agent_id: str, version: Optional[int] = None) -> Session:
+        """
+        Returns the session of an agent, or an empty session for a new agent.
+
+        Args:
+            agent_id (str): The id of the agent.
+            version (int, optional): The version the client last saw. If it matches
+                the cached session, the read is served from the cache.
+
+        Returns:
+            Session: The session of the agent.
+        """
+        if version is not None:
+            cached: Optional[Session] = self.cache.get(agent_id)
+            if cached is not None and cached.version == version:
+                return self._copy(cached)
+
+        with STEP_STAGE_SECONDS.time(stage="session_load"):
+            entity = self.backend.get_agent(agent_id) or {}
+        session = Session(
+            agent_id=agent_id,
+            summary=entity.get("summary") or None,
+            summary_cursor=entity.get("summary_cursor", 0),
+            agents=decode_blob(entity.get("agents"), {}),
+            task_count=entity.get("task_count", 0),
+            last_task=entity.get("last_task"),
+            full_message_history=decode_blob(entity.get("full_message_history"), []),
+            history_offset=entity.get("history_offset", 0),
+            usage=entity.get("usage") or {},
+            version=entity.get("version", 0),
+        )
+        if "task_count" not in entity and entity.get("tasks"):
+            # sessions from before the task log keep their tasks in an array,
+            # which the next save moves to the task log
+            tasks = list(entity["tasks"])
+            session.task_count = len(tasks)
+            session.last_task = tasks[-1]
+            session.pending_tasks = {i: task for i, task in enumerate(tasks, 1)}
+        self.cache.set(agent_id, self._copy(session))
+        return session
+
+    @staticmethod
+    def record_step(
+        session: Session,
+        result: Any,
+        command_name: str,
+        arguments: Any,
+        task_name: Optional[str],
+        relevant_goal: Any = None,
+    ) -> None:
+        """
+        Records a step in the session: the result of the previous task is filled
+        in and the command chosen for the next step is appended as a new task.
+        Only these two tasks are written by the next save.
+        """
+        if session.last_task is not None:
+            last_task = dict(session.last_task)
+            last_task["result"] = result
+            session.last_task = last_task
+            session.pending_tasks[session.task_count] = last_task
+
+        task = {
+            "command_name": command_name,
+            "arguments": json.dumps(arguments),
+            "result": None,
+            "task_name": task_name,
+            "relevant_goal": relevant_goal,
+        }
+        session.task_count += 1
+        session.last_task = task
+        session.pending_tasks[session.task_count] = task
+
+    def save(
+        self,
+        session: Session,
+        agent: Agent,
+        thoughts: dict,
+        user_id: Optional[str] = None,
+    ) -> int:
+        """
+        Writes the session, its new tasks and, if a user is given, the user's
+        entry for the agent in a single batched write.
+
+        Args:
+            session (Session): The session to save.
+            agent (Agent): The agent after its step.
+            thoughts (dict): The thoughts of the agent's last reply.
+            user_id (str, optional): The id of the user who owns the agent.
+
+        Returns:
+            int: The new version of the session.
+
+        Raises:
+            SessionConflict: Another step saved the session since it was
+                loaded. Nothing was written.
+        """
+        summary = agent.summary_memory
+        if isinstance(summary, dict):
+            summary = summary.get("content")
+        session.summary = summary
+        session.summary_cursor = agent.summary_cursor
+        session.agents = agent.agent_manager.agents
+        session.full_message_history = agent.full_message_history
+        session.usage = agent.usage.snapshot()
+
+        entity = {
+            "ai_name": agent.ai_name,
+            "ai_role": agent.ai_role,
+            "ai_goals": agent.ai_goals,
+            "agent_id": agent.agent_id,
+            "full_message_history": self.encode(session.full_message_history),
+            "history_offset": session.history_offset,
+            "command_name": agent.command_name,
+            "arguments": self.encode(agent.arguments),
+            "assistant_reply": self.encode(agent.assistant_reply),
+            "thoughts": self.encode(thoughts),
+            "agents": self.encode(session.agents),
+            "task_count": session.task_count,
+            "last_task": session.last_task,
+            "summary": summary,
+            "summary_cursor": session.summary_cursor,
+            "usage": session.usage,
+            "version": session.version + 1,
+        }
+
+        user_agent = None
+        if user_id is not None:
+            user_agent = {
+                "created": datetime.datetime.now(),
+                "agent_id": session.agent_id,
+                "ai_name": agent.ai_name,
+                "ai_role": agent.ai_role[:1200],
+            }
+
+        with STEP_STAGE_SECONDS.time(stage="datastore_write"):
+            try:
+                self.backend.save_agent(
+                    session.agent_id,
+                    entity,
+                    session.pending_tasks,
+                    user_id=user_id,
+                    user_agent=user_agent,
+                    expected_version=session.version,
+                )
+            except SessionConflict:
+                # the cached copy is stale too
+                self.cache.delete(session.agent_id)
+                raise
+        session.pending_tasks = {}
+        session.version += 1
+        self.cache.set(session.agent_id, self._copy(session))
+        return session.version
+
+    def load_tasks(
+        self,
+        agent_id: str,
+        entity: dict,
+        limit: Optional[int] = None,
+        cursor: Optional[int] = None,
+    ) -> tuple[list, Optional[int]]:
+        """
+        Returns a page of the tasks of an agent, oldest first.
+
+        Args:
+            agent_id (str): The id of the agent.
+            entity (dict): The stored state of the agent.
+            limit (int, optional): The most tasks to return. All of them if None.
+            cursor (int, optional): Only return tasks before this one. The most
+                recent tasks if None.
+
+        Returns:
+            tuple: The tasks, and the cursor of the page before them, which is
+                None once the first task is reached.
+
+        Raises:
+            ValueError: The limit is less than 1, so the pages would never move.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+        task_count = entity.get("task_count")
+        end = task_count if task_count is not None else len(entity.get("tasks", []))
+        if cursor is not None:
+            end = min(end, cursor - 1)
+        start = 1 if limit is None else max(1, end - limit + 1)
+        next_cursor = start if start > 1 else None
+
+        if task_count is None:
+            # legacy session, whose tasks are still in an array
+            return list(entity.get("tasks", []))[start - 1 : end], next_cursor
+
+        return self.backend.get_tasks(agent_id, range(start, end + 1)), next_cursor
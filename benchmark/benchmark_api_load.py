@@ -0,0 +1,547 @@
+"""Load test of the api that runs offline, as a baseline for the step pipeline.
+
+Usage: python -m benchmark.benchmark_api_load [--workers N] [--threads N]
+    [--users N] [--duration S] [--openai-latency S]
+    [--mix api=6,subgoals=1,sessions=3] [--rate-limits] [--json]
+
+Boots autogpt.api:app under gunicorn with the local storage backend in a
+temporary directory, no memory backend and the OpenAI API pointed at a mock
+server run by this process. The mock replays the completions recorded in the
+test cassettes, matching requests after the normalization of the VCR filters
+in tests/vcr, and gives a canned reply to anything else after
+--openai-latency seconds.
+
+Every virtual user runs one agent: a start step, then a mix of /api steps,
+/api-goal-subgoals and /api/sessions calls. The throughput, the p50/p95/p99
+latency of every route and the RSS of every gunicorn worker are printed at the
+end, or written as JSON with --json to compare runs against each other.
+
+Tokens are still counted locally, so the tiktoken encodings have to be cached
+(see TIKTOKEN_CACHE_DIR) for the load test to run without a network.
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import requests
+import yaml
+
+from tests.vcr.vcr_filter import replace_timestamp_in_request
+
+ROOT = Path(__file__).resolve().parents[1]
+
+EMBEDDING_SIZE = 1536
+
+AGENT_REPLY = json.dumps(
+    {
+        "thoughts": {
+            "text": "I should keep working on the goal.",
+            "reasoning": "The load test only needs a well formed reply.",
+            "plan": "- keep going\n- finish",
+            "criticism": "None.",
+            "speak": "Continuing.",
+            "relevant_goal": 1,
+        },
+        "command": {"name": "do_nothing", "args": {}},
+    }
+)
+SUBGOALS_REPLY = "1. Research the topic.\n2. Write a draft.\n3. Review the draft."
+TASK_NAME_REPLY = "Continue working on the goal."
+
+ROUTES = {
+    "api": "/api",
+    "subgoals": "/api-goal-subgoals",
+    "sessions": "/api/sessions",
+}
+
+
+def request_key(body: dict) -> str:
+    """Normalizes a chat completion request the way the VCR filters do."""
+    body = {name: value for name, value in body.items() if name != "stream"}
+    request = SimpleNamespace(body=json.dumps(body))
+    replace_timestamp_in_request(request)
+    return json.dumps(json.loads(request.body), sort_keys=True)
+
+
+def load_cassettes(root: Path = ROOT / "tests") -> dict[str, str]:
+    """Returns the content of every recorded chat completion, by request key."""
+    replies = {}
+    for path in root.glob("**/cassettes/**/*.yaml"):
+        try:
+            interactions = yaml.safe_load(path.read_text())["interactions"]
+        except (OSError, KeyError, TypeError, yaml.YAMLError):
+            continue
+        for interaction in interactions:
+            request, response = interaction["request"], interaction["response"]
+            if not request["uri"].endswith("/chat/completions"):
+                continue
+            try:
+                body = response["body"]["string"]
+                if "gzip" in response["headers"].get("Content-Encoding", []):
+                    body = gzip.decompress(body)
+                content = json.loads(body)["choices"][0]["message"]["content"]
+                replies[request_key(json.loads(request["body"]))] = content
+            except (KeyError, IndexError, TypeError, ValueError, OSError):
+                continue
+    return replies
+
+
+def canned_reply(messages: list[dict]) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    if "subtasks" in prompt:
+        return SUBGOALS_REPLY
+    if prompt.startswith("Describe this action"):
+        return TASK_NAME_REPLY
+    return AGENT_REPLY
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockOpenAI"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.latency)
+        if self.path.endswith("/embeddings"):
+            self.send_embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self.send_completion(body)
+        else:
+            self.send_error(404)
+
+    def send_embeddings(self, body: dict) -> None:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = [
+            {"object": "embedding", "index": i, "embedding": [0.0] * EMBEDDING_SIZE}
+            for i in range(len(inputs))
+        ]
+        usage = {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        self.send_body(
+            json.dumps(
+                {"object": "list", "data": data, "model": body["model"], "usage": usage}
+            ).encode(),
+            "application/json",
+        )
+
+    def send_completion(self, body: dict) -> None:
+        content = self.server.replies.get(request_key(body))
+        if content is None:
+            content = canned_reply(body["messages"])
+        completion = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": body["model"],
+        }
+        if not body.get("stream"):
+            prompt = sum(len(message["content"]) for message in body["messages"])
+            completion.update(
+                object="chat.completion",
+                choices=[
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                # roughly 4 characters a token
+                usage={
+                    "prompt_tokens": prompt // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (prompt + len(content)) // 4,
+                },
+            )
+            self.send_body(json.dumps(completion).encode(), "application/json")
+            return
+
+        events = []
+        for start in range(0, len(content), 16):
+            delta = {"content": content[start : start + 16]}
+            chunk = dict(
+                completion,
+                object="chat.completion.chunk",
+                choices=[{"index": 0, "delta": delta, "finish_reason": None}],
+            )
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        self.send_body("".join(events).encode(), "text/event-stream")
+
+
+class MockOpenAI(ThreadingHTTPServer):
+    """An OpenAI API answering chat completions and embeddings locally."""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, replies: Optional[dict] = None):
+        super().__init__(("127.0.0.1", 0), MockOpenAIHandler)
+        self.latency = latency
+        self.replies = replies or {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+
+class LoadTestTokens:
+    """Accepts any bearer token as the id of a user, instead of Firebase."""
+
+    def verify(self, id_token: str) -> dict:
+        return {"user_id": id_token}
+
+
+class LoadTestLogging:
+    """Drops structured logs, instead of sending them to Cloud Logging."""
+
+    def logger(self, name: str) -> "LoadTestLogging":
+        return self
+
+    def log_struct(self, info: dict, **kwargs) -> None:
+        pass
+
+
+def create_app():
+    """The api app as the load test serves it, with stand-ins for Firebase
+    authentication and Cloud Logging."""
+    from autogpt import api
+
+    api.token_cache = LoadTestTokens()
+    cloud_logging = LoadTestLogging()
+    api.logging_client = lambda: cloud_logging
+    api.limiter.enabled = os.getenv("LOAD_TEST_RATE_LIMITS") == "True"
+    return api.app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_pids(master_pid: int) -> list[int]:
+    try:
+        children = Path(f"/proc/{master_pid}/task/{master_pid}/children").read_text()
+    except OSError:
+        return []
+    return [int(pid) for pid in children.split()]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RSSSampler(threading.Thread):
+    """Records the peak and the last RSS of every worker of a gunicorn master."""
+
+    def __init__(self, master_pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak: dict[int, int] = {}
+        self.last: dict[int, int] = {}
+        self.stopped = threading.Event()
+
+    def sample(self) -> None:
+        for pid in worker_pids(self.master_pid):
+            rss = rss_bytes(pid)
+            if rss is not None:
+                self.last[pid] = rss
+                self.peak[pid] = max(self.peak.get(pid, 0), rss)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+
+def start_server(
+    port: int, workers: int, threads: int, env: dict, log_path: Path
+) -> subprocess.Popen:
+    log = open(log_path, "w")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            "gunicorn.conf.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(workers),
+            "--threads",
+            str(threads),
+            "--access-logfile",
+            "/dev/null",
+            "benchmark.benchmark_api_load:create_app()",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited, see {log_path}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                # the master answers before every worker is forked
+                while len(worker_pids(server.pid)) < workers:
+                    time.sleep(0.1)
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"The server did not start, see {log_path}")
+
+
+class VirtualUser(threading.Thread):
+    """A user running one agent against the api until the deadline."""
+
+    def __init__(
+        self, base_url: str, index: int, mix: dict[str, int], deadline: float
+    ):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.mix = mix
+        self.deadline = deadline
+        self.random = random.Random(index)
+        self.http = requests.Session()
+        self.http.headers.update(
+            {
+                "Authorization": f"Bearer load-test-user-{index}",
+                # every user gets its own rate limits
+                "X-Forwarded-For": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+            }
+        )
+        self.agent_id = str(uuid.uuid4())
+        self.session_version = None
+        self.history_version = None
+        self.samples: list[tuple[str, float, int]] = []
+
+    def post(self, route: str, body: dict) -> Optional[dict]:
+        start = time.perf_counter()
+        try:
+            response = self.http.post(self.base_url + route, json=body, timeout=300)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        self.samples.append((route, time.perf_counter() - start, status))
+        if response is None or not response.ok:
+            return None
+        return response.json()
+
+    def step(self) -> None:
+        started = self.session_version is not None
+        response = self.post(
+            ROUTES["api"],
+            {
+                "openai_key": "sk-load-test",
+                "gpt_model": "gpt-3.5-turbo",
+                "agent_id": self.agent_id,
+                "ai_name": "LoadTestGPT",
+                "ai_description": "an agent run by the load test",
+                "ai_goals": ["Keep the api busy", "Measure its latency"],
+                "command": "human_feedback" if started else "###start###",
+                "arguments": "Continue." if started else "",
+                "assistant_reply": "",
+                "message_history": [],
+                "session_version": self.session_version,
+                "history_version": self.history_version,
+                "new_messages": [],
+            },
+        )
+        if response is not None:
+            self.session_version = response["session_version"]
+            self.history_version = response["history_version"]
+
+    def subgoals(self) -> None:
+        self.post(
+            ROUTES["subgoals"],
+            {"openai_key": "sk-load-test", "goal": "Write a report on load testing"},
+        )
+
+    def sessions(self) -> None:
+        self.post(ROUTES["sessions"], {"limit": 20})
+
+    def run(self):
+        self.step()
+        actions, weights = zip(*self.mix.items())
+        while time.time() < self.deadline:
+            getattr(self, self.random.choices(actions, weights)[0])()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The nearest-rank percentile of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(samples: list[tuple[str, float, int]], seconds: float) -> dict:
+    by_route: dict[str, list[tuple[float, int]]] = {}
+    for route, latency, status in samples:
+        by_route.setdefault(route, []).append((latency, status))
+    by_route["total"] = [(latency, status) for _, latency, status in samples]
+
+    summary = {}
+    for route, results in by_route.items():
+        latencies = [latency for latency, status in results if 200 <= status < 300]
+        summary[route] = {
+            "requests": len(results),
+            "errors": len(results) - len(latencies),
+            "throughput": len(latencies) / seconds,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        }
+    return summary
+
+
+def benchmark_api_load(
+    workers: int = 2,
+    threads: int = 50,
+    users: int = 16,
+    duration: float = 30.0,
+    openai_latency: float = 0.0,
+    mix: Optional[dict[str, int]] = None,
+    rate_limits: bool = False,
+) -> dict:
+    mix = mix or {"step": 6, "subgoals": 1, "sessions": 3}
+    mock = MockOpenAI(openai_latency, load_cassettes())
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory(prefix="godmode-load-test-") as storage:
+        port = free_port()
+        env = dict(
+            os.environ,
+            STORAGE_BACKEND="local",
+            LOCAL_STORAGE_PATH=storage,
+            MEMORY_BACKEND="no_memory",
+            OPENAI_API_BASE=mock.url,
+            OPENAI_API_KEY="sk-load-test",
+            JOB_QUEUE="local",
+            LOAD_TEST_RATE_LIMITS=str(rate_limits),
+        )
+        env.pop("REDIS_HOST", None)
+        log_path = Path(storage) / "server.log"
+        server = start_server(port, workers, threads, env, log_path)
+        sampler = RSSSampler(server.pid)
+        sampler.sample()
+        sampler.start()
+        try:
+            start = time.time()
+            virtual_users = [
+                VirtualUser(f"http://127.0.0.1:{port}", i, mix, start + duration)
+                for i in range(users)
+            ]
+            for user in virtual_users:
+                user.start()
+            for user in virtual_users:
+                user.join()
+            seconds = time.time() - start
+            sampler.sample()
+        finally:
+            sampler.stopped.set()
+            server.terminate()
+            server.wait()
+            mock.shutdown()
+
+    samples = [sample for user in virtual_users for sample in user.samples]
+    return {
+        "workers": workers,
+        "threads": threads,
+        "users": users,
+        "seconds": seconds,
+        "routes": summarize(samples, seconds),
+        "rss": {
+            str(pid): {"peak": sampler.peak[pid], "last": sampler.last[pid]}
+            for pid in sampler.peak
+        },
+    }
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route {name}")
+        weights["step" if name == "api" else name] = int(weight or 1)
+    return weights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--openai-latency", type=float, default=0.0)
+    parser.add_argument("--mix", type=parse_mix, default="api=6,subgoals=1,sessions=3")
+    parser.add_argument("--rate-limits", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = benchmark_api_load(
+        args.workers,
+        args.threads,
+        args.users,
+        args.duration,
+        args.openai_latency,
+        args.mix,
+        args.rate_limits,
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+        sys.exit()
+
+    print(
+        f"{results['users']} users, {results['workers']} workers x "
+        f"{results['threads']} threads, {results['seconds']:.1f} s"
+    )
+    print(
+        f"{'route':<20}{'requests':>10}{'errors':>8}{'req/s':>9}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for route, stats in results["routes"].items():
+        print(
+            f"{route:<20}{stats['requests']:>10}{stats['errors']:>8}"
+            f"{stats['throughput']:>9.1f}{stats['p50'] * 1000:>10.1f}"
+            f"{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}"
+        )
+    for pid, rss in results["rss"].items():
+        print(
+            f"worker {pid}: peak RSS {rss['peak'] / 2**20:.1f} MiB, "
+            f"last {rss['last'] / 2**20:.1f} MiB"
+        )
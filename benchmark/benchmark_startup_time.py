@@ -0,0 +1,52 @@
+"""Measures how long a worker takes to import the api and create its clients.
+
+Usage: python -m benchmark.benchmark_startup_time [--runs N] [--clients]
+
+Each run imports autogpt.api in a fresh interpreter, so nothing is cached
+between runs. With --clients, the time to create every cloud client on first
+use is measured too, which needs Google Cloud credentials.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+RUN_ONCE = """
+import json, time
+start = time.perf_counter()
+import autogpt.api
+timings = {"import": time.perf_counter() - start}
+if %(clients)r:
+    from autogpt import clients
+    for name in ("datastore", "firestore", "logging", "storage", "firebase", "pinecone"):
+        start = time.perf_counter()
+        getattr(clients, name + "_client" if name != "firebase" else "firebase_app")()
+        timings[name] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def benchmark_startup_time(runs: int = 5, clients: bool = False) -> dict:
+    samples: dict[str, list[float]] = {}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", RUN_ONCE % {"clients": clients}],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        for name, seconds in timings.items():
+            samples.setdefault(name, []).append(seconds)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--clients", action="store_true")
+    args = parser.parse_args()
+
+    for name, seconds in benchmark_startup_time(args.runs, args.clients).items():
+        print(f"{name:>10}: {seconds * 1000:8.1f} ms (median of {args.runs})")
@@ -1,7 +1,24 @@
-workers = 4
+import os
+import shutil
+
+# exported so the app can tell whether it runs in more than one process
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", "4"))
+# the workers write their metrics here, before the app is imported, so
+# /metrics reports the metrics of all of them (see autogpt/metrics.py)
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/godmode-metrics")
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
 threads = 50
+# import the app once in the master, cloud clients are only created in workers
+preload_app = True
 bind = "0.0.0.0:8080"
 accesslog = "-"  # Log access logs to stdout
 errorlog = "-"   # Log error logs to stdout
 loglevel = "info"  # Choose an appropriate log level: debug, info, warning, error, or critical
 timeout = 0
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -203,3 +203,39 @@ class TestCommandRegistry:
             registry.commands["function_based"].description
             == "Function-based test command"
         )
+
+    def test_register_bumps_version(self):
+        """Test that registering and unregistering commands bumps the version."""
+        registry = CommandRegistry()
+        cmd = Command(
+            name="example",
+            description="Example command",
+            method=self.example_command_method,
+        )
+
+        registry.register(cmd)
+        assert registry.version == 1
+
+        registry.unregister(cmd.name)
+        assert registry.version == 2
+
+    def test_frozen_registry_is_immutable(self):
+        """Test that a frozen snapshot keeps its commands and rejects changes."""
+        registry = CommandRegistry()
+        cmd = Command(
+            name="example",
+            description="Example command",
+            method=self.example_command_method,
+        )
+        registry.register(cmd)
+
+        snapshot = registry.freeze()
+
+        assert snapshot.get_command("example") == cmd
+        assert snapshot.version == registry.version
+        with pytest.raises(RuntimeError):
+            snapshot.register(cmd)
+        with pytest.raises(RuntimeError):
+            snapshot.unregister("example")
+        with pytest.raises(TypeError):
+            snapshot.commands["other"] = cmd
@@ -1,6 +1,10 @@
+from unittest.mock import MagicMock, patch
+
 import pytest
 
-from autogpt.llm import count_message_tokens, count_string_tokens
+from autogpt.cache import LRUCache
+from autogpt.llm import count_message_tokens, count_string_tokens, token_counter
+from autogpt.llm.token_counter import count_each_message_tokens, count_tokens
 
 
 def test_count_message_tokens():
@@ -70,3 +74,46 @@ def test_count_string_tokens_gpt_4():
 
     string = "Hello, world!"
     assert count_string_tokens(string, model_name="gpt-4-0314") == 4
+
+
+class WordEncoding:
+    """Counts words as tokens"""
+
+    name = "words"
+
+    def __init__(self):
+        self.encode = MagicMock(side_effect=str.split)
+        self.encode_batch = MagicMock(side_effect=self.encode_texts)
+
+    @staticmethod
+    def encode_texts(texts):
+        return [text.split() for text in texts]
+
+
+@pytest.fixture
+def encoding():
+    encoding = WordEncoding()
+    with patch.object(token_counter, "get_encoding", return_value=encoding):
+        with patch.object(token_counter, "_token_counts", return_value=LRUCache()):
+            yield encoding
+
+
+def test_count_tokens_only_tokenizes_new_texts(encoding):
+    assert count_tokens(["a b", "c"], "gpt-4") == [2, 1]
+    assert count_tokens(["c", "d e f", "a b"], "gpt-4") == [1, 3, 2]
+
+    batches = [call.args[0] for call in encoding.encode_batch.call_args_list]
+    assert batches == [["a b", "c"]]
+    encoding.encode.assert_called_once_with("d e f")
+
+
+def test_count_each_message_tokens(encoding):
+    messages = [
+        {"role": "user", "content": "Hello there"},
+        {"role": "assistant", "content": "Hi", "name": "John"},
+    ]
+
+    assert count_each_message_tokens(messages, "gpt-3.5-turbo") == [7, 6]
+    assert count_each_message_tokens(messages, "gpt-4") == [6, 7]
+    assert count_message_tokens(messages, "gpt-4") == 16
+    assert encoding.encode_batch.call_count == 1
@@ -0,0 +1,500 @@
+import datetime
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from openai.error import InvalidRequestError
+from openai.openai_object import OpenAIObject
+
+from autogpt import api
+from autogpt.job_queue import JobWorkerPool, LocalJobQueue
+from autogpt.llm import ApiManager
+from autogpt.storage import SessionConflict, SessionStore, SQLiteSessionBackend
+
+REPLY = json.dumps(
+    {
+        "thoughts": {
+            "text": "Look it up",
+            "reasoning": "I don't know the weather",
+            "plan": "- search",
+            "criticism": "",
+            "speak": "Searching",
+        },
+        "command": {"name": "google", "args": {"input": "weather"}},
+    }
+)
+
+
+def chunks(reply: str, size: int = 16) -> list:
+    """A streamed completion of reply"""
+    return [
+        OpenAIObject.construct_from(
+            {"choices": [{"delta": {"content": reply[i : i + size]}}]}
+        )
+        for i in range(0, len(reply), size)
+    ]
+
+
+def step_request(**fields) -> dict:
+    return {
+        "command": "human_feedback",
+        "arguments": "Go on",
+        "ai_name": "WeatherGPT",
+        "ai_description": "an assistant telling the weather",
+        "ai_goals": ["Tell the weather"],
+        "agent_id": "agent",
+        "openai_key": "sk-test",
+        **fields,
+    }
+
+
+def read_events(response) -> list:
+    """The (event, data) pairs of a Server-Sent Events response"""
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def store(config, tmp_path):
+    return SessionStore(config, SQLiteSessionBackend(str(tmp_path / "db.sqlite3")))
+
+
+def completion(reply: str):
+    """A chat completion of reply that isn't streamed"""
+    return OpenAIObject.construct_from(
+        {
+            "choices": [{"message": {"role": "assistant", "content": reply}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50},
+        }
+    )
+
+
+@pytest.fixture
+def create_completion():
+    """The OpenAI chat completion call, replying REPLY"""
+    with patch(
+        "openai.ChatCompletion.create",
+        side_effect=lambda stream=False, **kwargs: (
+            chunks(REPLY) if stream else completion(REPLY)
+        ),
+    ) as create:
+        yield create
+
+
+@pytest.fixture
+def client(store, create_completion, monkeypatch):
+    monkeypatch.setattr(api, "session_store", store)
+    monkeypatch.setattr(api, "session_list_cache", api.LRUCache(16, 60))
+    monkeypatch.setattr(api, "get_memory", lambda cfg: MagicMock())
+    monkeypatch.setattr(api, "logging_client", MagicMock())
+    monkeypatch.setattr(api, "generate_task_name", lambda *args: "Search the web")
+    monkeypatch.setattr(api, "upload_log", lambda *args: None)
+    monkeypatch.setattr(api.limiter, "enabled", False)
+    # steps set the level of the shared logger, which other tests read
+    monkeypatch.setattr(api.logger, "set_level", lambda level: None)
+    return api.app.test_client()
+
+
+def test_stream_emits_the_stages_of_a_step_in_order(client):
+    response = client.post("/api/stream", json=step_request())
+
+    assert response.mimetype == "text/event-stream"
+    events = read_events(response)
+    names = [event for event, _ in events]
+    assert names[0] == "result"
+    assert [name for name in names if name != "token"] == [
+        "result",
+        "command",
+        "thoughts",
+        "task",
+        "done",
+    ]
+    # the reply is streamed before its thoughts are announced
+    tokens = [data for event, data in events if event == "token"]
+    assert "".join(tokens) == REPLY
+    assert names.index("thoughts") > max(
+        i for i, name in enumerate(names) if name == "token"
+    )
+
+    data = dict(events)
+    assert data["result"] == "Human feedback: Go on"
+    assert data["command"] == {"command": "google", "arguments": {"input": "weather"}}
+    assert data["task"] == "Search the web"
+    assert data["done"]["command"] == "google"
+    assert data["done"]["assistant_reply"] == REPLY
+    assert data["done"]["session_version"] == 1
+
+
+@pytest.mark.parametrize(
+    "error, status",
+    [
+        (InvalidRequestError("Context too long", None), 503),
+        (RuntimeError("Connection lost"), 500),
+    ],
+)
+def test_stream_ends_with_an_error_when_the_step_fails(
+    client, create_completion, error, status
+):
+    create_completion.side_effect = error
+
+    events = read_events(client.post("/api/stream", json=step_request()))
+
+    names = [event for event, _ in events]
+    assert names == ["result", "error"]
+    assert events[-1][1]["status"] == status
+
+
+def test_streamed_completion_passes_every_delta_on(config, create_completion):
+    config.openai_api_key = "sk-test"
+    tokens = []
+
+    with (
+        patch("autogpt.llm.api_manager.count_message_tokens", return_value=10),
+        patch("autogpt.llm.api_manager.count_string_tokens", return_value=5),
+    ):
+        reply = ApiManager().create_chat_completion_stream(
+            [{"role": "user", "content": "Weather?"}],
+            config,
+            tokens.append,
+            model="gpt-3.5-turbo",
+        )
+
+    assert reply == REPLY
+    assert "".join(tokens) == REPLY
+    assert create_completion.call_args.kwargs["stream"] is True
+
+
+def test_concurrent_saves_are_a_conflict(client, store):
+    with patch.object(store, "save", side_effect=SessionConflict("agent")):
+        response = client.post("/api/stream", json=step_request())
+        events = read_events(response)
+
+        assert events[-1] == ("error", {"status": 409, **api.SESSION_CONFLICT})
+
+        response = client.post("/api", json=step_request())
+
+    assert response.status_code == 409
+    assert json.loads(response.data) == api.SESSION_CONFLICT
+
+
+def test_a_replayed_delta_is_not_added_twice(client, store):
+    request = step_request(
+        history_version=0, new_messages=[{"role": "user", "content": "Hi"}]
+    )
+    first = json.loads(client.post("/api", json=request).data)
+    history = store.load("agent").full_message_history
+
+    response = client.post("/api", json=request)
+
+    assert response.status_code == 409
+    body = json.loads(response.data)
+    assert body["history_version"] == first["history_version"]
+    assert body["history_cursor"] == 0
+    assert body["message_history_delta"] == history
+    assert store.load("agent").full_message_history == history
+
+
+def test_a_stale_delta_gets_the_messages_it_misses(client, store):
+    first = json.loads(client.post("/api", json=step_request(history_version=0)).data)
+    history = store.load("agent").full_message_history
+    stale = first["history_version"] - 1
+
+    response = client.post(
+        "/api",
+        json=step_request(
+            history_version=stale,
+            new_messages=[{"role": "user", "content": "Hi"}],
+        ),
+    )
+
+    assert response.status_code == 409
+    body = json.loads(response.data)
+    assert body["history_cursor"] == stale
+    assert body["message_history_delta"] == history[-1:]
+    assert store.load("agent").full_message_history == history
+
+
+@pytest.fixture
+def job_client(client, config, monkeypatch):
+    monkeypatch.setattr(api, "job_queue", LocalJobQueue(config))
+    monkeypatch.setattr(api, "job_workers", MagicMock())
+    return client
+
+
+def test_step_jobs_are_only_read_by_their_owner(job_client):
+    response = job_client.post("/api/steps", json=step_request())
+    job_id = json.loads(response.data)["job_id"]
+
+    owner = {"X-OpenAI-Key": "sk-test"}
+    assert job_client.get(f"/api/steps/{job_id}", headers=owner).status_code == 200
+    assert job_client.get(f"/api/steps/{job_id}").status_code == 401
+    other = {"X-OpenAI-Key": "sk-other"}
+    assert job_client.get(f"/api/steps/{job_id}", headers=other).status_code == 404
+    response = job_client.get(f"/api/steps/{job_id}/events", headers=other)
+    assert response.status_code == 404
+
+
+def test_the_key_header_only_reads_step_jobs(job_client):
+    body = step_request()
+    del body["openai_key"]
+    headers = {"X-OpenAI-Key": "sk-test"}
+
+    assert job_client.post("/api", json=body, headers=headers).status_code == 401
+    response = job_client.post("/api/steps", json=body, headers=headers)
+    assert response.status_code == 401
+
+
+def test_step_jobs_end_with_the_errors_of_a_stream(job_client, store, monkeypatch):
+    pool = JobWorkerPool(api.job_queue, api.run_step_job, 1, api.step_job_error_event)
+    monkeypatch.setattr(api, "job_workers", pool)
+
+    with patch.object(store, "save", side_effect=SessionConflict("agent")):
+        response = job_client.post("/api/steps", json=step_request())
+        job_id = json.loads(response.data)["job_id"]
+        response = job_client.get(
+            f"/api/steps/{job_id}?wait=5", headers={"X-OpenAI-Key": "sk-test"}
+        )
+
+    body = json.loads(response.data)
+    assert body["status"] == "error"
+    assert body["result"] == {"status": 409, **api.SESSION_CONFLICT}
+
+
+def test_unknown_step_jobs_are_not_found(job_client):
+    headers = {"X-OpenAI-Key": "sk-test"}
+
+    assert job_client.get("/api/steps/unknown", headers=headers).status_code == 404
+    response = job_client.get("/api/steps/unknown/events", headers=headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "path, headers",
+    [
+        ("?wait=soon", {}),
+        ("?wait=nan", {}),
+        ("/events", {"Last-Event-ID": "first"}),
+        ("/events", {"Last-Event-ID": "-2"}),
+    ],
+)
+def test_bad_step_job_polls_are_rejected(job_client, path, headers):
+    response = job_client.post("/api/steps", json=step_request())
+    job_id = json.loads(response.data)["job_id"]
+
+    response = job_client.get(
+        f"/api/steps/{job_id}{path}", headers={"X-OpenAI-Key": "sk-test", **headers}
+    )
+
+    assert response.status_code == 400
+
+
+def test_local_step_jobs_are_refused_with_several_workers(job_client, monkeypatch):
+    monkeypatch.setattr(api.global_config, "web_workers", 4)
+
+    response = job_client.post("/api/steps", json=step_request())
+
+    assert response.status_code == 501
+    api.job_workers.start.assert_not_called()
+
+
+def reply_with(command: str) -> str:
+    reply = json.loads(REPLY)
+    reply["command"] = {"name": command, "args": {}}
+    return json.dumps(reply)
+
+
+@pytest.fixture
+def run_client(client):
+    with patch("autogpt.agent.agent.execute_command", return_value="Sunny"):
+        yield client
+
+
+def run(client, **limits) -> dict:
+    response = client.post("/api/run", json=step_request(**limits))
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+def test_run_stops_after_max_steps(run_client):
+    response = run(run_client, max_steps=3)
+
+    assert response["stop_reason"] == "max_steps"
+    assert len(response["steps"]) == 3
+    assert response["steps"][1]["result"] == "Command google returned: Sunny"
+
+
+def test_run_stops_when_the_task_is_complete(run_client, create_completion):
+    create_completion.side_effect = lambda **kwargs: completion(
+        reply_with("task_complete")
+    )
+
+    response = run(run_client, max_steps=3)
+
+    assert response["stop_reason"] == "task_complete"
+    assert len(response["steps"]) == 1
+
+
+@pytest.mark.parametrize(
+    "limits, stop_reason",
+    [({"max_tokens": 100}, "max_tokens"), ({"max_cost": 0.0001}, "max_cost")],
+)
+def test_run_stops_at_its_budget(run_client, limits, stop_reason):
+    response = run(run_client, max_steps=3, **limits)
+
+    assert response["stop_reason"] == stop_reason
+    assert len(response["steps"]) == 1
+
+
+def test_run_stops_at_an_invalid_command(run_client, create_completion):
+    reply = json.dumps({"thoughts": json.loads(REPLY)["thoughts"]})
+    create_completion.side_effect = lambda **kwargs: completion(reply)
+
+    response = run(run_client, max_steps=3)
+
+    assert response["stop_reason"] == "invalid_command"
+    assert len(response["steps"]) == 1
+
+
+def test_run_fails_when_a_step_fails(run_client, create_completion):
+    create_completion.side_effect = RuntimeError("Connection lost")
+
+    response = run_client.post("/api/run", json=step_request(max_steps=3))
+
+    assert response.status_code == 500
+
+
+def test_run_saves_a_checkpoint_every_interval(run_client, store):
+    with patch.object(store, "save", wraps=store.save) as save:
+        events = read_events(
+            run_client.post(
+                "/api/run/stream",
+                json=step_request(max_steps=3, checkpoint_interval=2),
+            )
+        )
+
+    checkpoints = [data for event, data in events if event == "checkpoint"]
+    assert checkpoints == [{"session_version": 1}]
+    # the checkpoint after the second step, then the end of the run
+    assert save.call_count == 2
+    assert events[-1][1]["session_version"] == 2
+
+
+@pytest.mark.parametrize(
+    "max_steps, cost",
+    [(None, 1), (5, 5), (0, 1), (1000, 10), ("many", 1)],
+)
+def test_run_rate_limit_cost(monkeypatch, max_steps, cost):
+    monkeypatch.setattr(api.global_config, "continuous_max_steps", 10)
+    body = {} if max_steps is None else {"max_steps": max_steps}
+
+    with api.app.test_request_context("/api/run", method="POST", json=body):
+        assert api.run_rate_limit_cost() == cost
+
+
+@pytest.fixture
+def user_client(client, monkeypatch):
+    monkeypatch.setattr(
+        api, "token_cache", MagicMock(verify=lambda token: {"user_id": "user"})
+    )
+    return client
+
+
+def list_sessions(client, **body) -> dict:
+    response = client.post(
+        "/api/sessions", json=body, headers={"Authorization": "Bearer token"}
+    )
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+def add_sessions(store, count: int) -> None:
+    for i in range(count):
+        store.backend.put_user_agent(
+            "user",
+            f"agent-{i}",
+            {"ai_name": f"GPT {i}", "created": datetime.datetime(2023, 5, 1 + i)},
+        )
+
+
+def test_sessions_are_listed_page_by_page(user_client, store):
+    add_sessions(store, 3)
+
+    first = list_sessions(user_client, limit=2)
+    assert [s["agent_id"] for s in first["sessions"]] == ["agent-2", "agent-1"]
+
+    last = list_sessions(user_client, limit=2, cursor=first["cursor"])
+    assert [s["agent_id"] for s in last["sessions"]] == ["agent-0"]
+    assert last["cursor"] is None
+
+
+def test_saving_a_session_clears_the_cached_list(user_client, store):
+    assert list_sessions(user_client)["sessions"] == []
+
+    response = user_client.post(
+        "/api", json=step_request(), headers={"Authorization": "Bearer token"}
+    )
+    assert response.status_code == 200
+
+    assert [s["agent_id"] for s in list_sessions(user_client)["sessions"]] == ["agent"]
+
+
+def test_saving_a_session_clears_every_cached_page(user_client, store):
+    add_sessions(store, 3)
+    first = list_sessions(user_client, limit=2)
+    list_sessions(user_client, limit=2, cursor=first["cursor"])
+    assert len(api.session_list_cache) == 2
+
+    response = user_client.post(
+        "/api", json=step_request(), headers={"Authorization": "Bearer token"}
+    )
+    assert response.status_code == 200
+
+    assert len(api.session_list_cache) == 0
+    assert len(list_sessions(user_client, limit=2)["sessions"]) == 2
+
+
+@pytest.mark.parametrize("path", ["/api/sessions?limit=0", "/api/sessions?limit=-1"])
+def test_sessions_need_a_limit_of_at_least_one(user_client, path):
+    response = user_client.post(path, headers={"Authorization": "Bearer token"})
+
+    assert response.status_code == 400
+
+
+def test_session_tasks_need_a_limit_of_at_least_one(user_client, store):
+    user_client.post(
+        "/api", json=step_request(), headers={"Authorization": "Bearer token"}
+    )
+
+    response = user_client.get(
+        "/api/sessions/agent?limit=0", headers={"Authorization": "Bearer token"}
+    )
+
+    assert response.status_code == 400
+
+
+def test_a_speculative_command_that_raises_is_run_again(client, monkeypatch):
+    monkeypatch.setenv("SPECULATIVE_EXECUTION", "True")
+    ran = threading.Event()
+
+    def execute_command(**kwargs):
+        if not ran.is_set():
+            ran.set()
+            raise ConnectionError("No network")
+        return "Sunny"
+
+    with patch("autogpt.agent.agent.execute_command", side_effect=execute_command):
+        read_events(client.post("/api/stream", json=step_request()))
+        assert ran.wait(5)
+
+        response = client.post(
+            "/api",
+            json=step_request(command="google", arguments={"input": "weather"}),
+        )
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["result"] == "Command google returned: Sunny"
@@ -0,0 +1,45 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from autogpt.api_auth import VerifiedTokenCache
+
+
+@pytest.fixture
+def verify_id_token():
+    with patch("autogpt.api_auth.firebase_app"), patch(
+        "autogpt.api_auth.firebase_auth.verify_id_token"
+    ) as verify:
+        yield verify
+
+
+def test_verified_token_is_cached(verify_id_token):
+    verify_id_token.return_value = {"user_id": "u1", "exp": time.time() + 3600}
+    tokens = VerifiedTokenCache(max_size=10)
+
+    assert tokens.verify("token")["user_id"] == "u1"
+    assert tokens.verify("token")["user_id"] == "u1"
+    assert verify_id_token.call_count == 1
+
+
+def test_expired_claims_are_not_cached(verify_id_token):
+    verify_id_token.return_value = {"user_id": "u1", "exp": time.time() - 1}
+    tokens = VerifiedTokenCache(max_size=10)
+
+    tokens.verify("token")
+    tokens.verify("token")
+
+    assert verify_id_token.call_count == 2
+
+
+def test_invalid_token_is_not_cached(verify_id_token):
+    verify_id_token.side_effect = ValueError("bad token")
+    tokens = VerifiedTokenCache(max_size=10)
+
+    with pytest.raises(ValueError):
+        tokens.verify("token")
+    with pytest.raises(ValueError):
+        tokens.verify("token")
+
+    assert verify_id_token.call_count == 2
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+from autogpt.cache import LRUCache
+
+
+def test_get_returns_stored_value():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("missing", "default") == "default"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = LRUCache(max_size=2, ttl=10)
+    with patch("autogpt.cache.time.monotonic", return_value=100):
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=30)
+
+    with patch("autogpt.cache.time.monotonic", return_value=115):
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+
+
+def test_delete_and_clear():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.delete("a")
+    assert cache.get("a") is None
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_delete_where():
+    cache = LRUCache()
+    cache.set(("a", 1), 1)
+    cache.set(("a", 2), 2)
+    cache.set(("b", 1), 3)
+
+    cache.delete_where(lambda key: key[0] == "a")
+
+    assert cache.get(("a", 1)) is None
+    assert cache.get(("a", 2)) is None
+    assert cache.get(("b", 1)) == 3
@@ -0,0 +1,23 @@
+from unittest.mock import MagicMock, patch
+
+from autogpt.clients import get_client
+
+
+def test_client_is_created_once_per_process():
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = get_client("test-once", factory)
+
+    assert get_client("test-once", factory) is first
+    assert factory.call_count == 1
+
+
+def test_forked_process_creates_its_own_client():
+    factory = MagicMock(side_effect=lambda: object())
+    parent_client = get_client("test-fork", factory)
+
+    with patch("autogpt.clients.os.getpid", return_value=-1):
+        child_client = get_client("test-fork", factory)
+
+    assert child_client is not parent_client
+    assert factory.call_count == 2
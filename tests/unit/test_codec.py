@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from autogpt.storage.codec import MAGIC, RAW, ZLIB, decode_blob, encode_blob
+
+HISTORY = [
+    {"role": "system", "content": f"Command google returned: {i}"} for i in range(50)
+]
+
+
+def test_large_blobs_are_compressed():
+    blob = encode_blob(HISTORY)
+
+    assert blob[: len(MAGIC) + 1] == MAGIC + bytes([ZLIB])
+    assert len(blob) < len(json.dumps(HISTORY)) / 4
+    assert decode_blob(blob) == HISTORY
+
+
+def test_small_blobs_are_not_compressed():
+    blob = encode_blob({"query": "weather"})
+
+    assert blob[: len(MAGIC) + 1] == MAGIC + bytes([RAW])
+    assert decode_blob(blob) == {"query": "weather"}
+
+
+def test_integer_keys_become_strings_like_json():
+    agents = {0: ["task", [], "gpt-3.5-turbo"]}
+
+    assert decode_blob(encode_blob(agents)) == json.loads(json.dumps(agents))
+
+
+@pytest.mark.parametrize(
+    "stored, expected",
+    [
+        ('{"query": "weather"}', {"query": "weather"}),
+        ('"a reply"', "a reply"),
+        ({"query": "weather"}, {"query": "weather"}),
+    ],
+)
+def test_legacy_values_are_decoded(stored, expected):
+    assert decode_blob(stored) == expected
+
+
+def test_undecodable_blobs_return_default():
+    assert decode_blob(None, []) == []
+    assert decode_blob("not json", {}) == {}
+    assert decode_blob(MAGIC + bytes([ZLIB]) + b"garbage", {}) == {}
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+import pytest
+
+from autogpt.llm.context_window import ContextWindow
+from autogpt.memory_management.summary_memory import get_newly_trimmed_messages
+
+
+def message(content: str) -> dict:
+    return {"role": "user", "content": content}
+
+
+@pytest.fixture
+def history():
+    # the same message twice, so trimmed messages can't be told apart by equality
+    return [message(content) for content in ["a", "bb", "a", "dddd", "eeeee"]]
+
+
+@pytest.fixture
+def context_window(history):
+    with patch(
+        "autogpt.llm.context_window.count_each_message_tokens",
+        side_effect=lambda messages, model: [len(m["content"]) for m in messages],
+    ):
+        return ContextWindow(history, "gpt-3.5-turbo")
+
+
+# every message also counts the 3 tokens priming the reply, as
+# count_message_tokens([message]) does: 4, 5, 4, 7 and 8 tokens
+@pytest.mark.parametrize(
+    "token_limit, start",
+    [
+        (100, 0),
+        (28, 0),
+        (27, 1),
+        (24, 1),
+        (23, 2),
+        (19, 2),
+        (18, 3),
+        (15, 3),
+        (14, 4),
+        (8, 4),
+        (7, 5),
+        (0, 5),
+    ],
+)
+def test_fit_keeps_the_most_recent_messages_within_the_limit(
+    context_window, token_limit, start
+):
+    assert context_window.fit(token_limit) == start
+    assert context_window.tokens(start) <= token_limit
+
+
+def test_tokens_of_a_range(context_window):
+    assert context_window.tokens(0) == 28
+    assert context_window.tokens(1, 3) == 9
+    assert context_window.tokens(5) == 0
+
+
+def test_trimmed_messages_are_those_before_the_context(history):
+    trimmed, last_memory_index = get_newly_trimmed_messages(history, 4, 0)
+
+    assert trimmed == history[1:4]
+    assert last_memory_index == 3
+
+
+def test_trimmed_messages_are_summarized_once(history):
+    trimmed, last_memory_index = get_newly_trimmed_messages(history, 4, 3)
+
+    assert trimmed == []
+    assert last_memory_index == 3
+
+
+def test_long_trimmed_messages_are_skipped(history):
+    history[2] = message("x" * 4000)
+
+    trimmed, last_memory_index = get_newly_trimmed_messages(history, 3, 0)
+
+    assert trimmed == history[1:2]
+    assert last_memory_index == 2
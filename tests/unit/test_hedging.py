@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from autogpt.llm import ApiManager
+from autogpt.llm import api_manager as api_manager_module
+from autogpt.llm.hedging import LatencyTracker, hedge
+from autogpt.llm.rate_limiter import RequestScheduler
+from autogpt.metrics import LLM_HEDGE_COST, LLM_HEDGES
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def test_latency_percentiles_need_enough_samples():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for latency in range(1, 10):
+        tracker.observe("gpt-4", latency)
+
+    assert tracker.percentile("gpt-4", 90) is None
+    tracker.observe("gpt-4", 10)
+    assert tracker.percentile("gpt-4", 50) == 6
+    assert tracker.percentile("gpt-4", 90) == 10
+    assert tracker.percentile("gpt-3.5-turbo", 90) is None
+
+
+def completed(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_fast_calls_are_not_hedged():
+    send_backup = MagicMock()
+
+    winner, loser = hedge(lambda: completed("primary"), send_backup, delay=1)
+
+    assert winner.result() == "primary"
+    assert loser is None
+    send_backup.assert_not_called()
+
+
+def test_slow_calls_are_hedged_and_cancelled():
+    slow = Future()
+
+    winner, loser = hedge(lambda: slow, lambda: completed("backup"), delay=0.01)
+
+    assert winner.result() == "backup"
+    assert loser is slow
+    assert slow.cancelled()
+
+
+def test_the_first_error_is_raised_when_both_calls_fail():
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    def fail(error, after):
+        time.sleep(after)
+        raise error
+
+    winner, _ = hedge(
+        lambda: executor.submit(fail, TimeoutError("primary"), 0.05),
+        lambda: executor.submit(fail, ValueError("backup"), 0),
+        delay=0.01,
+    )
+
+    with pytest.raises(TimeoutError, match="primary"):
+        winner.result()
+
+
+@pytest.fixture
+def api_manager():
+    api_manager = ApiManager()
+    api_manager.reset()
+    api_manager.latency = LatencyTracker(min_samples=1)
+    api_manager.total_hedge_cost = 0.0
+    with patch.object(api_manager_module, "count_message_tokens", return_value=10):
+        yield api_manager
+
+
+def response(prompt_tokens: int, completion_tokens: int):
+    response = MagicMock()
+    response.usage.prompt_tokens = prompt_tokens
+    response.usage.completion_tokens = completion_tokens
+    return response
+
+
+def test_slow_completions_are_requested_from_the_fallback_model(api_manager):
+    cfg = MagicMock(
+        llm_hedging=True,
+        llm_hedge_percentile=95,
+        llm_hedge_min_delay=0.05,
+        llm_hedge_model="gpt-3.5-turbo",
+        use_azure=False,
+        openai_async_transport=False,
+        openai_api_key="key",
+        temperature=0,
+    )
+    api_manager.latency.observe("gpt-4", 0.01)
+    release = threading.Event()
+
+    def create(model, **kwargs):
+        if model == "gpt-4":
+            release.wait(5)
+            return response(1000, 1000)
+        return response(10, 5)
+
+    hedges = LLM_HEDGES.value(model="gpt-4", winner="backup")
+    with patch("openai.ChatCompletion.create", side_effect=create):
+        result = api_manager.create_chat_completion(MESSAGES, cfg, model="gpt-4")
+        assert result.usage.prompt_tokens == 10
+        assert api_manager.get_total_cost() == pytest.approx(0.00003)
+        assert LLM_HEDGES.value(model="gpt-4", winner="backup") == hedges + 1
+
+        # the primary call is still billed once it finishes
+        release.set()
+        for _ in range(100):
+            if api_manager.total_hedge_cost:
+                break
+            time.sleep(0.01)
+
+    assert api_manager.total_hedge_cost == pytest.approx(0.09)
+    assert api_manager.get_total_cost() == pytest.approx(0.09003)
+    assert LLM_HEDGE_COST.value(model="gpt-4") >= 0.09
+
+
+@pytest.fixture
+def scheduler(api_manager, monkeypatch):
+    # a full minute of tokens, so any left reserved makes the next call wait
+    scheduler = RequestScheduler(requests_per_minute=0, tokens_per_minute=600)
+    monkeypatch.setattr(api_manager, "scheduler", scheduler)
+    return scheduler
+
+
+@pytest.mark.parametrize("llm_hedging", [False, True])
+def test_a_failed_completion_gives_back_its_tokens(api_manager, scheduler, llm_hedging):
+    cfg = MagicMock(
+        llm_hedging=llm_hedging,
+        llm_hedge_percentile=95,
+        llm_hedge_min_delay=0.05,
+        llm_hedge_model=None,
+        openai_async_transport=False,
+        openai_api_key="key",
+    )
+
+    with patch("openai.ChatCompletion.create", side_effect=TimeoutError):
+        with pytest.raises(TimeoutError):
+            api_manager.create_chat_completion(MESSAGES, cfg, model="gpt-4")
+
+    assert scheduler.reserve("key", "gpt-4", 600) == pytest.approx(0, abs=0.1)
+
+
+def test_a_failed_stream_gives_back_its_tokens(api_manager, scheduler):
+    cfg = MagicMock(openai_async_transport=False, openai_api_key="key")
+
+    with patch("openai.ChatCompletion.create", side_effect=TimeoutError):
+        with pytest.raises(TimeoutError):
+            api_manager.create_chat_completion_stream(
+                MESSAGES, cfg, lambda token: None, model="gpt-4"
+            )
+
+    assert scheduler.reserve("key", "gpt-4", 600) == pytest.approx(0, abs=0.1)
@@ -0,0 +1,79 @@
+import pytest
+
+from autogpt.job_queue import JobWorkerPool, LocalJobQueue
+
+
+@pytest.fixture
+def job_queue(config):
+    return LocalJobQueue(config)
+
+
+def test_events_are_returned_from_cursor(job_queue):
+    job_id = job_queue.enqueue({"step": 1})
+    job_queue.publish(job_id, "started", {})
+    job_queue.publish(job_id, "thoughts", {"text": "hi"})
+
+    assert job_queue.events(job_id, 1, timeout=0) == [("thoughts", {"text": "hi"})]
+    assert job_queue.events(job_id, 2, timeout=0) == []
+
+
+def test_status_of_queued_job(job_queue):
+    job_id = job_queue.enqueue({"step": 1})
+
+    assert job_queue.status(job_id) == {"job_id": job_id, "status": "queued"}
+
+
+def test_worker_pool_publishes_result(job_queue):
+    def handler(payload, publish):
+        publish("thoughts", payload)
+        return {"result": payload["step"] + 1}
+
+    JobWorkerPool(job_queue, handler, num_workers=1).start()
+    job_id = job_queue.enqueue({"step": 1})
+
+    status = job_queue.status(job_id, timeout=5)
+
+    assert status == {"job_id": job_id, "status": "done", "result": {"result": 2}}
+    events = [event for event, _ in job_queue.events(job_id, 0, timeout=0)]
+    assert events == ["started", "thoughts", "done"]
+
+
+def test_worker_pool_publishes_errors(job_queue):
+    def handler(payload, publish):
+        raise ValueError("bad step")
+
+    JobWorkerPool(job_queue, handler, num_workers=1).start()
+    job_id = job_queue.enqueue({})
+
+    status = job_queue.status(job_id, timeout=5)
+
+    assert status["status"] == "error"
+    assert status["result"]["status"] == 500
+    assert "bad step" not in status["result"]["error"]
+    assert status["result"]["error"].startswith("There was an error. Error ID: ")
+
+
+def test_worker_pool_formats_errors_with_error_event(job_queue):
+    def handler(payload, publish):
+        raise ValueError("bad step")
+
+    def error_event(error, job_id):
+        return {"status": 400, "error": str(error), "job_id": job_id}
+
+    JobWorkerPool(job_queue, handler, num_workers=1, error_event=error_event).start()
+    job_id = job_queue.enqueue({})
+
+    status = job_queue.status(job_id, timeout=5)
+
+    assert status["result"] == {"status": 400, "error": "bad step", "job_id": job_id}
+
+
+def test_unknown_jobs_have_no_status(job_queue):
+    assert job_queue.job_info("unknown") is None
+    assert job_queue.status("unknown") is None
+
+
+def test_the_owner_of_a_job_is_recorded(job_queue):
+    job_id = job_queue.enqueue({"step": 1}, owner="user:1")
+
+    assert job_queue.job_info(job_id) == {"owner": "user:1"}
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+from autogpt.storage import LocalBlobStore, SessionConflict, SQLiteSessionBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"))
+
+
+@pytest.fixture
+def blob_store(tmp_path):
+    return LocalBlobStore(str(tmp_path / "blobs"))
+
+
+def user_agent(name, minutes):
+    return {
+        "ai_name": name,
+        "ai_role": "role",
+        "created": datetime.datetime(2023, 5, 1) + datetime.timedelta(minutes=minutes),
+    }
+
+
+def test_user_agents_are_listed_newest_first_in_pages(backend):
+    for i in range(5):
+        backend.put_user_agent("user", f"agent-{i}", user_agent(f"name {i}", i))
+    backend.put_user_agent("other user", "agent-x", user_agent("other", 10))
+
+    page, cursor = backend.list_user_agents("user", limit=2)
+    assert [agent_id for agent_id, _ in page] == ["agent-4", "agent-3"]
+
+    page, cursor = backend.list_user_agents("user", limit=2, cursor=cursor)
+    assert [agent_id for agent_id, _ in page] == ["agent-2", "agent-1"]
+
+    page, cursor = backend.list_user_agents("user", limit=2, cursor=cursor)
+    assert [agent_id for agent_id, _ in page] == ["agent-0"]
+    assert cursor is None
+
+
+def test_save_agent_writes_tasks_and_user_agent(backend):
+    backend.save_agent(
+        "agent",
+        {"task_count": 2},
+        {1: {"task_name": "a"}, 2: {"task_name": "b"}},
+        user_id="user",
+        user_agent=user_agent("name", 0),
+    )
+
+    assert backend.get_agent("agent") == {"task_count": 2}
+    assert backend.get_tasks("agent", [2]) == [{"task_name": "b"}]
+    assert backend.get_user_agent("user", "agent")["ai_name"] == "name"
+
+
+def test_save_agent_checks_the_expected_version(backend):
+    backend.save_agent("agent", {"version": 1}, {}, expected_version=0)
+    backend.save_agent("agent", {"version": 2}, {}, expected_version=1)
+
+    with pytest.raises(SessionConflict):
+        backend.save_agent(
+            "agent", {"version": 2}, {1: {"task_name": "a"}}, expected_version=1
+        )
+
+    assert backend.get_agent("agent") == {"version": 2}
+    assert backend.get_tasks("agent", [1]) == []
+
+
+def test_blob_store_round_trip(blob_store):
+    blob_store.write("public", "files/agent/notes.txt", "hello")
+    blob_store.write("public", "files/agent2/notes.txt", "other")
+
+    assert blob_store.read_text("public", "files/agent/notes.txt") == "hello"
+    assert blob_store.list_names("public", "files/agent/") == ["files/agent/notes.txt"]
+    assert blob_store.list_urls("public", "files/agent/")[0].startswith("file://")
+
+
+def test_blob_store_rejects_paths_outside_bucket(blob_store):
+    with pytest.raises(ValueError):
+        blob_store.write("public", "../private/secret.txt", "nope")
+
+
+def test_missing_blob_raises_file_not_found(blob_store):
+    with pytest.raises(FileNotFoundError):
+        blob_store.read_text("public", "missing.txt")
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+
+from autogpt.metrics import Counter, Histogram, render
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_stage_seconds", "Test.", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="auth")
+    histogram.observe(0.5, stage="auth")
+    histogram.observe(5.0, stage="auth")
+
+    output = render().decode()
+
+    assert 'test_stage_seconds_bucket{le="0.1",stage="auth"} 1.0' in output
+    assert 'test_stage_seconds_bucket{le="1.0",stage="auth"} 2.0' in output
+    assert 'test_stage_seconds_bucket{le="+Inf",stage="auth"} 3.0' in output
+    assert 'test_stage_seconds_count{stage="auth"} 3.0' in output
+    assert histogram.count(stage="auth") == 3
+
+
+def test_histogram_times_block_that_raises():
+    histogram = Histogram("test_block_seconds", "Test.", ["stage"])
+
+    try:
+        with histogram.time(stage="json_repair"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert histogram.count(stage="json_repair") == 1
+
+
+def test_counter_is_rendered():
+    counter = Counter("test_tokens_total", "Test tokens.", ["kind"])
+    counter.inc(10, kind="prompt")
+    counter.inc(5, kind="prompt")
+
+    assert counter.value(kind="prompt") == 15
+    output = render().decode()
+    assert "# TYPE test_tokens_total counter" in output
+    assert 'test_tokens_total{kind="prompt"} 15.0' in output
+
+
+WORKER = """
+from autogpt.metrics import Counter
+
+Counter("test_requests_total", "Test requests.", ["route"]).inc(route="/api")
+"""
+
+
+def test_samples_of_every_worker_are_summed(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    # every worker is a process of its own, as with gunicorn
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", WORKER], check=True)
+
+    output = render().decode()
+
+    assert 'test_requests_total{route="/api"} 2.0' in output
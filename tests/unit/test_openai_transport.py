@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from autogpt.llm.transport import OpenAITransport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.clients.add(self.client_address)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        if self.path.endswith("/embeddings"):
+            response = {
+                "object": "list",
+                "data": [{"index": 0, "embedding": [len(body["input"][0])]}],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1},
+            }
+            content_type = "application/json"
+            data = json.dumps(response)
+        elif body.get("stream"):
+            content_type = "text/event-stream"
+            data = "".join(
+                "data: "
+                + json.dumps({"choices": [{"index": 0, "delta": {"content": part}}]})
+                + "\n\n"
+                for part in ("Hello", " world")
+            )
+            data += "data: [DONE]\n\n"
+        else:
+            response = {
+                "choices": [{"index": 0, "message": {"content": "Hello world"}}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+            }
+            content_type = "application/json"
+            data = json.dumps(response)
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data.encode())
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = 0
+    server.clients = set()
+    server.delay = 0.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def transport():
+    transport = OpenAITransport(max_concurrency=2)
+    yield transport
+    transport.close()
+
+
+def request(server, **kwargs):
+    return dict(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": "Hi"}],
+        api_base=f"http://127.0.0.1:{server.server_port}/v1",
+        **kwargs,
+    )
+
+
+def test_chat_completion_reuses_connections_across_keys(server, transport):
+    for key in ("sk-one", "sk-two", "sk-one"):
+        response = transport.create_chat_completion(**request(server, api_key=key))
+        assert response.choices[0].message["content"] == "Hello world"
+
+    assert len(transport.sessions) == 1
+    assert len(server.clients) == 1
+
+
+def test_concurrency_is_bounded(server, transport):
+    server.delay = 0.1
+    with ThreadPoolExecutor(6) as pool:
+        responses = list(
+            pool.map(
+                lambda _: transport.create_chat_completion(
+                    **request(server, api_key="sk-key")
+                ),
+                range(6),
+            )
+        )
+
+    assert len(responses) == 6
+    assert server.max_in_flight == 2
+
+
+def test_stream_chat_completion(server, transport):
+    chunks = transport.stream_chat_completion(**request(server, api_key="sk-key"))
+
+    assert [chunk.choices[0].delta.get("content") for chunk in chunks] == [
+        "Hello",
+        " world",
+    ]
+
+
+def test_embeddings_keep_the_order_of_their_inputs(server, transport):
+    embeddings = transport.create_embeddings(
+        ["a", "bbb", "cc"],
+        model="text-embedding-ada-002",
+        api_key="sk-key",
+        api_base=f"http://127.0.0.1:{server.server_port}/v1",
+    )
+
+    assert [embedding["data"][0]["embedding"] for embedding in embeddings] == [
+        [1],
+        [3],
+        [2],
+    ]
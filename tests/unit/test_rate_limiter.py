@@ -0,0 +1,111 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from openai.error import RateLimitError
+
+from autogpt.llm import llm_utils, rate_limiter
+from autogpt.llm.rate_limiter import RequestScheduler, backoff, retry_after
+
+
+@pytest.fixture
+def clock():
+    clock = MagicMock(return_value=1000.0)
+    with patch.object(rate_limiter.time, "monotonic", clock):
+        yield clock
+
+
+def test_requests_within_budget_are_not_delayed(clock):
+    scheduler = RequestScheduler(requests_per_minute=60, tokens_per_minute=0)
+
+    assert [scheduler.reserve("key", "gpt-4", 100) for _ in range(60)] == [0.0] * 60
+    # then one request a second
+    assert scheduler.reserve("key", "gpt-4", 100) == pytest.approx(1.0)
+    assert scheduler.reserve("key", "gpt-4", 100) == pytest.approx(2.0)
+
+
+def test_tokens_budget_delays_large_requests(clock):
+    scheduler = RequestScheduler(requests_per_minute=0, tokens_per_minute=6000)
+
+    assert scheduler.reserve("key", "gpt-4", 5000) == 0.0
+    # 1000 tokens are left and 100 come back every second
+    assert scheduler.reserve("key", "gpt-4", 2000) == pytest.approx(10.0)
+
+    clock.return_value += 10
+    assert scheduler.reserve("key", "gpt-4", 100) == pytest.approx(1.0)
+
+
+def test_settle_gives_back_unused_tokens(clock):
+    scheduler = RequestScheduler(requests_per_minute=0, tokens_per_minute=6000)
+
+    scheduler.reserve("key", "gpt-4", 6000)
+    scheduler.settle("key", "gpt-4", estimated=6000, used=1000)
+
+    assert scheduler.reserve("key", "gpt-4", 5000) == 0.0
+
+
+def test_budgets_are_kept_per_key_and_model(clock):
+    scheduler = RequestScheduler(requests_per_minute=1, tokens_per_minute=0)
+
+    assert scheduler.reserve("key", "gpt-4", 1) == 0.0
+    assert scheduler.reserve("other key", "gpt-4", 1) == 0.0
+    assert scheduler.reserve("key", "gpt-3.5-turbo", 1) == 0.0
+    assert scheduler.reserve("key", "gpt-4", 1) > 0.0
+
+
+def test_pause_holds_back_a_key(clock):
+    scheduler = RequestScheduler(requests_per_minute=0, tokens_per_minute=0)
+
+    scheduler.pause("key", "gpt-4", 5.0)
+
+    assert scheduler.reserve("key", "gpt-4", 1) == pytest.approx(5.0)
+    assert scheduler.reserve("other key", "gpt-4", 1) == 0.0
+    clock.return_value += 5
+    assert scheduler.reserve("key", "gpt-4", 1) == 0.0
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff(3, base=1.0, cap=60.0) for _ in range(100)]
+
+    assert all(4.0 <= delay <= 8.0 for delay in delays)
+    assert len(set(delays)) > 1
+    assert backoff(20, cap=60.0) <= 60.0
+
+
+def test_retry_after_reads_the_header():
+    assert retry_after(RateLimitError("Error", headers={"retry-after": "7"})) == 7.0
+    assert retry_after(RateLimitError("Error")) is None
+
+
+@pytest.fixture
+def api_manager():
+    api_manager = MagicMock()
+    with patch.object(llm_utils, "ApiManager", return_value=api_manager):
+        yield api_manager
+
+
+def test_rate_limited_calls_pause_the_key_then_retry(api_manager):
+    cfg = MagicMock(openai_api_key="key", openai_max_retries=3)
+    response = MagicMock()
+    response.choices[0].message = {"content": "Hello"}
+    api_manager.create_chat_completion.side_effect = [
+        RateLimitError("Error", headers={"retry-after": "2"}),
+        response,
+    ]
+
+    result = llm_utils._request_chat_completion(
+        [], cfg, "gpt-4", 0, None, on_token=None
+    )
+
+    assert result == "Hello"
+    api_manager.scheduler.pause.assert_called_once_with("key", "gpt-4", 2.0)
+
+
+def test_rate_limit_is_raised_after_the_last_retry(api_manager):
+    cfg = MagicMock(openai_api_key="key", openai_max_retries=2)
+    api_manager.create_chat_completion.side_effect = RateLimitError("Error")
+
+    with pytest.raises(RateLimitError):
+        llm_utils._request_chat_completion([], cfg, "gpt-4", 0, None, on_token=None)
+
+    assert api_manager.create_chat_completion.call_count == 3
+    assert api_manager.scheduler.pause.call_count == 2
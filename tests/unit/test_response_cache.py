@@ -0,0 +1,102 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from autogpt.llm import llm_utils
+from autogpt.llm.response_cache import ResponseCache, cache_key
+from autogpt.metrics import LLM_CACHE_LOOKUPS
+
+MESSAGES = [{"role": "user", "content": "Name this task"}]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+
+def test_cache_key_covers_the_whole_request():
+    key = cache_key("gpt-3.5-turbo", MESSAGES, 0, None)
+
+    assert key == cache_key("gpt-3.5-turbo", list(MESSAGES), 0, None)
+    assert key != cache_key("gpt-4", MESSAGES, 0, None)
+    assert key != cache_key("gpt-3.5-turbo", MESSAGES, 0.2, None)
+    assert key != cache_key("gpt-3.5-turbo", MESSAGES, 0, 100)
+
+
+def test_lookups_are_counted_by_tier():
+    redis = FakeRedis()
+    cache = ResponseCache(redis=redis)
+    local_hits = LLM_CACHE_LOOKUPS.value(result="local")
+    redis_hits = LLM_CACHE_LOOKUPS.value(result="redis")
+    misses = LLM_CACHE_LOOKUPS.value(result="miss")
+
+    assert cache.get("key") is None
+    cache.set("key", "Find products")
+    assert cache.get("key") == "Find products"
+    # another worker only finds it in redis, then in its own memory
+    other = ResponseCache(redis=redis)
+    assert other.get("key") == "Find products"
+    assert other.get("key") == "Find products"
+
+    assert LLM_CACHE_LOOKUPS.value(result="local") == local_hits + 2
+    assert LLM_CACHE_LOOKUPS.value(result="redis") == redis_hits + 1
+    assert LLM_CACHE_LOOKUPS.value(result="miss") == misses + 1
+
+
+def test_redis_errors_fall_back_to_a_miss():
+    redis = MagicMock()
+    redis.get.side_effect = ConnectionError
+    redis.set.side_effect = ConnectionError
+    cache = ResponseCache(max_size=0, redis=redis)
+
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+
+@pytest.fixture
+def cfg():
+    return MagicMock(plugins=[], temperature=0)
+
+
+@pytest.fixture
+def request_completion():
+    with patch.object(llm_utils, "get_response_cache", return_value=ResponseCache()):
+        with patch.object(
+            llm_utils, "_request_chat_completion", return_value="Name the task"
+        ) as request_completion:
+            yield request_completion
+
+
+def test_cached_completions_are_only_requested_once(cfg, request_completion):
+    for _ in range(3):
+        assert (
+            llm_utils.create_chat_completion(MESSAGES, cfg, "gpt-3.5-turbo", cache=True)
+            == "Name the task"
+        )
+
+    assert request_completion.call_count == 1
+
+
+def test_completions_are_not_cached_by_default(cfg, request_completion):
+    llm_utils.create_chat_completion(MESSAGES, cfg, "gpt-3.5-turbo")
+    llm_utils.create_chat_completion(MESSAGES, cfg, "gpt-3.5-turbo")
+
+    assert request_completion.call_count == 2
+
+
+def test_cached_completions_are_streamed_whole(cfg, request_completion):
+    llm_utils.create_chat_completion(MESSAGES, cfg, "gpt-3.5-turbo", cache=True)
+    tokens = []
+
+    llm_utils.create_chat_completion(
+        MESSAGES, cfg, "gpt-3.5-turbo", on_token=tokens.append, cache=True
+    )
+
+    assert tokens == ["Name the task"]
+    assert request_completion.call_count == 1
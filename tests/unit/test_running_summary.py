@@ -0,0 +1,116 @@
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from autogpt.memory_management.running_summary import (
+    INITIAL_SUMMARY,
+    SUMMARY_PREFIX,
+    RunningSummaries,
+)
+from autogpt.memory_management.summary_memory import summary_events
+
+
+def make_history(steps: int) -> list:
+    history = []
+    for step in range(steps):
+        history += [
+            {"role": "user", "content": "Determine which next command to use"},
+            {
+                "role": "assistant",
+                "content": json.dumps({"thoughts": {}, "command": {"name": step}}),
+            },
+            {"role": "system", "content": f"Command {step} returned: done"},
+        ]
+    return history
+
+
+@pytest.fixture
+def cfg():
+    return MagicMock(summary_batch_size=4)
+
+
+@pytest.fixture
+def agent():
+    return MagicMock(
+        agent_id="agent", summary_memory=None, summary_cursor=0, history_offset=0
+    )
+
+
+@pytest.fixture
+def summarize():
+    with patch(
+        "autogpt.memory_management.summary_memory.update_running_summary",
+        side_effect=lambda agent, current_memory, new_events, cfg: (
+            f"{current_memory} Then {len(new_events)} events."
+        ),
+    ) as update_running_summary:
+        yield update_running_summary
+
+
+def test_summary_events():
+    history = make_history(1)
+
+    events = summary_events(history)
+
+    assert events == [
+        {"role": "you", "content": '{"command": {"name": 0}}'},
+        {"role": "your computer", "content": "Command 0 returned: done"},
+    ]
+    assert "thoughts" in history[1]["content"]
+
+
+def test_the_summary_isnt_updated_until_enough_events_are_trimmed(
+    cfg, agent, summarize
+):
+    summaries = RunningSummaries()
+    history = make_history(4)
+
+    # only one step, with two events, was trimmed
+    assert summaries.update(agent, history, 3, cfg) == (INITIAL_SUMMARY, 0)
+    assert summaries.get("agent").update is None
+    summarize.assert_not_called()
+
+
+def test_the_summary_is_updated_in_the_background(cfg, agent, summarize):
+    summaries = RunningSummaries()
+    history = make_history(4)
+    agent.history_offset = 20
+
+    assert summaries.update(agent, history, 9, cfg) == (INITIAL_SUMMARY, 0)
+    summaries.get("agent").update.result()
+
+    # the next step uses the summary of the messages before its own context,
+    # which is saved with a cursor counted from the first message ever added
+    assert summaries.update(agent, history, 9, cfg) == (
+        f"{INITIAL_SUMMARY} Then 6 events.",
+        29,
+    )
+    summarize.assert_called_once()
+
+
+def test_one_update_runs_at_a_time(cfg, agent, summarize):
+    summaries = RunningSummaries()
+    history = make_history(6)
+    summarized = threading.Event()
+    summarize.side_effect = lambda *args, **kwargs: summarized.wait(5) and "Summary"
+
+    summaries.update(agent, history, 9, cfg)
+    summaries.update(agent, history, 15, cfg)
+    summarized.set()
+    summaries.get("agent").update.result()
+
+    assert summarize.call_count == 1
+    assert summaries.get("agent").snapshot() == ("Summary", 9)
+
+
+def test_the_saved_summary_is_used_unless_this_one_covers_more(agent, cfg):
+    summaries = RunningSummaries()
+    summary = summaries.get("agent")
+
+    summary.merge(f"{SUMMARY_PREFIX}I searched the web.", 6)
+    assert summary.snapshot() == ("I searched the web.", 6)
+
+    summary.merge("I was created.", 3)
+    assert summary.snapshot() == ("I searched the web.", 6)
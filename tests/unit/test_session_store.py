@@ -0,0 +1,231 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from autogpt.llm.usage import UsageLedger
+from autogpt.storage import Session, SessionConflict, SessionStore, SQLiteSessionBackend
+
+
+def make_messages(count, start=0):
+    return [{"role": "system", "content": str(i)} for i in range(start, start + count)]
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"))
+
+
+@pytest.fixture
+def store(config, backend):
+    return SessionStore(config, backend=MagicMock(wraps=backend))
+
+
+def test_trim_history_tracks_offset():
+    session = Session(agent_id="agent", full_message_history=make_messages(5))
+
+    session.trim_history(3)
+
+    assert session.full_message_history == make_messages(3, start=2)
+    assert session.history_offset == 2
+    assert session.history_version == 5
+
+
+def test_history_since_returns_only_new_messages():
+    session = Session(
+        agent_id="agent",
+        full_message_history=make_messages(4, start=10),
+        history_offset=10,
+    )
+
+    cursor, messages = session.history_since(12)
+
+    assert cursor == 12
+    assert messages == make_messages(2, start=12)
+
+
+@pytest.mark.parametrize("cursor", [5, 20])
+def test_history_since_unknown_cursor_returns_whole_history(cursor):
+    session = Session(
+        agent_id="agent",
+        full_message_history=make_messages(4, start=10),
+        history_offset=10,
+    )
+
+    start, messages = session.history_since(cursor)
+
+    assert start == 10
+    assert messages == session.full_message_history
+
+
+def test_load_reads_the_stored_agent(store, backend):
+    backend.save_agent(
+        "agent",
+        {
+            "agents": '{"0": ["task", [], "gpt-3.5-turbo"]}',
+            "full_message_history": '[{"role": "user", "content": "hi"}]',
+            "history_offset": 3,
+            "summary": "I was created.",
+            "version": 7,
+        },
+        {},
+    )
+
+    session = store.load("agent")
+
+    assert session.agents == {"0": ["task", [], "gpt-3.5-turbo"]}
+    assert session.full_message_history == [{"role": "user", "content": "hi"}]
+    assert session.history_version == 4
+    assert session.summary == "I was created."
+    assert session.version == 7
+
+
+def test_load_uses_cache_only_for_matching_version(store, backend):
+    backend.save_agent("agent", {"version": 2}, {})
+    store.load("agent")
+
+    store.load("agent", version=2)
+    assert store.backend.get_agent.call_count == 1
+
+    store.load("agent", version=1)
+    assert store.backend.get_agent.call_count == 2
+
+
+def test_record_step_fills_in_last_result():
+    session = Session(agent_id="agent")
+
+    SessionStore.record_step(session, "started", "google", {"q": "a"}, "Search a")
+    SessionStore.record_step(session, "found a", "task_complete", {}, "Finish")
+
+    assert session.task_count == 2
+    assert [task["task_name"] for task in session.pending_tasks.values()] == [
+        "Search a",
+        "Finish",
+    ]
+    assert session.pending_tasks[1]["result"] == "found a"
+    assert session.last_task["result"] is None
+
+
+def test_record_step_after_save_only_writes_two_tasks():
+    session = Session(
+        agent_id="agent", task_count=40, last_task={"task_name": "Search a"}
+    )
+
+    SessionStore.record_step(session, "found a", "task_complete", {}, "Finish")
+
+    assert list(session.pending_tasks) == [40, 41]
+    assert session.pending_tasks[40]["result"] == "found a"
+
+
+def test_load_migrates_legacy_task_array(store, backend):
+    backend.save_agent(
+        "agent", {"tasks": [{"task_name": "Search a"}, {"task_name": "Finish"}]}, {}
+    )
+
+    session = store.load("agent")
+
+    assert session.task_count == 2
+    assert session.last_task == {"task_name": "Finish"}
+    assert list(session.pending_tasks) == [1, 2]
+
+
+def make_agent(session):
+    agent = MagicMock(
+        summary_memory=None, full_message_history=session.full_message_history
+    )
+    agent.agent_manager.agents = {0: ["task", [], "gpt-3.5-turbo"]}
+    agent.ai_name = "name"
+    agent.ai_role = "role"
+    agent.ai_goals = ["goal"]
+    agent.agent_id = session.agent_id
+    agent.command_name = "google"
+    agent.arguments = {"query": "weather"}
+    agent.assistant_reply = "reply"
+    agent.usage = UsageLedger()
+    agent.summary_cursor = 0
+    return agent
+
+
+def test_save_encodes_blobs_that_load_decodes(store, backend):
+    session = Session(agent_id="agent", full_message_history=make_messages(20))
+
+    store.save(session, make_agent(session), thoughts={"text": "hi"})
+    assert isinstance(backend.get_agent("agent")["full_message_history"], bytes)
+
+    loaded = store.load("agent")
+
+    assert loaded.full_message_history == make_messages(20)
+    assert loaded.agents == {"0": ["task", [], "gpt-3.5-turbo"]}
+
+
+def test_usage_is_saved_with_the_session(store):
+    session = Session(agent_id="agent")
+    agent = make_agent(session)
+    agent.usage.add(100, 20, 0.5)
+
+    store.save(session, agent, thoughts={})
+
+    assert store.load("agent").usage == {
+        "prompt_tokens": 100,
+        "completion_tokens": 20,
+        "cost": 0.5,
+    }
+
+
+def test_summary_is_saved_with_its_cursor(store):
+    session = Session(agent_id="agent")
+    agent = make_agent(session)
+    agent.summary_memory = "I searched the web."
+    agent.summary_cursor = 120
+
+    store.save(session, agent, thoughts={})
+
+    loaded = store.load("agent")
+    assert loaded.summary == "I searched the web."
+    assert loaded.summary_cursor == 120
+
+
+def test_second_save_from_the_same_version_conflicts(store, backend):
+    first = Session(agent_id="agent")
+    SessionStore.record_step(first, None, "google", {}, "Search a")
+    second = Session(agent_id="agent")
+    SessionStore.record_step(second, None, "browse_website", {}, "Browse b")
+
+    assert store.save(first, make_agent(first), thoughts={}) == 1
+    with pytest.raises(SessionConflict):
+        store.save(second, make_agent(second), thoughts={})
+
+    assert backend.get_agent("agent")["version"] == 1
+    assert backend.get_tasks("agent", [1])[0]["task_name"] == "Search a"
+    # the next step of the second client reads what the first one saved
+    assert store.load("agent", version=1).last_task["task_name"] == "Search a"
+
+
+def test_load_tasks_pages_back_from_most_recent(store):
+    session = Session(agent_id="agent")
+    for i in range(10):
+        SessionStore.record_step(session, f"result {i}", "google", {}, f"Task {i}")
+    store.save(session, make_agent(session), thoughts={}, user_id="user")
+    entity = store.backend.get_agent("agent")
+
+    tasks, cursor = store.load_tasks("agent", entity, limit=3)
+
+    assert [task["task_name"] for task in tasks] == ["Task 7", "Task 8", "Task 9"]
+    assert cursor == 8
+
+    tasks, cursor = store.load_tasks("agent", entity, limit=9, cursor=8)
+    assert [task["task_name"] for task in tasks][0] == "Task 0"
+    assert cursor is None
+
+
+def test_load_tasks_needs_a_limit_of_at_least_one(store):
+    with pytest.raises(ValueError):
+        store.load_tasks("agent", {"task_count": 3}, limit=0)
+
+
+def test_load_tasks_of_legacy_session(store):
+    entity = {"tasks": [{"task_name": str(i)} for i in range(5)]}
+
+    tasks, cursor = store.load_tasks("agent", entity, limit=2)
+
+    assert tasks == [{"task_name": "3"}, {"task_name": "4"}]
+    assert cursor == 4
@@ -0,0 +1,98 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from autogpt.llm import llm_utils
+from autogpt.llm.single_flight import SingleFlight
+from autogpt.metrics import LLM_DEDUPLICATED
+
+CALLERS = 5
+
+
+def joined_by_others(name: str, fn: MagicMock) -> MagicMock:
+    """Makes fn return only once the other callers wait for its call"""
+    deduplicated = LLM_DEDUPLICATED.value(call=name) + CALLERS - 1
+    result = fn.side_effect
+
+    def wait_for_others(*args, **kwargs):
+        deadline = time.monotonic() + 5
+        while LLM_DEDUPLICATED.value(call=name) < deduplicated:
+            assert time.monotonic() < deadline, "the other callers didn't join"
+            time.sleep(0.001)
+        if isinstance(result, BaseException):
+            raise result
+        return fn.return_value
+
+    fn.side_effect = wait_for_others
+    return fn
+
+
+def call_concurrently(call) -> list:
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        futures = [executor.submit(call) for _ in range(CALLERS)]
+        return [future.exception() or future.result() for future in futures]
+
+
+def test_identical_calls_share_one_call():
+    flights = SingleFlight("test_share")
+    fn = joined_by_others("test_share", MagicMock(return_value="Hello"))
+
+    results = call_concurrently(lambda: flights.do("key", fn))
+
+    assert results == ["Hello"] * CALLERS
+    assert fn.call_count == 1
+    assert LLM_DEDUPLICATED.value(call="test_share") == CALLERS - 1
+
+
+def test_errors_are_shared_too():
+    flights = SingleFlight("test_errors")
+    error = ValueError("Bad gateway")
+    fn = joined_by_others("test_errors", MagicMock(side_effect=error))
+
+    results = call_concurrently(lambda: flights.do("key", fn))
+
+    assert results == [error] * CALLERS
+
+
+def test_calls_are_made_again_once_done():
+    flights = SingleFlight("test_again")
+    fn = MagicMock(return_value="Hello")
+
+    flights.do("key", fn)
+    flights.do("key", fn)
+    flights.do("other key", fn)
+
+    assert fn.call_count == 3
+
+
+@pytest.fixture
+def cfg():
+    return MagicMock(plugins=[], temperature=0, openai_api_key="key")
+
+
+def test_identical_completions_are_requested_once(cfg):
+    messages = [{"role": "user", "content": "Summarize the page"}]
+    request_completion = joined_by_others(
+        "chat_completion", MagicMock(return_value="A page")
+    )
+
+    with patch.object(llm_utils, "_request_chat_completion", request_completion):
+        results = call_concurrently(
+            lambda: llm_utils.create_chat_completion(messages, cfg, "gpt-4")
+        )
+
+    assert results == ["A page"] * CALLERS
+    assert request_completion.call_count == 1
+
+
+def test_identical_embeddings_are_created_once(cfg):
+    cfg.use_azure = False
+    create_embedding = joined_by_others("embedding", MagicMock(return_value=[0.1]))
+
+    with patch.object(llm_utils, "create_embedding", create_embedding):
+        results = call_concurrently(lambda: llm_utils.get_ada_embedding("A", cfg))
+
+    assert results == [[0.1]] * CALLERS
+    assert create_embedding.call_count == 1
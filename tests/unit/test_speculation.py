@@ -0,0 +1,60 @@
+from autogpt.metrics import SPECULATIVE_COMMANDS
+from autogpt.speculation import SpeculativeCommands
+
+
+def test_started_commands_are_taken_once():
+    speculative = SpeculativeCommands(max_workers=1)
+    calls = []
+
+    def google(query):
+        calls.append(query)
+        return f"Results for {query}"
+
+    speculative.start("agent", "google", {"query": "pizza"}, google, "pizza")
+    speculative.start("agent", "google", {"query": "pizza"}, google, "pizza")
+    future = speculative.take("agent", "google", {"query": "pizza"})
+
+    assert future.result() == "Results for pizza"
+    assert calls == ["pizza"]
+    assert speculative.take("agent", "google", {"query": "pizza"}) is None
+
+
+def test_commands_are_kept_by_agent_and_arguments():
+    speculative = SpeculativeCommands(max_workers=1)
+    hits = SPECULATIVE_COMMANDS.value(result="hit")
+    misses = SPECULATIVE_COMMANDS.value(result="miss")
+
+    speculative.start("agent", "google", {"query": "pizza", "num_results": 8}, str)
+
+    assert speculative.take("other agent", "google", {"query": "pizza"}) is None
+    assert speculative.take("agent", "google", {"query": "pasta"}) is None
+    assert speculative.take("agent", "google", {"num_results": 8, "query": "pizza"})
+    assert SPECULATIVE_COMMANDS.value(result="hit") == hits + 1
+    assert SPECULATIVE_COMMANDS.value(result="miss") == misses + 2
+
+
+def test_expired_results_are_not_taken():
+    speculative = SpeculativeCommands(max_workers=1, ttl=0)
+
+    speculative.start("agent", "google", {"query": "pizza"}, str)
+
+    assert speculative.take("agent", "google", {"query": "pizza"}) is None
+
+
+def test_the_command_is_passed_on_to_fn():
+    speculative = SpeculativeCommands(max_workers=1)
+
+    def execute_command(command_name, arguments):
+        return f"{command_name} {arguments['query']}"
+
+    speculative.start(
+        "agent",
+        "google",
+        {"query": "pizza"},
+        execute_command,
+        command_name="google",
+        arguments={"query": "pizza"},
+    )
+
+    future = speculative.take("agent", "google", {"query": "pizza"})
+    assert future.result() == "google pizza"
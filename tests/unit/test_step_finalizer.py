@@ -0,0 +1,81 @@
+import threading
+import time
+
+from autogpt.step_finalizer import StepFinalizer
+
+
+def test_side_effects_run_concurrently():
+    finalizer = StepFinalizer(max_workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+
+    first = finalizer.submit("first", 5, barrier.wait)
+    second = finalizer.submit("second", 5, barrier.wait)
+    results = finalizer.wait_all([first, second])
+
+    assert results["first"].ok
+    assert results["second"].ok
+
+
+def test_failed_side_effect_is_reported():
+    finalizer = StepFinalizer(max_workers=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    results = finalizer.wait_all([finalizer.submit("failing", 5, fail)])
+
+    assert not results["failing"].ok
+    assert isinstance(results["failing"].error, ValueError)
+    assert not results["failing"].timed_out
+
+
+def test_side_effect_past_its_deadline_times_out():
+    finalizer = StepFinalizer(max_workers=1)
+    release = threading.Event()
+
+    side_effect = finalizer.submit("slow", 0.01, release.wait, 5)
+    result = side_effect.wait()
+    release.set()
+
+    assert not result.ok
+    assert result.timed_out
+    assert result.pending
+    assert result.value is None
+
+
+def test_deadline_counts_from_when_the_side_effect_starts():
+    finalizer = StepFinalizer(max_workers=1)
+    release = threading.Event()
+
+    finalizer.submit("busy", 5, release.wait, 5)
+    # it finishes 0.4s after being submitted, but 0.2s after starting
+    side_effect = finalizer.submit("queued", 0.3, lambda: time.sleep(0.2) or "done")
+    threading.Timer(0.2, release.set).start()
+
+    assert side_effect.wait().value == "done"
+
+
+def test_side_effect_that_never_starts_is_cancelled():
+    finalizer = StepFinalizer(max_workers=1)
+    release = threading.Event()
+    calls = []
+
+    finalizer.submit("busy", 5, release.wait, 5)
+    side_effect = finalizer.submit("queued", 0.01, calls.append, "called")
+    result = side_effect.wait()
+    release.set()
+    finalizer.executor.shutdown(wait=True)
+
+    assert result.timed_out
+    assert not result.pending
+    assert side_effect.future.cancelled()
+    assert calls == []
+
+
+def test_wait_returns_the_value():
+    finalizer = StepFinalizer(max_workers=1)
+
+    side_effect = finalizer.submit("add", 5, lambda a, b: a + b, 1, b=2)
+
+    assert side_effect.wait().value == 3
+    assert side_effect.wait() is side_effect.wait()
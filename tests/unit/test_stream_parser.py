@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from autogpt.json_utils.stream_parser import CommandStreamParser
+
+REPLY = {
+    "command": {"name": "google", "args": {"query": 'the "best" {pizza}'}},
+    "thoughts": {
+        "text": "I should search for pizza",
+        "reasoning": "The command: {\"name\": \"none\"} isn't it",
+        "plan": "- search\n- eat",
+    },
+}
+
+
+def stream(parser: CommandStreamParser, reply: str, chunk_size: int = 3) -> int:
+    """Feeds reply in chunks, returning how many were fed when the command came"""
+    for i in range(0, len(reply), chunk_size):
+        parser.feed(reply[i : i + chunk_size])
+        if parser.command is not None:
+            return i // chunk_size + 1
+    return -1
+
+
+def test_command_is_emitted_once_its_object_closes():
+    reply = json.dumps(REPLY)
+    commands = []
+    parser = CommandStreamParser(lambda *command: commands.append(command))
+
+    chunks = stream(parser, reply)
+    parser.feed("more")
+
+    assert commands == [("google", {"query": 'the "best" {pizza}'})]
+    assert chunks * 3 < reply.index('"thoughts"') + 3
+
+
+def test_command_after_the_thoughts_is_found():
+    reply = "Here you go:\n" + json.dumps(
+        {"thoughts": REPLY["thoughts"], "command": REPLY["command"]}, indent=4
+    )
+    parser = CommandStreamParser()
+
+    stream(parser, reply, chunk_size=1)
+
+    assert parser.command == ("google", {"query": 'the "best" {pizza}'})
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        '{"thoughts": {"command": {"name": "google", "args": {}}}}',
+        '{"command": "google"}',
+        '{"command": {"args": {}}}',
+        '{"command": {"name": "google", "args": "pizza"}}',
+        '{"command": {"name": "google", "args": {"query": pizza}}}',
+    ],
+)
+def test_invalid_commands_are_ignored(reply):
+    commands = []
+    parser = CommandStreamParser(lambda *command: commands.append(command))
+
+    stream(parser, reply)
+
+    assert parser.command is None
+    assert commands == []
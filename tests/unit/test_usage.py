@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from autogpt.llm import COSTS, ApiManager
+from autogpt.llm.chat import chat_with_ai
+from autogpt.llm.usage import UsageLedger, UsageLedgers
+
+
+def test_ledgers_add_up_concurrent_calls():
+    ledger = UsageLedger()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(1000):
+            executor.submit(ledger.add, 10, 5, 0.001)
+
+    assert ledger.snapshot() == {
+        "prompt_tokens": 10000,
+        "completion_tokens": 5000,
+        "cost": pytest.approx(1.0),
+    }
+
+
+def test_saved_usage_is_merged_by_its_largest_counts():
+    ledger = UsageLedger()
+    ledger.add(100, 10, 0.2)
+
+    ledger.merge({"prompt_tokens": 50, "completion_tokens": 40, "cost": 0.5})
+    ledger.merge(None)
+
+    assert ledger.snapshot() == {
+        "prompt_tokens": 100,
+        "completion_tokens": 40,
+        "cost": 0.5,
+    }
+
+
+def test_remaining_budget():
+    ledger = UsageLedger()
+    ledger.add(0, 0, 0.3)
+
+    assert ledger.remaining_budget() is None
+    ledger.budget = 1.0
+    assert ledger.remaining_budget() == pytest.approx(0.7)
+    ledger.add(0, 0, 1.0)
+    assert ledger.remaining_budget() == 0.0
+
+
+def test_sessions_have_their_own_ledgers():
+    ledgers = UsageLedgers()
+
+    assert ledgers.get("agent") is ledgers.get("agent")
+    assert ledgers.get("agent") is not ledgers.get("other agent")
+
+
+def test_costs_are_added_to_the_session_they_were_made_for():
+    api_manager = ApiManager()
+    api_manager.ledgers = UsageLedgers()
+    total_cost = api_manager.get_total_cost()
+
+    with patch.dict(COSTS, {"gpt-4": {"prompt": 0.03, "completion": 0.06}}):
+        api_manager.update_cost(1000, 1000, "gpt-4", agent_id="agent")
+        api_manager.update_cost(1000, 0, "gpt-4")
+
+    assert api_manager.usage("agent").cost == pytest.approx(0.09)
+    assert api_manager.usage("other agent").cost == 0.0
+    assert api_manager.get_total_cost() == pytest.approx(total_cost + 0.12)
+
+
+def test_chat_with_ai_tells_the_agent_its_own_remaining_budget():
+    agent = MagicMock(
+        system_prompt_tokens=None,
+        summary_memory=None,
+        summary_cursor=0,
+        history_offset=0,
+    )
+    agent.usage = UsageLedger(budget=1.0)
+    agent.usage.add(0, 0, 0.995)
+    ApiManager().update_cost(0, 0, "gpt-3.5-turbo")
+    cfg = MagicMock(plugins=[], fast_llm_model="gpt-3.5-turbo")
+
+    with patch("autogpt.llm.chat.count_message_tokens", return_value=10), patch(
+        "autogpt.llm.chat.create_chat_completion", return_value="reply"
+    ) as create_chat_completion, patch(
+        "autogpt.llm.chat.count_string_tokens", return_value=1
+    ), patch(
+        "autogpt.llm.context_window.count_each_message_tokens", return_value=[]
+    ):
+        chat_with_ai(agent, "prompt", "next", [], MagicMock(), 4000, cfg)
+
+    messages = create_chat_completion.call_args.kwargs["messages"]
+    assert "Your remaining API budget is $0.005" in messages[-2]["content"]